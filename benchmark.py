@@ -0,0 +1,312 @@
+#!/usr/bin/python
+helpstr = '''
+This program measures the performance of stepfg on synthetic 2D geometry
+and compares the results against a stored baseline.
+
+benchmark [results_out] [options] [-h] [/h]
+    results_out    Output JSON file with the benchmark results
+                   (default: "benchmark.json")
+    -h or /h       This information
+
+Options:
+    --suite NAME       Case suite: "quick" (up to 10^4 vertices per part)
+                       or "full" (up to 10^6 vertices per part)
+                       (default: quick)
+    --case NAME        Run only the named case; may be repeated
+    --repeat N         Run each case N times and keep the fastest time of
+                       every phase (default: 1)
+    --format EXT       Input file format used for the parse phase: txt,
+                       json, csv or npz (default: json)
+    --baseline FILE    Compare the results with a stored results file,
+                       which must have been run with the same options
+    --threshold X      Relative slowdown of a phase that counts as a
+                       regression (default: 0.25)
+    --min-time T       Phases faster than T s in the baseline are not
+                       compared (default: 0.05)
+    --numpy            Use the NumPy backend of stepfg
+    --no-shared-edges  Emit a separate EDGE_CURVE for every face boundary
+    --instances        Place congruent polygons as copies of one solid
+    --tessellate       Write tessellated solids instead of exact B-reps
+    --union            Merge touching polygons into single solids
+
+Every case runs in a fresh worker process and records the wall time of the
+parse, validate, generate and write phases, the peak resident set size, the
+number of STEP entities and the size of the STEP file. The exit status is 1
+if a phase is slower than the baseline by more than the threshold or if an
+entity count differs from the baseline.
+'''
+
+__author__ = "E. Valetov and M. Berz"
+__version__ = "1.0.1"
+__maintainer__ = "E. Valetov"
+__email__ = "valetove@msu.edu"
+__status__ = "Production"
+
+import math
+import sys
+import time
+import json
+import argparse
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import stepfg
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PHASES = ['parse', 'validate', 'generate', 'write']
+
+
+def regular_polygon(n, radius=100.0, center=(0.0, 0.0), phase=0.0):
+    return [[center[0] + radius * math.cos(phase + 2 * math.pi * k / n),
+             center[1] + radius * math.sin(phase + 2 * math.pi * k / n)] for
+            k in range(n)]
+
+
+def ngon_geometry(n):
+    return [regular_polygon(n)], [0, 10], 1
+
+
+def assembly_geometry(count, n):
+    columns = math.ceil(math.sqrt(count))
+    return [regular_polygon(n, 4.0, (10.0 * (k % columns),
+                                     10.0 * (k // columns))) for
+            k in range(count)], [0, 10], 1
+
+
+def near_collinear_geometry(n, amplitude=1e-4):
+    top_list = [[200.0 * k / n, 10.0 + amplitude * math.sin(0.7 * k)] for k
+                in range(n + 1)]
+    return [top_list + [[200.0, 0.0], [0.0, 0.0]]], [0, 10], 1
+
+
+def magnet_geometry(poles, n, aperture=20.0, yoke_radius=60.0):
+    # hyperbolic pole tip y^2 - x^2 = aperture^2 closed by an arc of the
+    # yoke, repeated around the axis
+    tip_list = [[aperture * math.sinh(t), aperture * math.cosh(t)] for t in
+                [-0.6 + 1.2 * j / (n - 1) for j in range(n)]]
+    yoke_list = [[yoke_radius * math.cos(a), yoke_radius * math.sin(a)] for
+                 a in [math.pi / 2 - 0.35 + 0.7 * j / (n - 1) for j in
+                       range(n)]]
+    pole_list = []
+    for k in range(poles):
+        angle = 2 * math.pi * k / poles
+        pole_list.append([[x * math.cos(angle) - y * math.sin(angle),
+                           x * math.sin(angle) + y * math.cos(angle)] for
+                          x, y in tip_list + yoke_list])
+    return pole_list, [0, 500], 1
+
+
+SUITES = {
+    'quick': [('ngon_10', ngon_geometry, (10,)),
+              ('ngon_100', ngon_geometry, (100,)),
+              ('ngon_1000', ngon_geometry, (1000,)),
+              ('ngon_10000', ngon_geometry, (10000,)),
+              ('assembly_100x50', assembly_geometry, (100, 50)),
+              ('assembly_1000x10', assembly_geometry, (1000, 10)),
+              ('near_collinear_2000', near_collinear_geometry, (2000,)),
+              ('magnet_4x250', magnet_geometry, (4, 250)),
+              ('magnet_8x250', magnet_geometry, (8, 250))]}
+SUITES['full'] = SUITES['quick'] + [
+    ('ngon_100000', ngon_geometry, (100000,)),
+    ('ngon_1000000', ngon_geometry, (1000000,)),
+    ('assembly_10000x10', assembly_geometry, (10000, 10)),
+    ('near_collinear_100000', near_collinear_geometry, (100000,)),
+    ('magnet_12x10000', magnet_geometry, (12, 10000))]
+
+
+def write_geometry(file_name, list_vert_list, geom_depth_list, p_coeff):
+    suffix = Path(file_name).suffix
+    if suffix == '.npz':
+        stepfg.write_geometry_npz(file_name, list_vert_list, geom_depth_list,
+                                  p_coeff)
+        return
+    with open(file_name, 'w') as file_out:
+        if suffix == '.csv':
+            file_out.write('z_interval,' + ','.join(
+                repr(x) for x in geom_depth_list) + '\ncoeff,' + repr(
+                p_coeff) + '\n')
+            for part_element in list_vert_list:
+                file_out.write('\n' + ''.join(
+                    ','.join(repr(x) for x in vertex_element) + '\n' for
+                    vertex_element in part_element))
+        elif suffix == '.json':
+            json.dump([list_vert_list, geom_depth_list, p_coeff], file_out)
+        else:
+            file_out.write(repr([list_vert_list, geom_depth_list, p_coeff]))
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(generator, parameters, file_format, **options):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_in_name = str(Path(temp_dir) / ('geometry.' + file_format))
+        file_out_name = str(Path(temp_dir) / 'part_out.stp')
+        write_geometry(file_in_name, *generator(*parameters))
+        phases = {}
+
+        start_time = time.perf_counter()
+        in_array, in_depth, in_coeff = stepfg.read_geometry(file_in_name)
+        phases['parse'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        stepfg.check_assembly_input(in_array, in_depth, in_coeff)
+        phases['validate'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        step_writer = stepfg.StepWriter(file_out_name, **options)
+        step_writer.generate_assembly(in_array, in_depth, in_coeff)
+        phases['generate'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        with open(file_out_name, 'w+', 1 << 20) as file_out:
+            step_writer.write(file_out)
+        phases['write'] = time.perf_counter() - start_time
+
+        return {'phases': phases,
+                'peak_rss': peak_rss(),
+                'entities': len(step_writer.entity_table),
+                'dedup_hits': step_writer.entity_table.hits,
+                'vertices': sum(len(x) for x in in_array),
+                'polygons': len(in_array),
+                'bytes': Path(file_out_name).stat().st_size}
+
+
+def run_suite(case_list, repeat=1, file_format='json', **options):
+    results = {}
+    for name, generator, parameters in case_list:
+        print(name + "... ", end="", flush=True)
+        best = None
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1) as executor:
+                result = executor.submit(run_case, generator, parameters,
+                                         file_format, **options).result()
+            if best is None:
+                best = result
+            else:
+                best['phases'] = {k: min(best['phases'][k],
+                                         result['phases'][k]) for
+                                  k in PHASES}
+                best['peak_rss'] = result['peak_rss'] if best[
+                    'peak_rss'] is None else min(best['peak_rss'],
+                                                 result['peak_rss'])
+        results[name] = best
+        print(' '.join(k + '=' + format(best['phases'][k], '.3f') + 's' for
+                       k in PHASES) + ' entities=' + str(best['entities']))
+    return results
+
+
+def compare_results(results, baseline, threshold=0.25, min_time=0.05):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        for phase in PHASES:
+            reference_time = reference['phases'][phase]
+            if reference_time < min_time:
+                continue
+            ratio = result['phases'][phase] / reference_time
+            if ratio > 1 + threshold:
+                regressions.append(
+                    name + ": " + phase + " " + format(
+                        result['phases'][phase], '.3f') + " s vs " + format(
+                        reference_time, '.3f') + " s (" + format(
+                        ratio - 1, '+.0%') + ")")
+        if result['entities'] != reference['entities']:
+            regressions.append(
+                name + ": " + str(result['entities']) + " entities vs " +
+                str(reference['entities']))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='benchmark', add_help=False)
+    parser.add_argument('results_out', nargs='?', default='benchmark.json')
+    parser.add_argument('-h', action='store_true', dest='help')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--case', action='append')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--format', choices=['txt', 'json', 'csv', 'npz'],
+                        default='json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--min-time', type=float, default=0.05)
+    parser.add_argument('--numpy', action='store_true', dest='use_numpy')
+    parser.add_argument('--no-shared-edges', action='store_false',
+                        dest='shared_edges')
+    parser.add_argument('--instances', action='store_const',
+                        const=stepfg.DISTANCE_ACCURACY,
+                        dest='instance_tolerance')
+    parser.add_argument('--tessellate', action='store_true')
+    parser.add_argument('--union', action='store_const',
+                        const=stepfg.DISTANCE_ACCURACY,
+                        dest='union_tolerance')
+    args = parser.parse_args(argv)
+    args.help = args.help or '/h' in argv
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_args(argv)
+    if args.help:
+        print(helpstr)
+        return
+
+    options = {'format': args.format, 'use_numpy': args.use_numpy,
+               'shared_edges': args.shared_edges,
+               'instance_tolerance': args.instance_tolerance,
+               'tessellate': args.tessellate,
+               'union_tolerance': args.union_tolerance}
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as file_in:
+            baseline = json.load(file_in)
+        if baseline.get('options') != options:
+            # timings and entity counts of other options are not comparable
+            print("The baseline " + args.baseline + " was run with the " +
+                  "options " + json.dumps(baseline.get('options')) +
+                  ", not " + json.dumps(options) + ".")
+            sys.exit(1)
+
+    case_list = [k for k in SUITES[args.suite] if
+                 args.case is None or k[0] in args.case]
+    results = run_suite(case_list, args.repeat, args.format,
+                        use_numpy=args.use_numpy,
+                        shared_edges=args.shared_edges,
+                        instance_tolerance=args.instance_tolerance,
+                        tessellate=args.tessellate,
+                        union_tolerance=args.union_tolerance)
+    with open(args.results_out, 'w') as file_out:
+        json.dump({'stepfg_version': stepfg.__version__,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'options': options,
+                   'cases': results}, file_out, indent=1)
+    print("Results written to " + args.results_out + ".")
+
+    if args.baseline is not None:
+        regressions = compare_results(results, baseline['cases'],
+                                      args.threshold, args.min_time)
+        if regressions:
+            print("\nRegressions against " + args.baseline + ":")
+            for regression in regressions:
+                print("    " + regression)
+            sys.exit(1)
+        print("No regressions against " + args.baseline + ".")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1066 @@
+#!/usr/bin/python
+helpstr = '''
+This program compares two STEP files as entity graphs, so that outputs
+whose entity numbering or order differs can be checked for identical
+content and geometry. It also runs randomized differential tests of a
+conversion engine against stepfg.generate_assembly.
+
+stepcmp filename1 filename2 [options] [-h] [/h]
+stepcmp --fuzz N [options]
+stepcmp --regressions [options]
+    filename1      Reference STEP file (.stp, .stp.gz or .stpZ)
+    filename2      STEP file to compare with the reference
+    -h or /h       This information
+
+Options:
+    --tolerance T      Absolute tolerance of real values and coordinates
+                       in mm (default: 1e-06)
+    --geometric        Compare only the geometry of the solids, for
+                       outputs whose topology differs by design
+    --max-differences N
+                       Differences reported per comparison (default: 20)
+    --fuzz N           Run N differential trials on random polygons
+                       instead of comparing two files
+    --regressions      Check the engine on the inputs of fixed bugs
+    --seed S           Seed of the random polygons (default: 0)
+    --polygons N       Largest number of polygons per trial (default: 20)
+    --options JSON     StepWriter options of the engine under test, e.g.
+                       '{"use_numpy": true}' (default: {})
+    --reference-options JSON
+                       StepWriter options of the reference (default: {})
+    --engine MODULE:FUNCTION
+                       Engine under test, called like
+                       stepfg.generate_assembly(polygons, z_interval,
+                       coeff, **options) and returning the STEP text
+                       (default: stepfg:generate_assembly)
+    --failures DIR     Write the input geometry of every failing trial
+                       to DIR as JSON
+
+Entity references are resolved into a canonical signature of every entity
+that does not depend on its #N index, so renumbering, reordering and
+deduplication of identical entities do not count as differences. The
+values of CALENDAR_DATE and LOCAL_TIME and the FILE_NAME header are
+ignored, set-valued attributes (shell faces, face bounds, representation
+items) are compared as multisets and edge loops up to rotation. Every
+solid (MANIFOLD_SOLID_BREP, TESSELLATED_SOLID or a MAPPED_ITEM placement
+of one) is also evaluated for its volume, face count and bounding box,
+and the solids of the two files are matched by bounding box. The exit
+status is 1 if the files or any trial differ.
+'''
+
+__author__ = "E. Valetov and M. Berz"
+__version__ = "1.0.1"
+__maintainer__ = "E. Valetov"
+__email__ = "valetove@msu.edu"
+__status__ = "Production"
+
+import re
+import sys
+import math
+import json
+import random
+import hashlib
+import argparse
+import datetime
+import importlib
+import collections
+from pathlib import Path
+
+import stepfg
+
+Reference = collections.namedtuple('Reference', 'index')
+Enumeration = collections.namedtuple('Enumeration', 'name')
+TypedValue = collections.namedtuple('TypedValue', 'type parameters')
+Omitted = collections.namedtuple('Omitted', 'symbol')
+
+TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|[^\s(),;=']+|[(),=]")
+STATEMENT_PATTERN = re.compile(r"[^;']*(?:'(?:[^']|'')*'[^;']*)*;")
+COMMENT_PATTERN = re.compile(r"('(?:[^']|'')*')|/\*.*?\*/", re.DOTALL)
+
+TIMESTAMP_TYPES = {'CALENDAR_DATE', 'LOCAL_TIME'}
+IGNORED_HEADER = {'FILE_NAME'}
+SET_ATTRIBUTES = {
+    'ADVANCED_BREP_SHAPE_REPRESENTATION': {1},
+    'ADVANCED_FACE': {1},
+    'APPLIED_APPROVAL_ASSIGNMENT': {1},
+    'APPLIED_DATE_AND_TIME_ASSIGNMENT': {2},
+    'APPLIED_PERSON_AND_ORGANIZATION_ASSIGNMENT': {2},
+    'APPLIED_SECURITY_CLASSIFICATION_ASSIGNMENT': {1},
+    'CC_DESIGN_APPROVAL': {1},
+    'CC_DESIGN_DATE_AND_TIME_ASSIGNMENT': {2},
+    'CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT': {2},
+    'CC_DESIGN_SECURITY_CLASSIFICATION': {1},
+    'CLOSED_SHELL': {1},
+    'CONNECTED_FACE_SET': {1},
+    'FACE_SURFACE': {1},
+    'GLOBAL_UNCERTAINTY_ASSIGNED_CONTEXT': {0},
+    'GLOBAL_UNIT_ASSIGNED_CONTEXT': {0},
+    'OPEN_SHELL': {1},
+    'PRODUCT': {3},
+    'PRODUCT_RELATED_PRODUCT_CATEGORY': {2},
+    'SHAPE_REPRESENTATION': {1},
+    'TESSELLATED_SHAPE_REPRESENTATION': {1},
+    'TESSELLATED_SOLID': {1}}
+CYCLIC_ATTRIBUTES = {'EDGE_LOOP': {1}, 'POLY_LOOP': {1}}
+SOLID_TYPES = {'MANIFOLD_SOLID_BREP', 'TESSELLATED_SOLID'}
+MAX_PAIRING = 64
+ARC_MAX_SEGMENTS = 4096
+IDENTITY = ([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+            [0.0, 0.0, 0.0])
+
+
+def parse_value(token, reference_list):
+    first = token[0]
+    if first == "'":
+        return token[1:-1].replace("''", "'")
+    if first == '#':
+        reference_list.append(int(token[1:]))
+        return Reference(reference_list[-1])
+    if first == '.':
+        return Enumeration(token[1:-1])
+    if first in '$*':
+        return Omitted(token)
+    if first in '0123456789+-':
+        return float(token) if '.' in token else int(token)
+    raise ValueError(token)
+
+
+def parse_parameters(token_list, position, reference_list):
+    # token_list[position] is the opening parenthesis
+    parameter_list = []
+    position += 1
+    if token_list[position] == ')':
+        return parameter_list, position + 1
+    while True:
+        token = token_list[position]
+        if token == '(':
+            value, position = parse_parameters(token_list, position,
+                                               reference_list)
+        elif token_list[position + 1] == '(':
+            value, position = parse_parameters(token_list, position + 1,
+                                               reference_list)
+            value = TypedValue(token, value)
+        else:
+            value = parse_value(token, reference_list)
+            position += 1
+        parameter_list.append(value)
+        token = token_list[position]
+        position += 1
+        if token == ')':
+            return parameter_list, position
+        if token != ',':
+            raise ValueError(token)
+
+
+def parse_instance(token_list, position, reference_list):
+    # KEYWORD(...) or (KEYWORD(...) KEYWORD(...) ...) for complex entities
+    part_list = []
+    complex_p = token_list[position] == '('
+    if complex_p:
+        position += 1
+    while position < len(token_list) and token_list[position] != ')':
+        entity_type = token_list[position]
+        if not (entity_type[0].isalpha() or entity_type[0] == '_') or \
+                token_list[position + 1] != '(':
+            raise ValueError(entity_type)
+        parameter_list, position = parse_parameters(
+            token_list, position + 1, reference_list)
+        part_list.append((entity_type, parameter_list))
+        if not complex_p:
+            break
+    if complex_p:
+        if token_list[position] != ')':
+            raise ValueError(token_list[position])
+        position += 1
+    if not part_list or position != len(token_list):
+        raise ValueError(token_list[-1])
+    return part_list
+
+
+def parse_step(text, name=''):
+    text = COMMENT_PATTERN.sub(lambda x: x.group(1) or '', text)
+    header = {}
+    entities = {}
+    children = {}
+    section = None
+    for match in STATEMENT_PATTERN.finditer(text):
+        statement = match.group()[:-1].strip()
+        if statement in ['HEADER', 'DATA']:
+            section = statement
+            continue
+        if statement == 'ENDSEC' or statement.startswith('ISO-10303-21') or \
+                statement.startswith('END-ISO-10303-21'):
+            section = None
+            continue
+        if section is None:
+            continue
+        token_list = TOKEN_PATTERN.findall(statement)
+        try:
+            if section == 'HEADER':
+                entity_type, parameter_list = parse_instance(
+                    token_list, 0, [])[0]
+                header[entity_type] = parameter_list
+            elif len(token_list) < 3 or token_list[0][0] != '#' or \
+                    token_list[1] != '=':
+                raise ValueError(token_list[0])
+            else:
+                index = int(token_list[0][1:])
+                children[index] = []
+                entities[index] = parse_instance(token_list, 2,
+                                                 children[index])
+        except (ValueError, IndexError):
+            raise stepfg.StepfgError(
+                "Error. Cannot parse the STEP statement " +
+                statement[:80] + " in " + str(name) + ".")
+    if not entities:
+        raise stepfg.StepfgError(
+            "Error. " + str(name) + " has no STEP DATA section.")
+    return StepGraph(header, entities, children, name)
+
+
+def read_step(file_name):
+    if not Path(file_name).is_file():
+        raise stepfg.StepfgError(
+            "Error. STEP file " + str(file_name) + " doesn't exist.")
+    with stepfg.open_input(file_name) as file_in:
+        return parse_step(file_in.read(), str(file_name))
+
+
+def step_text(value):
+    if isinstance(value, Reference):
+        return '#' + str(value.index)
+    if isinstance(value, Enumeration):
+        return '.' + value.name + '.'
+    if isinstance(value, Omitted):
+        return value.symbol
+    if isinstance(value, TypedValue):
+        return value.type + step_text(value.parameters)
+    if isinstance(value, list):
+        return '(' + ','.join(step_text(x) for x in value) + ')'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def canonical_value(value, signature_dict, tolerance):
+    value_type = type(value)
+    if value_type is float:
+        return float(round(value / tolerance)) if tolerance > 0 else value
+    if value_type is Reference:
+        return signature_dict[value.index]
+    if value_type is list:
+        return tuple([canonical_value(x, signature_dict, tolerance) for x in
+                      value])
+    if value_type is TypedValue:
+        return value.type, canonical_value(value.parameters, signature_dict,
+                                           tolerance)
+    return value
+
+
+class StepGraph:
+    def __init__(self, header, entities, children, name=''):
+        self.header = header
+        self.entities = entities
+        self.children = children
+        self.name = name
+        self.tolerance = None
+        self.signature_dict = {}
+        self.solid_dict = {}
+
+    def entity_type(self, index):
+        return '+'.join(x[0] for x in self.entities[index])
+
+    def attributes(self, index):
+        return self.entities[index][0][1]
+
+    def roots(self):
+        referenced = set()
+        for reference_list in self.children.values():
+            referenced.update(reference_list)
+        return sorted(set(self.entities) - referenced)
+
+    def entity_signature(self, index, tolerance):
+        canonical_list = []
+        for entity_type, parameter_list in self.entities[index]:
+            if entity_type in TIMESTAMP_TYPES:
+                canonical_list.append(entity_type)
+                continue
+            canonical = [canonical_value(x, self.signature_dict, tolerance)
+                         for x in parameter_list]
+            for k in SET_ATTRIBUTES.get(entity_type, ()):
+                if k < len(canonical) and type(parameter_list[k]) is list:
+                    canonical[k] = tuple(sorted(canonical[k], key=repr))
+            for k in CYCLIC_ATTRIBUTES.get(entity_type, ()):
+                if k < len(canonical) and type(parameter_list[k]) is list \
+                        and parameter_list[k]:
+                    rotation = stepfg.least_rotation([repr(x) for x in
+                                                      canonical[k]])
+                    canonical[k] = canonical[k][rotation:] + canonical[k][
+                                                             :rotation]
+            canonical_list.append((entity_type, canonical))
+        return hashlib.blake2b(repr(canonical_list).encode(),
+                               digest_size=16).digest()
+
+    def signatures(self, tolerance):
+        # post-order over the reference graph, so that every entity is
+        # signed after the entities it refers to
+        if self.tolerance == tolerance:
+            return self.signature_dict
+        self.signature_dict = {}
+        self.tolerance = tolerance
+        active = set()
+        for start in self.entities:
+            stack = [start]
+            while stack:
+                index = stack[-1]
+                if index in self.signature_dict:
+                    stack.pop()
+                    continue
+                if index not in active:
+                    active.add(index)
+                    for child in set(self.children[index]):
+                        if child in active:
+                            raise stepfg.StepfgError(
+                                "Error. #" + str(child) +
+                                " refers to itself through #" +
+                                str(index) + " in " + self.name + ".")
+                        if child not in self.entities:
+                            raise stepfg.StepfgError(
+                                "Error. #" + str(child) + " referenced by #" +
+                                str(index) + " is not defined in " +
+                                self.name + ".")
+                        if child not in self.signature_dict:
+                            stack.append(child)
+                    continue
+                self.signature_dict[index] = self.entity_signature(
+                    index, tolerance)
+                active.discard(index)
+                stack.pop()
+        return self.signature_dict
+
+    def solids(self, tolerance):
+        if tolerance not in self.solid_dict:
+            self.solid_dict[tolerance] = solid_list(self, tolerance)
+        return self.solid_dict[tolerance]
+
+
+class StepComparison:
+    def __init__(self, graph1, graph2, tolerance=1e-6):
+        self.graph1 = graph1
+        self.graph2 = graph2
+        self.tolerance = tolerance
+        self.signature_dict1 = graph1.signatures(tolerance)
+        self.signature_dict2 = graph2.signatures(tolerance)
+        self.entity_differences = {}
+
+    def entity_difference(self, index1, index2):
+        if self.signature_dict1[index1] == self.signature_dict2[index2]:
+            return None
+        if (index1, index2) in self.entity_differences:
+            return self.entity_differences[index1, index2]
+        entity_type = self.graph1.entity_type(index1)
+        label = '#' + str(index1) + '/#' + str(index2) + ' ' + entity_type
+        if entity_type != self.graph2.entity_type(index2):
+            difference = label + ' vs ' + self.graph2.entity_type(index2)
+        else:
+            difference = None
+            for (part_type, parameter_list1), (_, parameter_list2) in zip(
+                    self.graph1.entities[index1],
+                    self.graph2.entities[index2]):
+                if part_type in TIMESTAMP_TYPES:
+                    continue
+                if len(parameter_list1) != len(parameter_list2):
+                    difference = label + ': ' + str(
+                        len(parameter_list1)) + ' vs ' + str(
+                        len(parameter_list2)) + ' attributes'
+                    break
+                for k, (value1, value2) in enumerate(
+                        zip(parameter_list1, parameter_list2)):
+                    value_difference = self.value_difference(
+                        value1, value2,
+                        'set' if k in SET_ATTRIBUTES.get(part_type, ()) else
+                        'cyclic' if k in CYCLIC_ATTRIBUTES.get(
+                            part_type, ()) else 'list')
+                    if value_difference is not None:
+                        difference = label + (
+                            '' if part_type == entity_type else
+                            ' ' + part_type) + '[' + str(
+                            k) + ']' + value_difference
+                        break
+                if difference is not None:
+                    break
+        self.entity_differences[index1, index2] = difference
+        return difference
+
+    def value_difference(self, value1, value2, mode='list'):
+        if isinstance(value1, Reference) and isinstance(value2, Reference):
+            difference = self.entity_difference(value1.index, value2.index)
+            return None if difference is None else ' > ' + difference
+        if isinstance(value1, float) and isinstance(value2, float):
+            if abs(value1 - value2) <= self.tolerance:
+                return None
+        elif isinstance(value1, list) and isinstance(value2, list):
+            if len(value1) != len(value2):
+                return ': ' + str(len(value1)) + ' vs ' + str(
+                    len(value2)) + ' items'
+            if mode == 'set':
+                return self.set_difference(value1, value2)
+            rotation_list = [0]
+            if mode == 'cyclic':
+                rotation_list = [k for k in range(len(value2)) if
+                                 self.value_difference(value1[0], value2[
+                                     k]) is None] or [0]
+            for k in rotation_list:
+                rotated_list = value2[k:] + value2[:k]
+                difference = next((('[' + str(j) + ']' + x) for j, x in (
+                    (j, self.value_difference(value1[j], rotated_list[j]))
+                    for j in range(len(value1))) if x is not None), None)
+                if difference is None:
+                    return None
+            return difference
+        elif isinstance(value1, TypedValue) and isinstance(
+                value2, TypedValue) and value1.type == value2.type:
+            return self.value_difference(value1.parameters,
+                                         value2.parameters)
+        elif type(value1) is type(value2) and value1 == value2:
+            return None
+        return ': ' + step_text(value1) + ' vs ' + step_text(value2)
+
+    def unmatched(self, value_list1, value_list2):
+        # multiset difference of the canonical values, then tolerant
+        # pairing of the values left over on both sides
+        value_dict = collections.defaultdict(list)
+        for value in value_list2:
+            value_dict[repr(canonical_value(
+                value, self.signature_dict2, self.tolerance))].append(value)
+        unmatched_list1 = []
+        for value in value_list1:
+            candidate_list = value_dict.get(repr(canonical_value(
+                value, self.signature_dict1, self.tolerance)))
+            if candidate_list:
+                candidate_list.pop()
+            else:
+                unmatched_list1.append(value)
+        unmatched_list2 = [y for x in value_dict.values() for y in x]
+        if len(unmatched_list1) <= MAX_PAIRING and len(
+                unmatched_list2) <= MAX_PAIRING:
+            for value1 in list(unmatched_list1):
+                for value2 in unmatched_list2:
+                    if self.value_difference(value1, value2) is None:
+                        unmatched_list1.remove(value1)
+                        unmatched_list2.remove(value2)
+                        break
+        return unmatched_list1, unmatched_list2
+
+    def value_type(self, value, graph):
+        if isinstance(value, Reference):
+            return graph.entity_type(value.index)
+        return type(value).__name__
+
+    def set_difference(self, value_list1, value_list2):
+        unmatched_list1, unmatched_list2 = self.unmatched(
+            value_list1, value_list2)
+        for value1 in unmatched_list1:
+            value2 = next((x for x in unmatched_list2 if self.value_type(
+                x, self.graph2) == self.value_type(value1, self.graph1)),
+                          unmatched_list2[0])
+            unmatched_list2.remove(value2)
+            difference = self.value_difference(value1, value2)
+            if difference is not None:
+                return '[' + str(next(k for k, x in enumerate(
+                    value_list1) if x is value1)) + ']' + difference
+        return None
+
+    def differences(self):
+        difference_list = []
+        for keyword in sorted((set(self.graph1.header) | set(
+                self.graph2.header)) - IGNORED_HEADER):
+            if keyword not in self.graph2.header:
+                difference_list.append(
+                    "Header " + keyword + " only in " + self.graph1.name)
+            elif keyword not in self.graph1.header:
+                difference_list.append(
+                    "Header " + keyword + " only in " + self.graph2.name)
+            else:
+                difference = self.value_difference(
+                    self.graph1.header[keyword], self.graph2.header[keyword])
+                if difference is not None:
+                    difference_list.append("Header " + keyword + difference)
+        unmatched_list1, unmatched_list2 = self.unmatched(
+            [Reference(k) for k in self.graph1.roots()],
+            [Reference(k) for k in self.graph2.roots()])
+        for value1 in unmatched_list1:
+            value2 = next((x for x in unmatched_list2 if self.value_type(
+                x, self.graph2) == self.value_type(value1, self.graph1)),
+                          None)
+            if value2 is None:
+                difference_list.append(
+                    step_text(value1) + " " + self.value_type(
+                        value1, self.graph1) + " only in " + self.graph1.name)
+                continue
+            unmatched_list2.remove(value2)
+            difference = self.entity_difference(value1.index, value2.index)
+            if difference is not None:
+                difference_list.append(difference)
+        for value2 in unmatched_list2:
+            difference_list.append(
+                step_text(value2) + " " + self.value_type(
+                    value2, self.graph2) + " only in " + self.graph2.name)
+        return difference_list
+
+
+def dot_product(x, y):
+    return x[0] * y[0] + x[1] * y[1] + x[2] * y[2]
+
+
+def point_coordinates(graph, index):
+    coordinate_list = [float(x) for x in graph.attributes(index)[1]]
+    return coordinate_list + [0.0] * (3 - len(coordinate_list))
+
+
+def direction_ratios(graph, value, default):
+    if not isinstance(value, Reference):
+        return default
+    return stepfg.normalize(point_coordinates(graph, value.index))
+
+
+def placement_transform(graph, index):
+    # AXIS2_PLACEMENT_3D as a rotation matrix with the axes as columns and
+    # the location as offset
+    attribute_list = graph.attributes(index)
+    zaxis = direction_ratios(graph, attribute_list[2], [0.0, 0.0, 1.0])
+    xaxis = direction_ratios(graph, attribute_list[3] if len(
+        attribute_list) > 3 else None, [1.0, 0.0, 0.0])
+    for candidate in [xaxis, [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]:
+        projection = dot_product(candidate, zaxis)
+        xaxis = [candidate[k] - projection * zaxis[k] for k in range(3)]
+        if dot_product(xaxis, xaxis) > 1e-12:
+            break
+    xaxis = stepfg.normalize(xaxis)
+    yaxis = stepfg.cross_product(zaxis, xaxis)
+    return [[xaxis[k], yaxis[k], zaxis[k]] for k in range(3)], \
+        point_coordinates(graph, attribute_list[1].index)
+
+
+def transform_vector(transform, vector):
+    return [dot_product(transform[0][k], vector) for k in range(3)]
+
+
+def transform_point(transform, point):
+    return [dot_product(transform[0][k], point) + transform[1][k] for k in
+            range(3)]
+
+
+def compose_transforms(transform1, transform2):
+    matrix = [[sum(transform1[0][i][k] * transform2[0][k][j] for k in
+                   range(3)) for j in range(3)] for i in range(3)]
+    return matrix, transform_point(transform1, transform2[1])
+
+
+def inverse_transform(transform):
+    matrix = [[transform[0][j][i] for j in range(3)] for i in range(3)]
+    return matrix, [-x for x in transform_vector((matrix, None),
+                                                 transform[1])]
+
+
+def edge_points(graph, index, tolerance):
+    # vertices of an EDGE_CURVE from its start to its end vertex, with
+    # circular arcs sampled to a sagitta of tolerance; returns the points
+    # and the largest sagitta
+    attribute_list = graph.attributes(index)
+    start, end = [point_coordinates(graph, graph.attributes(
+        x.index)[1].index) for x in attribute_list[1:3]]
+    curve = attribute_list[3].index
+    if graph.entity_type(curve) != 'CIRCLE':
+        return [start, end], 0.0
+    placement, radius = graph.attributes(curve)[1:3]
+    matrix, center = placement_transform(graph, placement.index)
+    xaxis, yaxis = [[matrix[k][j] for k in range(3)] for j in range(2)]
+    angle_list = [math.atan2(dot_product(x, yaxis), dot_product(x, xaxis))
+                  for x in [[p[k] - center[k] for k in range(3)] for p in
+                            [start, end]]]
+    if attribute_list[4] == Enumeration('T'):
+        sweep = (angle_list[1] - angle_list[0]) % (2 * math.pi) or \
+            2 * math.pi
+    else:
+        sweep = -((angle_list[0] - angle_list[1]) % (2 * math.pi) or
+                  2 * math.pi)
+    step = 2 * math.acos(1 - tolerance / radius) if \
+        0 < tolerance < radius else math.pi / 2
+    segments = min(ARC_MAX_SEGMENTS, max(1, math.ceil(abs(sweep) / step)))
+    point_list = [start]
+    for j in range(1, segments):
+        angle = angle_list[0] + sweep * j / segments
+        point_list.append([center[k] + radius * (
+            math.cos(angle) * xaxis[k] + math.sin(angle) * yaxis[k]) for
+                           k in range(3)])
+    point_list.append(end)
+    return point_list, radius * (1 - math.cos(abs(sweep) / segments / 2))
+
+
+def brep_faces(graph, index, tolerance):
+    # (cylinder axis or None, boundary loops) of every face of the outer
+    # shell; every loop runs counter-clockwise about the outward normal
+    face_list = []
+    sagitta = 0.0
+    edge_dict = {}
+    shell = graph.attributes(index)[1].index
+    for face in graph.attributes(shell)[1]:
+        face_attribute_list = graph.attributes(face.index)
+        surface = face_attribute_list[2].index
+        axis = None
+        if graph.entity_type(surface) == 'CYLINDRICAL_SURFACE':
+            axis = [x[2] for x in placement_transform(
+                graph, graph.attributes(surface)[1].index)[0]]
+        loop_list = []
+        for bound in face_attribute_list[1]:
+            bound_attribute_list = graph.attributes(bound.index)
+            loop = bound_attribute_list[1].index
+            if graph.entity_type(loop) == 'POLY_LOOP':
+                point_list = [point_coordinates(graph, x.index) for x in
+                              graph.attributes(loop)[1]]
+            elif graph.entity_type(loop) == 'EDGE_LOOP':
+                point_list = []
+                for oriented_edge in graph.attributes(loop)[1]:
+                    edge_attribute_list = graph.attributes(
+                        oriented_edge.index)
+                    edge = edge_attribute_list[3].index
+                    if edge not in edge_dict:
+                        edge_dict[edge] = edge_points(graph, edge, tolerance)
+                        sagitta = max(sagitta, edge_dict[edge][1])
+                    edge_list = edge_dict[edge][0]
+                    if edge_attribute_list[4] == Enumeration('F'):
+                        edge_list = edge_list[::-1]
+                    point_list.extend(edge_list[:-1])
+            else:
+                continue
+            if bound_attribute_list[2] == Enumeration('F'):
+                point_list.reverse()
+            loop_list.append(point_list)
+        face_list.append((axis, loop_list))
+    return face_list, sagitta
+
+
+def tessellated_faces(graph, index):
+    face_list = []
+    for item in graph.attributes(index)[1]:
+        if graph.entity_type(item.index) != 'TRIANGULATED_FACE':
+            continue
+        attribute_list = graph.attributes(item.index)
+        coordinate_list = graph.attributes(attribute_list[1].index)[2]
+        index_list = attribute_list[5]
+        face_list.append((None, [[[float(x) for x in coordinate_list[
+            (index_list[k - 1] if index_list else k) - 1]] for k in
+                                  triangle] for triangle in
+                                 attribute_list[6]]))
+    return face_list, 0.0
+
+
+def solid_properties(face_list, transform):
+    # volume by the divergence theorem with the field (r.a) a, where a is
+    # the common axis of the cylindrical faces, so that those faces carry
+    # no flux and the planar faces are integrated exactly over fans of
+    # their boundary loops
+    face_list = [(None if axis is None else transform_vector(
+        transform, axis), [[transform_point(transform, x) for x in
+                            loop] for loop in loop_list]) for
+                 axis, loop_list in face_list]
+    axis_list = [x[0] for x in face_list if x[0] is not None]
+    direction = axis_list[0] if axis_list and all(
+        dot_product(*[stepfg.cross_product(x, axis_list[0])] * 2) < 1e-18
+        for x in axis_list) else [0.0, 0.0, 1.0]
+    volume = 0.0
+    area = 0.0
+    box_min = [math.inf] * 3
+    box_max = [-math.inf] * 3
+    for axis, loop_list in face_list:
+        flux_p = axis is None or dot_product(
+            *[stepfg.cross_product(axis, direction)] * 2) >= 1e-18
+        for loop in loop_list:
+            for point in loop:
+                box_min = [min(x, y) for x, y in zip(box_min, point)]
+                box_max = [max(x, y) for x, y in zip(box_max, point)]
+            vector_area = [0.0, 0.0, 0.0]
+            for j in range(1, len(loop) - 1):
+                edge1, edge2 = [[loop[k][i] - loop[0][i] for i in range(3)]
+                                for k in [j, j + 1]]
+                triangle_area = [x / 2 for x in stepfg.cross_product(
+                    edge1, edge2)]
+                vector_area = [x + y for x, y in zip(vector_area,
+                                                     triangle_area)]
+                if flux_p:
+                    volume += dot_product([loop[0][i] + loop[j][i] + loop[
+                        j + 1][i] for i in range(3)], direction) / 3 * \
+                        dot_product(triangle_area, direction)
+            area += math.sqrt(dot_product(vector_area, vector_area))
+    return {'faces': len(face_list), 'volume': volume, 'area': area,
+            'bbox': box_min + box_max}
+
+
+def solid_list(graph, tolerance):
+    face_dict = {}
+    representation_list = []
+    for index, part_list in graph.entities.items():
+        if part_list[0][0] == 'SHAPE_REPRESENTATION_RELATIONSHIP':
+            representation_list.extend(part_list[0][1][2:4])
+        elif part_list[0][0] == 'SHAPE_DEFINITION_REPRESENTATION':
+            representation_list.append(part_list[0][1][1])
+    solids = []
+
+    def add_solid(index, transform, label):
+        if index not in face_dict:
+            face_dict[index] = brep_faces(graph, index, tolerance) if \
+                graph.entity_type(index) == 'MANIFOLD_SOLID_BREP' else \
+                tessellated_faces(graph, index)
+        face_list, sagitta = face_dict[index]
+        solid = solid_properties(face_list, transform)
+        name = graph.attributes(index)[0]
+        solid['label'] = '#' + str(index) + (
+            " '" + name + "'" if isinstance(name, str) and name else
+            '') + label
+        solid['sagitta'] = sagitta
+        solids.append(solid)
+
+    def add_items(representation, transform, label):
+        item_list = graph.attributes(representation)[1]
+        for item in item_list if isinstance(item_list, list) else []:
+            if not isinstance(item, Reference):
+                continue
+            entity_type = graph.entity_type(item.index)
+            if entity_type in SOLID_TYPES:
+                add_solid(item.index, transform, label)
+            elif entity_type == 'MAPPED_ITEM':
+                source, target = graph.attributes(item.index)[1:3]
+                origin, mapped_representation = graph.attributes(
+                    source.index)
+                if graph.entity_type(target.index) != 'AXIS2_PLACEMENT_3D':
+                    continue
+                add_items(mapped_representation.index, compose_transforms(
+                    transform, compose_transforms(
+                        placement_transform(graph, target.index),
+                        inverse_transform(placement_transform(
+                            graph, origin.index)))),
+                          ' via MAPPED_ITEM #' + str(item.index))
+
+    for representation in dict.fromkeys(
+            x.index for x in representation_list if
+            isinstance(x, Reference)):
+        add_items(representation, IDENTITY, '')
+    if not solids:
+        for index in graph.entities:
+            if graph.entity_type(index) in SOLID_TYPES:
+                add_solid(index, IDENTITY, '')
+    return solids
+
+
+def solid_summary(solid):
+    return "volume " + format(solid['volume'], '.9g') + ", " + str(
+        solid['faces']) + " faces, bbox " + box_text(solid['bbox'])
+
+
+def box_text(box):
+    return '(' + ','.join(format(x, '.9g') for x in box[:3]) + ')-(' + \
+        ','.join(format(x, '.9g') for x in box[3:]) + ')'
+
+
+def solid_difference(solid1, solid2, tolerance):
+    # sampled arcs deviate from the true curves by up to the sagitta, which
+    # bounds the error of the bounding box and, times the surface area, of
+    # the volume
+    difference_list = []
+    tolerance += solid1['sagitta'] + solid2['sagitta']
+    if solid1['faces'] != solid2['faces']:
+        difference_list.append("faces " + str(solid1['faces']) + " vs " +
+                               str(solid2['faces']))
+    if abs(solid1['volume'] - solid2['volume']) > tolerance * max(
+            solid1['area'], solid2['area']) + 1e-9 * max(
+            abs(solid1['volume']), abs(solid2['volume'])):
+        difference_list.append("volume " + format(solid1['volume'], '.9g') +
+                               " vs " + format(solid2['volume'], '.9g'))
+    if max(abs(x - y) for x, y in zip(solid1['bbox'], solid2['bbox'])) > \
+            tolerance:
+        difference_list.append("bbox " + box_text(solid1['bbox']) + " vs " +
+                               box_text(solid2['bbox']))
+    return '; '.join(difference_list)
+
+
+def compare_solids(solid_list1, solid_list2, tolerance=1e-6, name1='file1',
+                   name2='file2'):
+    # pair the solids by bounding box, first by grid cell and then the rest
+    # by nearest bounding box
+    difference_list = []
+    if len(solid_list1) != len(solid_list2):
+        difference_list.append(str(len(solid_list1)) + " vs " + str(
+            len(solid_list2)) + " solids")
+    cell = max(4 * tolerance, 1e-9)
+    bucket_dict = collections.defaultdict(list)
+    for k, solid in enumerate(solid_list2):
+        bucket_dict[tuple(round(x / cell) for x in solid['bbox'])].append(k)
+    pair_list = []
+    unpaired_list1 = []
+    for solid in solid_list1:
+        bucket = bucket_dict.get(tuple(round(x / cell) for x in
+                                       solid['bbox']))
+        if bucket:
+            pair_list.append((solid, solid_list2[bucket.pop(0)]))
+        else:
+            unpaired_list1.append(solid)
+    unpaired_list2 = [solid_list2[k] for k in sorted(
+        k for x in bucket_dict.values() for k in x)]
+    for solid in unpaired_list1:
+        if not unpaired_list2:
+            difference_list.append(solid['label'] + " (" + solid_summary(
+                solid) + ") only in " + name1)
+            continue
+        nearest = min(unpaired_list2, key=lambda x: max(abs(
+            y - z) for y, z in zip(x['bbox'], solid['bbox'])))
+        unpaired_list2.remove(nearest)
+        pair_list.append((solid, nearest))
+    for solid in unpaired_list2:
+        difference_list.append(solid['label'] + " (" + solid_summary(
+            solid) + ") only in " + name2)
+    for solid1, solid2 in pair_list:
+        difference = solid_difference(solid1, solid2, tolerance)
+        if difference:
+            difference_list.append(solid1['label'] + " / " + solid2[
+                'label'] + ": " + difference)
+    return difference_list
+
+
+def compare_step(graph1, graph2, tolerance=1e-6, geometric=False):
+    difference_list = [] if geometric else StepComparison(
+        graph1, graph2, tolerance).differences()
+    return difference_list + compare_solids(
+        graph1.solids(tolerance), graph2.solids(tolerance), tolerance,
+        graph1.name, graph2.name)
+
+
+TRIAL_DATE = datetime.datetime(2017, 2, 3)
+
+
+def random_polygon(rng, center, radius):
+    kind = rng.choice(['star', 'regular', 'rectangle', 'rounded'])
+    if kind == 'star':
+        # angular gaps below pi keep the polygon star-shaped about center
+        n = rng.randint(4, 24)
+        polar_list = [(2 * math.pi * (k + 0.8 * rng.random()) / n,
+                       radius * rng.uniform(0.3, 1.0)) for k in range(n)]
+    elif kind == 'regular':
+        n = rng.choice([3, 4, 5, 6, 8, 12])
+        size = radius * rng.choice([0.5, 0.75, 1.0])
+        phase = rng.uniform(0, 2 * math.pi)
+        polar_list = [(phase + 2 * math.pi * k / n, size) for k in range(n)]
+    else:
+        width = radius * rng.uniform(0.3, 0.7)
+        height = radius * rng.uniform(0.3, 0.7)
+        corner = min(width, height) * rng.uniform(0.2, 0.9) if \
+            kind == 'rounded' else 0.0
+        steps = rng.randint(2, 12) if kind == 'rounded' else 0
+        polygon = []
+        for sign_x, sign_y, angle in [(1, 1, 0.0), (-1, 1, math.pi / 2),
+                                      (-1, -1, math.pi),
+                                      (1, -1, 3 * math.pi / 2)]:
+            for j in range(steps + 1):
+                polygon.append([
+                    center[0] + sign_x * (width - corner) + corner * math.cos(
+                        angle + math.pi / 2 * j / max(steps, 1)),
+                    center[1] + sign_y * (height - corner) + corner * math.sin(
+                        angle + math.pi / 2 * j / max(steps, 1))])
+        polar_list = None
+    if polar_list is not None:
+        polygon = [[center[0] + r * math.cos(a), center[1] + r * math.sin(a)]
+                   for a, r in polar_list]
+    if rng.random() < 0.5:
+        polygon.reverse()
+    return polygon
+
+
+def random_geometry(rng, max_polygons=20):
+    # polygons in the cells of a square grid, so that they never overlap
+    count = rng.randint(1, max_polygons)
+    columns = math.ceil(math.sqrt(count))
+    list_vert_list = [random_polygon(rng, [
+        10.0 * (k % columns) + rng.uniform(-0.9, 0.9),
+        10.0 * (k // columns) + rng.uniform(-0.9, 0.9)], 4.0) for k in
+        range(count)]
+    z1 = round(rng.uniform(-10, 10), 3)
+    return list_vert_list, [z1, z1 + round(rng.uniform(0.5, 50), 3)], \
+        rng.choice([1, 10, 25.4])
+
+
+def run_trial(geometry, engine=stepfg.generate_assembly, options=None,
+              reference_options=None, tolerance=1e-6, geometric=False):
+    reference = parse_step(stepfg.generate_assembly(
+        *geometry, d=TRIAL_DATE, **(reference_options or {})), 'reference')
+    try:
+        step_text_out = engine(*geometry, **(options or {}))
+    except Exception as err:
+        return ["engine failed: " + type(err).__name__ + ": " + str(err)]
+    return compare_step(reference, parse_step(step_text_out, 'engine'),
+                        tolerance, geometric)
+
+
+# inputs of fixed bugs: (description, geometry, options, reference options,
+# geometric); each is compared with the reference and its volume with that
+# of the extruded polygons
+REGRESSION_CASES = [
+    ('concave cap with a reflex second vertex',
+     ([[[10, 0], [5, 2], [0, 0], [0, 10], [10, 10]]], [0, 10], 1), {}, {},
+     False),
+    ('concyclic polyline with chords far from the arc',
+     ([[[0, 0], [10, 1], [20, 1], [30, 0], [30, -10], [0, -10]]], [0, 1], 1),
+     {'arc_tolerance': 1e-9}, {}, True)]
+
+
+def extrusion_volume(geometry):
+    list_vert_list, geom_depth_list, p_coeff = geometry
+    return sum(abs(sum(x1[0] * x2[1] - x2[0] * x1[1] for x1, x2 in zip(
+        vert_list, vert_list[1:] + vert_list[:1]))) / 2 for vert_list in
+               list_vert_list) * abs(geom_depth_list[1] - geom_depth_list[
+                   0]) * p_coeff ** 3
+
+
+def regression_test(engine=stepfg.generate_assembly, options=None,
+                    tolerance=1e-6):
+    for description, geometry, case_options, reference_options, \
+            geometric in REGRESSION_CASES:
+        case_options = dict(options or {}, **case_options)
+        difference_list = run_trial(geometry, engine, case_options,
+                                    reference_options, tolerance, geometric)
+        if not difference_list:
+            volume = sum(x['volume'] for x in parse_step(engine(
+                *geometry, **case_options)).solids(tolerance))
+            expected_volume = extrusion_volume(geometry)
+            if abs(volume - expected_volume) > tolerance * max(
+                    1.0, expected_volume):
+                difference_list = [
+                    "volume " + format(volume, '.9g') + " of the solids, " +
+                    format(expected_volume, '.9g') + " of the extruded " +
+                    "polygons"]
+        yield description, difference_list
+
+
+def differential_test(trials, seed=0, engine=stepfg.generate_assembly,
+                      options=None, reference_options=None, tolerance=1e-6,
+                      geometric=False, max_polygons=20):
+    for trial in range(trials):
+        geometry = random_geometry(random.Random(str(seed) + ':' + str(
+            trial)), max_polygons)
+        yield trial, geometry, run_trial(geometry, engine, options,
+                                         reference_options, tolerance,
+                                         geometric)
+
+
+def load_engine(engine_name):
+    module_name, _, function_name = engine_name.partition(':')
+    if not function_name:
+        raise stepfg.StepfgError(
+            "Error. The engine " + engine_name +
+            " is not of the form MODULE:FUNCTION.")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def print_differences(difference_list, max_differences, indent=''):
+    for difference in difference_list[:max_differences]:
+        print(indent + difference)
+    if len(difference_list) > max_differences:
+        print(indent + "... and " + str(len(difference_list) -
+                                        max_differences) +
+              " more differences")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='stepcmp', add_help=False)
+    parser.add_argument('file_names', nargs='*')
+    parser.add_argument('-h', action='store_true', dest='help')
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    parser.add_argument('--geometric', action='store_true')
+    parser.add_argument('--max-differences', type=int, default=20)
+    parser.add_argument('--fuzz', type=int)
+    parser.add_argument('--regressions', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--polygons', type=int, default=20)
+    parser.add_argument('--options', type=json.loads, default={})
+    parser.add_argument('--reference-options', type=json.loads, default={})
+    parser.add_argument('--engine', default='stepfg:generate_assembly')
+    parser.add_argument('--failures')
+    args = parser.parse_args([x for x in argv if x != '/h'])
+    args.help = args.help or '/h' in argv
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_args(argv)
+    if args.help or (args.fuzz is None and not args.regressions and len(
+            args.file_names) != 2):
+        print(helpstr)
+        return
+
+    if args.fuzz is not None or args.regressions:
+        try:
+            engine = load_engine(args.engine)
+        except (stepfg.StepfgError, ImportError, AttributeError) as err:
+            print(str(err))
+            sys.exit(1)
+
+    if args.regressions:
+        failures = 0
+        for description, difference_list in regression_test(
+                engine, args.options, args.tolerance):
+            if not difference_list:
+                continue
+            failures += 1
+            print("Regression '" + description + "' differs:")
+            print_differences(difference_list, args.max_differences, "    ")
+        print(str(len(REGRESSION_CASES)) + " regressions, " + str(failures) +
+              " failed.")
+        if failures:
+            sys.exit(1)
+        return
+
+    if args.fuzz is not None:
+        failures = 0
+        for trial, geometry, difference_list in differential_test(
+                args.fuzz, args.seed, engine, args.options,
+                args.reference_options, args.tolerance, args.geometric,
+                args.polygons):
+            if not difference_list:
+                continue
+            failures += 1
+            print("Trial " + str(trial) + " (seed " + str(args.seed) + ", " +
+                  str(len(geometry[0])) + " polygons) differs:")
+            print_differences(difference_list, args.max_differences, "    ")
+            if args.failures is not None:
+                Path(args.failures).mkdir(parents=True, exist_ok=True)
+                with open(Path(args.failures) / (
+                        'trial_' + str(trial) + '.json'), 'w') as file_out:
+                    json.dump(list(geometry), file_out)
+        print(str(args.fuzz) + " trials, " + str(failures) + " failed.")
+        if failures:
+            sys.exit(1)
+        return
+
+    try:
+        graph_list = [read_step(x) for x in args.file_names]
+    except stepfg.StepfgError as err:
+        print(str(err))
+        sys.exit(1)
+    for graph in graph_list:
+        solids = graph.solids(args.tolerance)
+        print(graph.name + ": " + str(len(graph.entities)) + " entities, " +
+              str(len(solids)) + " solids, volume " + format(
+                  sum(x['volume'] for x in solids), '.9g'))
+    difference_list = compare_step(graph_list[0], graph_list[1],
+                                   args.tolerance, args.geometric)
+    if difference_list:
+        print("\nDifferences:")
+        print_differences(difference_list, args.max_differences, "    ")
+        sys.exit(1)
+    print("No differences.")
+
+
+if __name__ == '__main__':
+    main()
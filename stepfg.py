@@ -4,13 +4,104 @@ This program converts a list of polygons in the x-y plane specified by
 vertices into a STEP file containing a 3D part obtained by extrusion of the
 interior regions of these polygons along the z axis.
 
-stepfg [filename_in [filename_out]] [-h] [/h]
+stepfg [filename_in [filename_out]] [options] [-h] [/h]
     filename_in    Input file containing 2D geometry data
                    (default: "part_geometry.txt")
     filename_out   Output STEP file with resulting 3D part
                    (default: "part_out.stp")
     -h or /h       This information
 
+Options:
+    --stream           Write the header first and flush the entities of
+                       each part as soon as it is generated. Memory is
+                       bounded by the largest part plus a dedup index of
+                       the 262144 most recently used entities of earlier
+                       parts; an entity evicted from it is written again
+                       when a later part uses it
+    --buffer-size N    Output buffer size in bytes (default: 1048576)
+    --compress KIND    Compress the output: "gzip" or "zip" (a zip archive
+                       holding one .stp file); selected automatically for
+                       filename_out ending in .gz or .stpZ
+    --compress-level N Compression level from 0 (fastest) to 9 (smallest)
+                       (default: 6)
+    --append           If filename_out is a STEP file written by stepfg,
+                       load its entities and add the new polygons to its
+                       assembly instead of starting a new file
+    --no-shared-edges  Emit a separate EDGE_CURVE for every face boundary
+                       instead of sharing each edge between its two faces
+    --numpy            Use the NumPy backend: polygons are held as (n, 3)
+                       arrays, orientation, scaling, face normals and
+                       edge directions are computed in bulk and the point
+                       and direction records are packed from the arrays;
+                       entities are still deduplicated one at a time
+    --weld [TOL]       Snap vertices closer than TOL mm (default: the
+                       0.005 mm distance accuracy of the STEP context) to
+                       a single vertex before the faces are generated
+    --simplify [TOL]   Merge collinear edges before extrusion and, if TOL
+                       is given, decimate the contours with the
+                       Douglas-Peucker algorithm within TOL mm
+    --arcs [TOL]       Replace runs of near-equal segments whose vertices
+                       and chords lie on a circle within TOL mm (default:
+                       0.005) by CIRCLE edges and CYLINDRICAL_SURFACE side
+                       faces
+    --validate         Reject self-intersecting polygons and overlapping
+                       polygons before generation, naming the polygon and
+                       segment indices (segment k joins vertices k and
+                       k + 1)
+    --union [TOL]      Merge polygons that share boundary segments or
+                       overlap (vertices within TOL mm, default: 0.005,
+                       are joined) into one solid per connected region,
+                       with the enclosed holes as inner loops of the caps
+    --instances [TOL]  Detect polygons congruent within TOL mm (default:
+                       0.005) under rotation, mirroring and translation,
+                       emit each such solid once and place the copies with
+                       MAPPED_ITEM transforms
+    --tessellate       Write every part as an AP242 TESSELLATED_SOLID:
+                       one COORDINATES_LIST for the top and bottom contour
+                       and TRIANGULATED_FACEs for the caps and the side
+                       walls, instead of the exact B-rep
+    --cache DIR        Keep the entities of every generated part in an
+                       on-disk cache keyed by the part geometry and reuse
+                       them for unchanged polygons on later runs
+    --cache-size N     Cache size limit in bytes; least recently used
+                       parts are evicted first (default: 268435456)
+    --stats FILE       Write a JSON report with the wall and CPU time of
+                       every phase, the number of entities of each STEP
+                       type, the dedup hits and the output size
+    --profile FILE     Run the conversion under cProfile and tracemalloc,
+                       write the profile to FILE and print the most
+                       expensive functions and allocation sites
+
+Server mode:
+    --serve [ADDRESS]  Run a conversion server instead of converting a
+                       file. ADDRESS is "stdio" (default), "unix:PATH" or
+                       "[tcp:][HOST:]PORT" (HOST defaults to 127.0.0.1).
+                       Requests and responses are JSON objects, one per
+                       line. A request holds "polygons", "z_interval",
+                       optionally "coeff", "options" (StepWriter options
+                       overriding those given on the command line), "id"
+                       and "output" (write the STEP file there instead of
+                       returning its text in "step"). The request
+                       {"command": "stats"} returns the latency
+                       percentiles.
+    --workers N        Size of the warm worker pool (default: CPU count)
+    --max-pending N    Requests in flight before the server stops reading
+                       input (default: twice the number of workers)
+
+Batch conversion:
+    --batch SOURCE     Convert many files in a process pool. SOURCE is a
+                       directory (all input files with a known extension),
+                       a glob pattern or a
+                       manifest file with one "filename_in [filename_out]"
+                       pair per line. Output names default to the input
+                       name with the .stp extension.
+    --workers N        Number of worker processes (default: CPU count).
+                       Without --batch, generate the parts of a single
+                       file in N worker processes (0: CPU count) and merge
+                       them in order; the output is identical to
+                       sequential generation, which is used for N = 1
+    --output-dir DIR   Directory for output files without an explicit name
+
 The input file format is three parameters as follows:
 
 [First_argument,
@@ -27,6 +118,18 @@ Third_argument: Geometric proportionality coefficient. The output unit of
     length in the STEP file is mm, so use 10 if the 2D geometry is specified
     in cm.
 
+The reader is selected by the extension of filename_in:
+    .txt    Python literal in the format above (also used for any other
+            extension)
+    .json   The same three parameters as a JSON array, parsed in chunks
+            straight into coordinate arrays
+    .csv    One "x,y" or "x,y,z" row per vertex, polygons separated by
+            blank lines, plus the rows "z_interval,z1,z2" and "coeff,c";
+            lines starting with # are comments
+    .npz    NumPy archive with one array per polygon named polygon_0,
+            polygon_1, ..., and the arrays z_interval and coeff;
+            uncompressed archives are memory-mapped (requires numpy)
+
 A sample input file, "part_geometry.txt" containing a representation of the
 Muon g-2 collaboration quadrupole, is supplied with this program.
 '''
@@ -42,10 +145,51 @@ import math
 import operator
 import ast
 import sys
+import os
 import datetime
+import hashlib
+import argparse
+import glob
+import time
+import json
+import zipfile
+import gzip
+import io
+import itertools
+import random
+import struct
+import tempfile
+import asyncio
+import signal
+import collections
+import contextlib
+import cProfile
+import pstats
+import tracemalloc
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
 from numbers import Number
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class StepfgError(ValueError):
+    pass
+
+
+DISTANCE_ACCURACY = 0.005
+ARC_MIN_SEGMENTS = 3
+ARC_MAX_STEP = math.radians(20)
+ARC_STEP_VARIATION = 0.1
+INSTANCE_ANGLE_STEP = math.radians(0.01)
+NEIGHBOUR_CELLS = [(dx, dy, dz) for dx in (0, -1, 1) for dy in (0, -1, 1) for
+                   dz in (0, -1, 1)]
+
 
 def line_index(line):
     search_result = re.search('#(.+?)=', line)
@@ -56,40 +200,296 @@ def rotate(list_in, x):
     return list_in[-x:] + list_in[:-x]
 
 
-def item_exists_q(string_in):
-    if not work_array:
-        return False
-    search_result = [i for i, item in enumerate(work_array) if
-                     item.endswith(string_in)]
-    return False if not search_result else True
-
-
-def existing_item_ln(string_in):
-    if not work_array:
-        return False
-    if not item_exists_q(string_in):
-        return False
-    search_result = [item for item in work_array if item.endswith(string_in)]
-    return line_index(search_result[0])
-
-
-def new_item(string_in):
-    global current_index
-    global work_array
-    if item_exists_q(string_in):
-        return_index = existing_item_ln(string_in)
-    else:
-        work_array.append('#' + str(current_index) + '=' + string_in)
-        return_index = current_index
-        current_index += 1
-    return return_index
+class EntityTable:
+    def __init__(self, first_index=1, max_index=None):
+        self.records = []
+        self.index = {} if max_index is None else collections.OrderedDict()
+        self.max_index = max_index
+        self.current_index = first_index
+        self.hits = 0
+        self.misses = 0
+        self.flushed = 0
+
+    def __len__(self):
+        return self.flushed + len(self.records)
+
+    def __contains__(self, record):
+        return self.lookup(record) != 0
+
+    def lookup(self, record):
+        return self.index.get(record, 0)
+
+    def add(self, record):
+        entity_ln = self.index.get(record)
+        if entity_ln is not None:
+            self.hits += 1
+            if self.max_index is not None:
+                self.index.move_to_end(record)
+            return entity_ln
+        entity_ln = self.current_index
+        self.records.append(record)
+        self.index[record] = entity_ln
+        self.current_index += 1
+        self.misses += 1
+        return entity_ln
+
+    def load(self, entity_lines):
+        for entity in entity_lines:
+            entity_ln = line_index(entity)
+            if entity_ln != self.current_index:
+                raise StepfgError(
+                    "EntityTable: Error. Entity #" + str(entity_ln) +
+                    " found where #" + str(self.current_index) +
+                    " was expected.")
+            record = parse_entity(entity[entity.index('=') + 1:])
+            self.records.append(record)
+            self.index[record] = entity_ln
+            self.current_index += 1
+
+    def replace(self, entity_ln, record):
+        position = entity_ln - self.current_index + len(self.records)
+        if not 0 <= position < len(self.records):
+            raise StepfgError(
+                "EntityTable: Error. Entity #" + str(entity_ln) +
+                " has already been written.")
+        old_record = self.records[position]
+        del self.index[old_record]
+        self.records[position] = record
+        self.index[record] = entity_ln
+
+    def lines(self):
+        entity_ln = self.current_index - len(self.records)
+        for record in self.records:
+            entity_kind = ENTITY_KIND_CODES[record[0]]
+            if entity_kind.tail_position is None:
+                line = entity_kind.line_template % ((entity_ln,) + (
+                    entity_kind.value_struct.unpack_from(record)))
+                if entity_kind.real_p and ('e-' in line or 'e+' in line):
+                    line = '#' + str(entity_ln) + '=' + entity_kind.render(
+                        record)
+            else:
+                line = '#' + str(entity_ln) + '=' + entity_kind.render(record)
+            yield line
+            entity_ln += 1
+
+    def flush(self, file_out, chunk_lines=4096):
+        lines = self.lines()
+        while True:
+            chunk = ''.join(itertools.islice(lines, chunk_lines))
+            if not chunk:
+                break
+            file_out.write(chunk)
+        self.flushed += len(self.records)
+        self.records.clear()
+        # between parts, the index is cut back to the most recently used
+        # entities; the part being generated is never evicted, so its
+        # vertices and edges are always shared within the part
+        while self.max_index is not None and len(
+                self.index) > self.max_index:
+            self.index.popitem(last=False)
+
+
+class PartCache:
+    version = 'STEPFG-PART 3'
+
+    def __init__(self, directory, max_size=1 << 28):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        entry_list = []
+        for entry_path in self.directory.glob('*.part'):
+            try:
+                entry_stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entry_list.append((entry_stat.st_mtime, entry_path.name,
+                               entry_stat.st_size))
+        self.entries = {k[1]: k[2] for k in sorted(entry_list)}
+        self.size = sum(self.entries.values())
+
+    @staticmethod
+    def key(vert_list, geom_depth_list, *options):
+        return hashlib.blake2b(repr((
+            [[fmt_real(x) for x in vertex] for vertex in vert_list],
+            [fmt_real(x) for x in geom_depth_list], options)).encode(),
+                               digest_size=16).hexdigest()
+
+    def get(self, key):
+        entry_name = key + '.part'
+        entry_path = self.directory / entry_name
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                header = entry_file.readline()
+                entry_data = entry_file.read()
+            entry_path.touch()
+        except FileNotFoundError:
+            self.entries.pop(entry_name, None)
+            self.misses += 1
+            return None
+        entry = self.parse_entry(header, entry_data)
+        if entry is None:
+            # a truncated or corrupt entry is a miss and is discarded
+            self.misses += 1
+            self.size -= self.entries.pop(entry_name, 0)
+            entry_path.unlink(missing_ok=True)
+            return None
+        self.entries[entry_name] = self.entries.pop(entry_name, 0)
+        self.hits += 1
+        return entry
+
+    @classmethod
+    def parse_entry(cls, header, entry_data):
+        try:
+            field_list = header.decode().split()
+        except UnicodeDecodeError:
+            return None
+        version_length = len(cls.version.split())
+        if ' '.join(field_list[:version_length]) != cls.version or len(
+                field_list) < version_length + 2 or field_list[
+                version_length] != str(len(entry_data)) or field_list[
+                version_length + 1] != cls.checksum(entry_data):
+            return None
+        fragment = []
+        position = 0
+        while position < len(entry_data):
+            if position + record_size_struct.size > len(entry_data):
+                return None
+            record_size, = record_size_struct.unpack_from(entry_data, position)
+            position += record_size_struct.size
+            if position + record_size > len(entry_data):
+                return None
+            fragment.append(entry_data[position:position + record_size])
+            position += record_size
+        try:
+            counters = [int(x) for x in field_list[version_length + 2:]]
+        except ValueError:
+            return None
+        return fragment, counters
+
+    @staticmethod
+    def checksum(entry_data):
+        return hashlib.blake2b(entry_data, digest_size=16).hexdigest()
+
+    def put(self, key, fragment, counters=()):
+        entry_name = key + '.part'
+        entry_data = b''.join(record_size_struct.pack(len(record)) + record
+                              for record in fragment)
+        entry_bytes = (' '.join([self.version, str(len(entry_data)),
+                                 self.checksum(entry_data)] + [
+            str(x) for x in counters]) + '\n').encode() + entry_data
+        # a temporary file of its own, since several processes may write
+        # the same entry
+        temp_handle, temp_name = tempfile.mkstemp(
+            prefix=entry_name + '.', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(temp_handle, 'wb') as entry_file:
+                entry_file.write(entry_bytes)
+            os.replace(temp_name, self.directory / entry_name)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+        self.size += len(entry_bytes) - self.entries.pop(entry_name, 0)
+        self.entries[entry_name] = len(entry_bytes)
+        while self.size > self.max_size and len(self.entries) > 1:
+            evicted_name = next(iter(self.entries))
+            self.size -= self.entries.pop(evicted_name)
+            (self.directory / evicted_name).unlink(missing_ok=True)
+
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses) if \
+            self.hits + self.misses else 0.0
+
+
+class RunStats:
+    def __init__(self):
+        self.phases = {}
+        self.entity_types = {}
+        self.output_bytes = 0
+        self.memory = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        try:
+            yield
+        finally:
+            phase_stats = self.phases.setdefault(
+                name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            phase_stats['wall'] += time.perf_counter() - start_time
+            phase_stats['cpu'] += time.process_time() - start_cpu_time
+            phase_stats['calls'] += 1
+
+    def count_entities(self, record_list):
+        for record in record_list:
+            entity_type = ENTITY_KIND_CODES[record[0]].type_name(record)
+            self.entity_types[entity_type] = self.entity_types.get(
+                entity_type, 0) + 1
+
+    def report(self, step_writer):
+        if step_writer.stream is None:
+            self.count_entities(step_writer.entity_table.records)
+        return {'phases': self.phases,
+                'entities': len(step_writer.entity_table),
+                'entity_types': dict(sorted(self.entity_types.items())),
+                'dedup_hits': step_writer.entity_table.hits,
+                'dedup_misses': step_writer.entity_table.misses,
+                'parts': step_writer.part_body_index - 1,
+                'output_bytes': self.output_bytes,
+                'memory': self.memory}
+
+
+def start_profile():
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler, file_out_name, stats=None):
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    current_size, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    profiler.dump_stats(file_out_name)
+    top_list = snapshot.statistics('lineno')[:10]
+    if stats is not None:
+        stats.memory = {'current_traced': current_size,
+                        'peak_traced': peak_size,
+                        'top_allocations': [str(k) for k in top_list]}
+    print("\nProfile written to " + file_out_name + ".")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+    print("Peak traced memory: " + str(peak_size) + " bytes.")
+    for k in top_list:
+        print("    " + str(k))
+
+
+def relative_fragment(item_list):
+    local_index = {}
+    fragment = []
+    for record, entity_ln in item_list:
+        if entity_ln in local_index:
+            continue
+        fragment.append(relocate_entity(record, local_index))
+        local_index[entity_ln] = len(fragment) - 1
+    return fragment
+
+
+def fmt_real(x):
+    real_str = repr(float(x) + 0.0)
+    if 'e' in real_str:
+        mantissa, exponent = real_str.split('e')
+        real_str = mantissa + ('E' if '.' in mantissa else '.E') + exponent
+    return real_str
 
 
 def to_coord(clist):
     if len(clist) != 3:
-        print('to_coord: Error. Coordinates not 3D.')
-        sys.exit()
-    return str(clist[0]) + ',' + str(clist[1]) + ',' + str(clist[2])
+        raise StepfgError('to_coord: Error. Coordinates not 3D.')
+    return fmt_real(clist[0]) + ',' + fmt_real(clist[1]) + ',' + fmt_real(
+        clist[2])
 
 
 def to_step_list(slist):
@@ -107,11 +507,211 @@ def fort_bool(bool_in):
     return '.T.' if (bool_in == True) or (bool_in == '.T.') else '.F.'
 
 
+def to_step_triples(values, value_text):
+    text_list = [value_text(x) for x in values]
+    return '(' + ','.join(['(' + ','.join(text_list[k:k + 3]) + ')' for k in
+                           range(0, len(text_list), 3)]) + ')'
+
+
+FIELD_FORMATS = {'r': 'I', 'i': 'I', 'd': 'd', 'b': '?'}
+TAIL_FORMATS = {'L': 'I', 'T': 'I', 'D': 'd'}
+FIELD_SPECS = {'r': '#%d', 'i': '%d', 'd': '%r', 'b': '.%.1s.', 'L': '%s',
+               'T': '%s', 'D': '%s', 's': '%s'}
+FIELD_PATTERNS = {'r': r'#(\d+)', 'i': r'(\d+)', 'd': r'([-+.\dE]+)',
+                  'b': r'\.([TF])\.', 'L': r'(#\d+(?:,#\d+)*)',
+                  'T': r'(\([\d,()]*\))', 'D': r'(\([-+.\dE,()]*\))',
+                  's': r'(.*)'}
+FIELD_TEXT = {'r': lambda x: '#' + str(x), 'i': str, 'd': fmt_real,
+              'b': fort_bool, 'L': lambda x: to_step_list(list(x)),
+              'T': lambda x: to_step_triples(x, str),
+              'D': lambda x: to_step_triples(x, fmt_real), 's': str}
+FIELD_VALUES = {'r': int, 'i': int, 'd': float, 'b': lambda x: x == 'T',
+                'L': lambda x: [int(k) for k in x.replace('#', '').split(',')],
+                'T': lambda x: [int(k) for k in re.findall(r'\d+', x)],
+                'D': lambda x: [float(k) for k in re.findall(r'[-+.\dE]+', x)],
+                's': str}
+record_size_struct = struct.Struct('<I')
+
+
+class EntityKind:
+    # An entity is held as a packed record: the kind code, then the fixed
+    # fields (r: reference, i: integer, d: real, b: logical) and, last, a
+    # variable-length list of references (L), of integer triples (T), of
+    # real triples (D) or text (s). The record is also the dedup key; the
+    # text is rendered only when it is written.
+    __slots__ = ('code', 'name', 'template', 'fields', 'struct',
+                 'value_struct', 'tail_position', 'real_p', 'ref_positions',
+                 'spec_template', 'line_template', 'pattern')
+
+    def __init__(self, code, template, fields):
+        self.code = code
+        self.name = template.partition('(')[0]
+        self.template = template
+        self.fields = fields
+        self.struct = struct.Struct('<B' + ''.join(
+            FIELD_FORMATS[k] for k in fields if k in FIELD_FORMATS))
+        self.value_struct = struct.Struct('<x' + self.struct.format[2:])
+        self.tail_position = next(
+            (j for j, k in enumerate(fields) if k not in FIELD_FORMATS), None)
+        self.real_p = 'd' in fields
+        self.ref_positions = [j for j, k in enumerate(fields) if k == 'r']
+        # '%.1s' writes a logical as the first letter of True or False
+        self.spec_template = template.replace('%', '%%').format(
+            *[FIELD_SPECS[k] for k in fields])
+        self.line_template = '#%d=' + self.spec_template
+        self.pattern = re.compile(''.join(
+            re.escape(x) + (FIELD_PATTERNS[fields[j]] if j < len(
+                fields) else '') for j, x in enumerate(
+                template.split('{}'))), re.DOTALL)
+
+    def pack(self, fields):
+        if self.fields == 'ddd':
+            return self.struct.pack(self.code, fields[0] + 0.0,
+                                    fields[1] + 0.0, fields[2] + 0.0)
+        if self.real_p:
+            fields = [x + 0.0 if k == 'd' else x for k, x in
+                      zip(self.fields, fields)]
+        if self.tail_position is None:
+            return self.struct.pack(self.code, *fields)
+        tail = fields[self.tail_position]
+        tail_kind = self.fields[self.tail_position]
+        if tail_kind == 'D':
+            tail = [x + 0.0 for x in tail]
+        return self.struct.pack(
+            self.code, *fields[:self.tail_position],
+            *fields[self.tail_position + 1:]) + (
+            tail.encode() if tail_kind == 's' else
+            struct.pack('<' + str(len(tail)) + TAIL_FORMATS[tail_kind], *tail))
+
+    def unpack(self, record):
+        fields = self.struct.unpack_from(record)[1:]
+        if self.tail_position is None:
+            return fields
+        tail = record[self.struct.size:]
+        tail_kind = self.fields[self.tail_position]
+        if tail_kind == 's':
+            tail = tail.decode()
+        else:
+            tail_format = TAIL_FORMATS[tail_kind]
+            tail = struct.unpack('<' + str(len(tail) // struct.calcsize(
+                tail_format)) + tail_format, tail)
+        return fields[:self.tail_position] + (tail,) + fields[
+            self.tail_position:]
+
+    def render(self, record):
+        values = self.unpack(record)
+        if self.tail_position is None:
+            text = self.spec_template % values
+        else:
+            fields = list(values)
+            fields[self.tail_position] = FIELD_TEXT[self.fields[
+                self.tail_position]](fields[self.tail_position])
+            text = self.spec_template % tuple(fields)
+        # repr() switches to exponent notation, which STEP writes as 1.E-05
+        if self.real_p and ('e-' in text or 'e+' in text):
+            text = self.template.format(*[
+                FIELD_TEXT[k](x) for k, x in zip(self.fields, values)])
+        return text
+
+    def relocate(self, record, entity_map):
+        fields = list(self.unpack(record))
+        for j in self.ref_positions:
+            fields[j] = entity_map[fields[j]]
+        if self.tail_position is not None and self.fields[
+                self.tail_position] == 'L':
+            fields[self.tail_position] = [
+                entity_map[k] for k in fields[self.tail_position]]
+        return self.pack(fields)
+
+    def parse(self, string_in):
+        match = self.pattern.fullmatch(string_in)
+        if match is None:
+            return None
+        return self.pack([FIELD_VALUES[k](x) for k, x in
+                          zip(self.fields, match.groups())])
+
+    def type_name(self, record):
+        if self.fields != 's':
+            return self.name
+        text = self.unpack(record)[0]
+        return text[:text.index('(')]
+
+
+# the kind codes are stored in the part cache: add new kinds at the end
+ENTITY_KIND_LIST = [
+    ('text', "{}", 's'),
+    ('point', "CARTESIAN_POINT('',({},{},{})) ;\n", 'ddd'),
+    ('line_origin', "CARTESIAN_POINT('Origin Line',({},{},{})) ;\n", 'ddd'),
+    ('line_direction', "DIRECTION('Vector Direction',({},{},{})) ;\n",
+     'ddd'),
+    ('vector', "VECTOR('Line Direction',{},1.) ;\n", 'r'),
+    ('line', "LINE('Line',{},{}) ;\n", 'rr'),
+    ('vertex_location', "CARTESIAN_POINT('Vertex',({},{},{})) ;\n", 'ddd'),
+    ('vertex', "VERTEX_POINT('',{}) ;\n", 'r'),
+    ('edge_curve', "EDGE_CURVE('',{},{},{},{}) ;\n", 'rrrb'),
+    ('oriented_edge', "ORIENTED_EDGE('',*,*,{},{}) ;\n", 'rb'),
+    ('edge_loop', "EDGE_LOOP('',({})) ;\n", 'L'),
+    ('circle', "CIRCLE('',{},{}) ;\n", 'rd'),
+    ('cylindrical_surface', "CYLINDRICAL_SURFACE('',{},{}) ;\n", 'rd'),
+    ('face_outer_bound', "FACE_OUTER_BOUND('',{},{}) ;\n", 'rb'),
+    ('axis_location', "CARTESIAN_POINT('Axis2P3D Location',({},{},{})) ;\n",
+     'ddd'),
+    ('axis_z_direction', "DIRECTION('Axis2P3D ZDirection',({},{},{})) ;\n",
+     'ddd'),
+    ('axis_x_direction', "DIRECTION('Axis2P3D XDirection',({},{},{})) ;\n",
+     'ddd'),
+    ('axis2_placement_3d', "AXIS2_PLACEMENT_3D('Plane Axis2P3D',{},{},{}) ;\n",
+     'rrr'),
+    ('plane', "PLANE('',{}) ;\n", 'r'),
+    ('advanced_face', "ADVANCED_FACE('PartBody',({}),{},{}) ;\n", 'Lrb'),
+    ('closed_shell', "CLOSED_SHELL('Closed Shell',({})) ;\n", 'L'),
+    ('manifold_solid_brep', "MANIFOLD_SOLID_BREP('PartBody.{}',{}) ;\n",
+     'ir'),
+    ('advanced_brep_shape_representation',
+     "ADVANCED_BREP_SHAPE_REPRESENTATION('NONE',({}),{}) ;\n", 'Lr'),
+    ('shape_representation_relationship',
+     "SHAPE_REPRESENTATION_RELATIONSHIP(' ',' ',{},{}) ;\n", 'rr'),
+    ('representation_map', "REPRESENTATION_MAP({},{}) ;\n", 'rr'),
+    ('mapped_item', "MAPPED_ITEM('',{},{}) ;\n", 'rr'),
+    ('coordinates_list', "COORDINATES_LIST('',{},{}) ;\n", 'iD'),
+    ('triangulated_face', "TRIANGULATED_FACE('',{},{},(),$,(),{}) ;\n",
+     'riT'),
+    ('tessellated_solid', "TESSELLATED_SOLID('PartBody.{}',({}),$) ;\n",
+     'iL'),
+    ('tessellated_shape_representation',
+     "TESSELLATED_SHAPE_REPRESENTATION('NONE',({}),{}) ;\n", 'Lr'),
+    ('face_bound', "FACE_BOUND('',{},{}) ;\n", 'rb')]
+ENTITY_KINDS = {name: EntityKind(code, template, fields) for
+                code, (name, template, fields) in enumerate(ENTITY_KIND_LIST)}
+ENTITY_KIND_CODES = sorted(ENTITY_KINDS.values(), key=lambda x: x.code)
+ENTITY_TYPE_KINDS = {}
+for entity_kind in ENTITY_KIND_CODES[1:]:
+    ENTITY_TYPE_KINDS.setdefault(entity_kind.name, []).append(entity_kind)
+
+
+def entity_record(kind_name, *fields):
+    return ENTITY_KINDS[kind_name].pack(fields)
+
+
+def relocate_entity(record, entity_map):
+    return ENTITY_KIND_CODES[record[0]].relocate(record, entity_map)
+
+
+def parse_entity(string_in):
+    for entity_kind in ENTITY_TYPE_KINDS.get(
+            string_in[:string_in.find('(')], []):
+        record = entity_kind.parse(string_in)
+        if record is not None and entity_kind.render(record) == string_in:
+            return record
+    return entity_record('text', string_in)
+
+
 def normalize(vector_in):
     if len(vector_in) != 3:
-        print('normalize: Error. Coordinates not 3D.')
-        sys.exit()
-    magnitude = math.sqrt(sum([i ** 2 for i in vector_in]))
+        raise StepfgError('normalize: Error. Coordinates not 3D.')
+    magnitude = math.sqrt(sum([i * i for i in vector_in]))
+    if magnitude == 0:
+        raise StepfgError('normalize: Error. Zero-length vector.')
     return [x / magnitude for x in vector_in]
 
 
@@ -120,200 +720,12 @@ def cross_product(x, y):
             -x[1] * y[0] + x[0] * y[1]]
 
 
-def point(coord_in):
-    return new_item("CARTESIAN_POINT('',(" + to_coord(coord_in) + ")) ;\n")
-
-
-def line(origin, direction):
-    coord_ln = new_item(
-        "CARTESIAN_POINT('Origin Line',(" + to_coord(origin) + ")) ;\n")
-    dir_ln = new_item("DIRECTION('Vector Direction',(" + to_coord(
-        normalize(direction)) + ")) ;\n")
-    vec_ln = new_item("VECTOR('Line Direction',#" + str(dir_ln) + ",1.) ;\n")
-    return new_item(
-        "LINE('Line',#" + str(coord_ln) + ",#" + str(vec_ln) + ") ;\n")
-
-
-def vertex(coord_in):
-    coord_ln = new_item(
-        "CARTESIAN_POINT('Vertex',(" + to_coord(coord_in) + ")) ;\n")
-    return new_item("VERTEX_POINT('',#" + str(coord_ln) + ") ;\n")
-
-
-def edge_curve(vertex1_ln, vertex2_ln, line_coord_ln, same_sense=True):
-    return new_item(
-        "EDGE_CURVE('',#" + str(vertex1_ln) + ",#" + str(
-            vertex2_ln) + ",#" + str(line_coord_ln) + "," + fort_bool(
-            same_sense) + ") ;\n")
-
-
-def edge_curve_0(vertex1, vertex2, same_sense=True):
-    return edge_curve(vertex(vertex1), vertex(vertex2), line(
-        [x / 2 for x in list(map(operator.add, vertex1, vertex2))],
-        list(map(operator.sub, vertex2, vertex1))),
-                      fort_bool(same_sense))
-
-
-def oriented_edge(edge_curve_ln, same_sense=True):
-    return new_item(
-        "ORIENTED_EDGE('',*,*,#" + str(edge_curve_ln) + "," + fort_bool(
-            same_sense) + ") ;\n")
-
-
-def edge_loop(lines):
-    return new_item("EDGE_LOOP('',(" + to_step_list(lines) + ")) ;\n")
-
-
-def edge_loop_0(vertices):
-    return edge_loop(list(
-        map(lambda x1, x2: oriented_edge(edge_curve_0(x1, x2)), vertices,
-            rotate(vertices, -1))))
-
-
-def face_outer_bound(edge_loop_ln, same_sense: True):
-    return new_item(
-        "FACE_OUTER_BOUND('',#" + str(edge_loop_ln) + "," + fort_bool(
-            same_sense) + ") ;\n")
-
-
-def edge_loop_1(vertices, same_sense: True):
-    return face_outer_bound(edge_loop_0(vertices), same_sense)
-
-
-def axis2_placement_3d(origin_coord, direction1, direction2):
-    origin_ln = new_item("CARTESIAN_POINT('Axis2P3D Location',(" + to_coord(
-        origin_coord) + ")) ;\n")
-    direction1_ln = new_item(
-        "DIRECTION('Axis2P3D ZDirection',(" + to_coord(direction1) + ")) ;\n")
-    direction2_ln = new_item(
-        "DIRECTION('Axis2P3D XDirection',(" + to_coord(direction2) + ")) ;\n")
-    return new_item(
-        "AXIS2_PLACEMENT_3D('Plane Axis2P3D',#" + str(origin_ln) + ",#" + str(
-            direction1_ln) + ",#" + str(
-            direction2_ln) + ") ;\n")
-
-
-def plane(axis2_placement_3d_ln):
-    return new_item("PLANE('',#" + str(axis2_placement_3d_ln) + ") ;\n")
-
-
-def plane_0(origin_coord, direction1, direction2):
-    return plane(axis2_placement_3d(origin_coord, direction1, direction2))
-
-
-def advanced_face(face_outer_bound_ln, plane_ln, same_sense_plane=True):
-    return new_item(
-        "ADVANCED_FACE('PartBody',(" + to_step_list(
-            face_outer_bound_ln) + "),#" + str(plane_ln) + "," + fort_bool(
-            same_sense_plane) + ") ;\n")
-
-
-def advanced_face_0(vertices, zaxis, same_sense_1=True, same_sense_2=True):
-    if list(map(operator.add, normalize(zaxis), normalize(
-            cross_product(list(map(operator.sub, vertices[2], vertices[1])),
-                          list(map(operator.sub, vertices[2],
-                                   vertices[0])))))) == [0, 0, 0]:
-        af_ln = advanced_face(edge_loop_1(vertices, same_sense_1), plane(
-            axis2_placement_3d(vertices[0], normalize(zaxis),
-                               normalize(list(map(operator.sub, vertices[1],
-                                                  vertices[0]))))),
-                              same_sense_2)
-    else:
-        af_ln = advanced_face(
-            edge_loop_1(list(reversed(vertices)), same_sense_1), plane(
-                axis2_placement_3d(vertices[0], normalize(zaxis), normalize(
-                    list(map(operator.sub, list(reversed(vertices))[1],
-                             list(reversed(vertices))[0]))))), same_sense_2)
-    return af_ln
-
-
-def advanced_face_1(vertices, same_sense_1=True, same_sense_2=True):
-    return advanced_face(edge_loop_1(vertices, same_sense_1),
-                         plane(axis2_placement_3d(vertices[0], normalize(
-                             cross_product(list(
-                                 map(operator.sub, vertices[2], vertices[1])),
-                                 list(map(operator.sub, vertices[1],
-                                          vertices[0])))), normalize(
-                             list(map(operator.sub, vertices[1],
-                                      vertices[0]))))), same_sense_1)
-
-
-def closed_shell(advanced_face_ln_list):
-    return new_item("CLOSED_SHELL('Closed Shell',(" + to_step_list(
-        advanced_face_ln_list) + ")) ;\n")
-
-
-def manifold_solid_brep(closed_shell_ln):
-    global part_body_index
-    msb = new_item(
-        "MANIFOLD_SOLID_BREP('PartBody." + str(part_body_index) + "',#" + str(
-            closed_shell_ln) + ") ;\n")
-    part_body_index += 1
-    return msb
-
-
-def advanced_brep_shape_representation(manifold_solid_brep_list, init_ln=45):
-    return new_item(
-        "ADVANCED_BREP_SHAPE_REPRESENTATION('NONE',(" + to_step_list(
-            manifold_solid_brep_list) + "),#" + str(
-            init_ln) + ") ;\n")
-
-
-def shape_representation_relationship(advanced_brep_shape_representation_ln,
-                                      shape_representation_ln=48):
-    return new_item("SHAPE_REPRESENTATION_RELATIONSHIP(' ',' ',#" + str(
-        shape_representation_ln) + ",#" + str(
-        advanced_brep_shape_representation_ln) + ") ;\n")
-
-
-def zface(vertex1, vertex2, geom_depth_list):
-    z_neg = geom_depth_list[0]
-    z_pos = geom_depth_list[1]
-    return advanced_face_0(
-        [list(map(operator.add, vertex1, [0, 0, z_neg])),
-         list(map(operator.add, vertex2, [0, 0, z_neg])),
-         list(map(operator.add, vertex2, [0, 0, z_pos])),
-         list(map(operator.add, vertex1, [0, 0, z_pos]))],
-        normalize(cross_product(list(map(operator.sub, vertex2, vertex1)),
-                                [0, 0, -(z_pos - z_neg)])))
-
-
-def xyface(vertex_list, depth, zdir):
-    return advanced_face_0(list(
-        map(lambda x: list(map(operator.add, x, [0, 0, depth])), vertex_list)),
-        zdir)
-
-
-def af2d3d(vertex_list, geom_depth_list):
-    taflist = []
-    z_neg = geom_depth_list[0]
-    z_pos = geom_depth_list[1]
-    taflist.append(xyface(vertex_list, z_pos, [0, 0, 1]))
-    taflist.append(xyface(vertex_list, z_neg, [0, 0, -1]))
-    taflist += list(
-        map(lambda x1, x2: zface(x1, x2, geom_depth_list), vertex_list,
-            rotate(vertex_list, -1)))
-    return taflist
-
-
-def af_list_2_assembly(af_list):
-    return shape_representation_relationship(
-        manifold_solid_brep(closed_shell(af_list)))
-
-
-def af_list_2_part(af_list):
-    return manifold_solid_brep(closed_shell(af_list))
-
-
-def part_2_assembly(part_list):
-    return shape_representation_relationship(
-        advanced_brep_shape_representation(part_list))
-
-
-def generate_part(vert_list, geom_depth, clockwise_p=True):
-    return af_list_2_part(
-        af2d3d(vert_list, geom_depth)) if clockwise_p else af_list_2_part(
-        af2d3d(reversed(vert_list), geom_depth))
+def loop_normal(vertex_list):
+    # Newell's method: twice the vector area of a planar loop, pointing to
+    # the side from which the loop runs counter-clockwise
+    return [sum((x1[j] - x2[j]) * (x1[k] + x2[k]) for x1, x2 in zip(
+        vertex_list, rotate(vertex_list, -1))) for j, k in
+            [(1, 2), (2, 0), (0, 1)]]
 
 
 def convert_3d(element_in):
@@ -330,97 +742,109 @@ def convert_to_clockwise(part_list):
         map(lambda x1, x2: (x2[0] - x1[0]) * (x2[1] + x1[1]), part_list,
             rotate(part_list, 1))))
     if pol_sum == 0:
-        print(
-            "[FAILED]\nconvert_to_clockwise: Error. Polygon is" +
+        raise StepfgError(
+            "convert_to_clockwise: Error. Polygon is" +
             " neither clockwise nor counter-clockwise.")
-        sys.exit()
     elif pol_sum > 0:
         return reversed(part_list)
     else:
         return part_list
 
 
-def generate_assembly(list_vert_list, geom_depth_list, p_coeff=1):
-    print("Generating assembly... ", end="")
+def check_assembly_input(list_vert_list, geom_depth_list, p_coeff=1):
     if not isinstance(p_coeff, Number):
-        print(
-            "[FAILED]\ngenerate_assembly: Error. NaN supplied for" +
+        raise StepfgError(
+            "generate_assembly: Error. NaN supplied for" +
             " proportionality coefficient.")
-        sys.exit()
     if p_coeff == 0:
-        print(
-            "[FAILED]\ngenerate_assembly: Error. Zero supplied as" +
+        raise StepfgError(
+            "generate_assembly: Error. Zero supplied as" +
             " the proportionality coefficient.")
-        sys.exit()
     if not isinstance(geom_depth_list, list):
-        print(
-            "[FAILED]\ngenerate_assembly: Error. z-coordinate interval" +
+        raise StepfgError(
+            "generate_assembly: Error. z-coordinate interval" +
             " [z1, z2] expected, scalar supplied.")
-        sys.exit()
     if not geom_depth_list:
-        print(
-            "[FAILED]\ngenerate_assembly: Error. z-coordinate interval" +
+        raise StepfgError(
+            "generate_assembly: Error. z-coordinate interval" +
             " [z1, z2] expected, empty list supplied.")
-        sys.exit()
     for depth_element in geom_depth_list:
         if not isinstance(depth_element, Number):
-            print(
-                "[FAILED]\ngenerate_assembly: Error. NaN found in the" +
+            raise StepfgError(
+                "generate_assembly: Error. NaN found in the" +
                 " z-coodinate interval.")
-            sys.exit()
     if geom_depth_list[0] == geom_depth_list[1]:
-        print(
-            "[FAILED]\ngenerate_assembly: Error. z2 must be different" +
+        raise StepfgError(
+            "generate_assembly: Error. z2 must be different" +
             " from z1 in the z-coordinate interval [z1, z2].")
-        sys.exit()
     if geom_depth_list[0] > geom_depth_list[1]:
-        tvar = geom_depth_list[0]
-        geom_depth_list[0] = geom_depth_list[1]
-        geom_depth_list[1] = tvar
+        geom_depth_list = [geom_depth_list[1], geom_depth_list[0]]
     if not isinstance(list_vert_list, list):
-        print(
-            "[FAILED]\ngenerate_assembly: Error. List of vertices lists" +
+        raise StepfgError(
+            "generate_assembly: Error. List of vertices lists" +
             " expected, scalar supplied.")
-        sys.exit()
     if not list_vert_list:
-        print(
-            "[FAILED]\ngenerate_assembly: Error. Empty list of vertices" +
+        raise StepfgError(
+            "generate_assembly: Error. Empty list of vertices" +
             " lists.")
-        sys.exit()
     for part_element in list_vert_list:
+        if np is not None and isinstance(part_element, np.ndarray):
+            check_polygon_array(part_element)
+            continue
         if not part_element:
-            print(
-                "[FAILED]\ngenerate_assembly: Error. Empty list of" +
+            raise StepfgError(
+                "generate_assembly: Error. Empty list of" +
                 " vertices.")
-            sys.exit()
         if not isinstance(part_element, list):
-            print(
-                "[FAILED]\ngenerate_assembly: Error. List of vertices" +
+            raise StepfgError(
+                "generate_assembly: Error. List of vertices" +
                 " expected, scalar supplied")
-            sys.exit()
         for vertex_element in part_element:
             if not vertex_element:
-                print(
-                    "[FAILED]\ngenerate_assembly: Error. Empty list of" +
+                raise StepfgError(
+                    "generate_assembly: Error. Empty list of" +
                     "vertex coordinates.")
-                sys.exit()
             if not isinstance(part_element, list):
-                print(
-                    "[FAILED]\ngenerate_assembly: Error. List of vertex" +
+                raise StepfgError(
+                    "generate_assembly: Error. List of vertex" +
                     " coordinates expected, scalar supplied")
-                sys.exit()
             if (len(vertex_element) < 2) or (len(vertex_element) > 3):
-                print(
-                    "[FAILED]\ngenerate_assembly: Error. Number of vertex" +
+                raise StepfgError(
+                    "generate_assembly: Error. Number of vertex" +
                     " coordinates should be 2 or 3, " + str(
                         len(vertex_element)) + " coordinates supplied.")
-                sys.exit()
             for coordinate_element in vertex_element:
                 if not isinstance(coordinate_element, Number):
-                    print(
-                        "[FAILED]\ngenerate_assembly: Error. NaN is supplied" +
+                    raise StepfgError(
+                        "generate_assembly: Error. NaN is supplied" +
                         " for a vertex coordinate.")
-                    sys.exit()
+    return geom_depth_list
+
+
+def check_polygon_array(part_array):
+    if part_array.ndim != 2 or not len(part_array):
+        raise StepfgError(
+            "generate_assembly: Error. Empty list of" +
+            " vertices.")
+    if (part_array.shape[1] < 2) or (part_array.shape[1] > 3):
+        raise StepfgError(
+            "generate_assembly: Error. Number of vertex" +
+            " coordinates should be 2 or 3, " + str(
+                part_array.shape[1]) + " coordinates supplied.")
+    if not np.all(np.isfinite(part_array)):
+        raise StepfgError(
+            "generate_assembly: Error. NaN is supplied" +
+            " for a vertex coordinate.")
+
+
+def prepare_assembly_input(list_vert_list, geom_depth_list, p_coeff=1,
+                           validate=True):
+    if validate:
+        geom_depth_list = check_assembly_input(list_vert_list,
+                                               geom_depth_list, p_coeff)
+    list_vert_list = [
+        part_element.tolist() if hasattr(part_element, 'tolist') else
+        part_element for part_element in list_vert_list]
     list_vert_list = [
         [convert_3d(vertex_element) for vertex_element in part_element] for
         part_element in
@@ -431,158 +855,2789 @@ def generate_assembly(list_vert_list, geom_depth_list, p_coeff=1):
           vertex_element] for vertex_element in
          part_element] for part_element in list_vert_list]
     geom_depth_list = [p_coeff * 1.0 * i for i in geom_depth_list]
-    part_list = [generate_part(x, geom_depth_list) for x in list_vert_list]
-    part_2_assembly(part_list)
-    resulting_array = file_array[:index1] + work_array + file_array[
-                                                         index1 + 1:]
-    print("[DONE]")
-    print("Writing STEP file... ", end="")
-    with open(file_out_name, 'w+') as file_out:
-        for item in resulting_array:
-            file_out.write("%s" % item)
-    print("[DONE]")
-
-
-file_in2_name = 'part_geometry.txt'
-file_out_name = 'part_out.stp'
-
-print("----------------------------------------------------")
-print("                STEP File Generator")
-print("              E. Valetov and M. Berz")
-print("             Michigan State University")
-print("                Created 03-Feb-2017")
-print("              Email: valetove@msu.edu")
-print("----------------------------------------------------")
-
-if (len(sys.argv) > 1):
-    if ((str(sys.argv[1]) == '-h') or (str(sys.argv[1]) == '/h')):
+    return list_vert_list, geom_depth_list
+
+
+def require_numpy():
+    if np is None:
+        raise StepfgError(
+            "Error. The NumPy backend was requested, but numpy is not" +
+            " installed.")
+
+
+def polygon_array(part_element):
+    try:
+        part_array = np.asarray(part_element, dtype=float)
+    except ValueError:
+        part_array = None
+    if part_array is None or part_array.ndim != 2:
+        return np.array([convert_3d(list(vertex_element)) for vertex_element
+                         in part_element], dtype=float)
+    if part_array.shape[1] == 3:
+        return part_array
+    resulting_array = np.zeros((len(part_array), 3))
+    resulting_array[:, :2] = part_array
+    return resulting_array
+
+
+def convert_to_clockwise_array(part_array):
+    previous_array = np.roll(part_array, 1, axis=0)
+    pol_sum = np.sum((previous_array[:, 0] - part_array[:, 0]) * (
+            previous_array[:, 1] + part_array[:, 1]))
+    if pol_sum == 0:
+        raise StepfgError(
+            "convert_to_clockwise: Error. Polygon is" +
+            " neither clockwise nor counter-clockwise.")
+    elif pol_sum > 0:
+        return part_array[::-1]
+    else:
+        return part_array
+
+
+def prepare_assembly_arrays(list_vert_list, geom_depth_list, p_coeff=1,
+                            validate=True):
+    require_numpy()
+    if validate:
+        geom_depth_list = check_assembly_input(list_vert_list,
+                                               geom_depth_list, p_coeff)
+    list_vert_list = [
+        (p_coeff * 1.0) * convert_to_clockwise_array(
+            polygon_array(part_element)) for part_element in list_vert_list]
+    geom_depth_list = [p_coeff * 1.0 * i for i in geom_depth_list]
+    return list_vert_list, geom_depth_list
+
+
+def normalize_rows(vectors_in):
+    magnitude = np.sqrt(vectors_in[..., 0] * vectors_in[..., 0] + vectors_in[
+        ..., 1] * vectors_in[..., 1] + vectors_in[..., 2] * vectors_in[..., 2])
+    if not np.all(magnitude):
+        raise StepfgError('normalize: Error. Zero-length vector.')
+    return vectors_in / magnitude[..., None]
+
+
+def cross_product_rows(x, y):
+    return np.stack([-x[..., 2] * y[..., 1] + x[..., 1] * y[..., 2],
+                     x[..., 2] * y[..., 0] - x[..., 0] * y[..., 2],
+                     -x[..., 1] * y[..., 0] + x[..., 0] * y[..., 1]], -1)
+
+
+def loop_normal_rows(vertex_rows):
+    difference_rows = vertex_rows - np.roll(vertex_rows, -1, axis=0)
+    sum_rows = vertex_rows + np.roll(vertex_rows, -1, axis=0)
+    return [float(np.sum(difference_rows[:, j] * sum_rows[:, k])) for j, k in
+            [(1, 2), (2, 0), (0, 1)]]
+
+
+def coord_rows(coords_in):
+    return coords_in.reshape(-1, 3).tolist()
+
+
+def record_rows(kind_name, coords_in):
+    # packed records of a kind with three real fields, built in bulk from
+    # the rows of an array; adding 0.0 turns -0.0 into 0.0 as pack does
+    entity_kind = ENTITY_KINDS[kind_name]
+    record_array = np.empty(coords_in.size // 3, np.dtype(
+        [('code', 'u1'), ('values', '<f8', 3)]))
+    record_array['code'] = entity_kind.code
+    record_array['values'] = coords_in.reshape(-1, 3) + 0.0
+    record_data = record_array.tobytes()
+    record_size = record_array.itemsize
+    return [record_data[k:k + record_size] for k in
+            range(0, len(record_data), record_size)]
+
+
+def weld_vertices(list_vert_list, tolerance=DISTANCE_ACCURACY):
+    grid = {}
+    welded_count = 0
+    removed_count = 0
+    resulting_list = []
+    for part_element in list_vert_list:
+        if hasattr(part_element, 'tolist'):
+            part_element = part_element.tolist()
+        welded_part = []
+        for vertex_element in part_element:
+            cell = [math.floor(x / tolerance) for x in vertex_element]
+            representative = None
+            for dx, dy, dz in NEIGHBOUR_CELLS:
+                for candidate in grid.get(
+                        (cell[0] + dx, cell[1] + dy, cell[2] + dz), ()):
+                    if math.dist(candidate, vertex_element) <= tolerance:
+                        representative = candidate
+                        break
+                if representative is not None:
+                    break
+            if representative is None:
+                representative = list(vertex_element)
+                grid.setdefault(tuple(cell), []).append(representative)
+            elif representative != vertex_element:
+                welded_count += 1
+            if welded_part and welded_part[-1] is representative:
+                removed_count += 1
+            else:
+                welded_part.append(representative)
+        while len(welded_part) > 1 and welded_part[0] is welded_part[-1]:
+            welded_part.pop()
+            removed_count += 1
+        if len(welded_part) < 3:
+            raise StepfgError(
+                "weld_vertices: Error. Polygon collapses to fewer than" +
+                " three vertices after welding.")
+        resulting_list.append(welded_part)
+    return resulting_list, welded_count, removed_count
+
+
+def collinear_q(vertex1, vertex2, vertex3):
+    edge1 = list(map(operator.sub, vertex2, vertex1))
+    edge2 = list(map(operator.sub, vertex3, vertex2))
+    return cross_product(edge1, edge2) == [0, 0, 0] and sum(
+        map(operator.mul, edge1, edge2)) > 0
+
+
+def remove_collinear(part_list):
+    resulting_list = []
+    for vertex_element in part_list:
+        while len(resulting_list) > 1 and collinear_q(
+                resulting_list[-2], resulting_list[-1], vertex_element):
+            resulting_list.pop()
+        resulting_list.append(vertex_element)
+    while len(resulting_list) > 3 and collinear_q(
+            resulting_list[-2], resulting_list[-1], resulting_list[0]):
+        resulting_list.pop()
+    while len(resulting_list) > 3 and collinear_q(
+            resulting_list[-1], resulting_list[0], resulting_list[1]):
+        resulting_list.pop(0)
+    return resulting_list
+
+
+def segment_deviation(part_list, index1, index2):
+    start = part_list[index1]
+    segment = list(map(operator.sub, part_list[index2], start))
+    segment_length2 = segment[0] * segment[0] + segment[1] * segment[
+        1] + segment[2] * segment[2]
+    max_deviation = -1.0
+    max_index = index1
+    for k in range(index1 + 1, index2):
+        offset = list(map(operator.sub, part_list[k], start))
+        t = 0.0 if segment_length2 == 0 else min(max((
+            offset[0] * segment[0] + offset[1] * segment[1] + offset[2] *
+            segment[2]) / segment_length2, 0.0), 1.0)
+        offset = [x - t * y for x, y in zip(offset, segment)]
+        deviation = math.sqrt(offset[0] * offset[0] + offset[1] * offset[
+            1] + offset[2] * offset[2])
+        if deviation > max_deviation:
+            max_deviation = deviation
+            max_index = k
+    return max_deviation, max_index
+
+
+def segment_deviation_array(part_array, index1, index2):
+    if index2 - index1 < 2:
+        return -1.0, index1
+    start = part_array[index1]
+    segment = part_array[index2] - start
+    segment_length2 = segment[0] * segment[0] + segment[1] * segment[
+        1] + segment[2] * segment[2]
+    offsets = part_array[index1 + 1:index2] - start
+    t = np.zeros(len(offsets)) if segment_length2 == 0 else np.clip((
+        offsets[:, 0] * segment[0] + offsets[:, 1] * segment[1] + offsets[
+            :, 2] * segment[2]) / segment_length2, 0.0, 1.0)
+    offsets = offsets - t[:, None] * segment
+    deviations = np.sqrt(offsets[:, 0] * offsets[:, 0] + offsets[:, 1] *
+                         offsets[:, 1] + offsets[:, 2] * offsets[:, 2])
+    k = int(np.argmax(deviations))
+    return float(deviations[k]), index1 + 1 + k
+
+
+def douglas_peucker(part_list, tolerance):
+    if np is not None and isinstance(part_list, np.ndarray):
+        deviation_function = segment_deviation_array
+        closed_list = np.concatenate([part_list, part_list[:1]])
+        offsets = part_list - part_list[0]
+        far_index = int(np.argmax(
+            offsets[:, 0] * offsets[:, 0] + offsets[:, 1] * offsets[:, 1] +
+            offsets[:, 2] * offsets[:, 2]))
+    else:
+        deviation_function = segment_deviation
+        closed_list = part_list + part_list[:1]
+        far_index = max(range(len(part_list)), key=lambda k: sum(
+            [i * i for i in map(operator.sub, part_list[k], part_list[0])]))
+    keep = [False] * len(part_list)
+    keep[0] = keep[far_index] = True
+    stack = [(0, far_index), (far_index, len(part_list))]
+    while stack:
+        index1, index2 = stack.pop()
+        if index2 - index1 < 2:
+            continue
+        max_deviation, max_index = deviation_function(closed_list, index1,
+                                                      index2)
+        if max_deviation > tolerance:
+            keep[max_index] = True
+            stack.append((index1, max_index))
+            stack.append((max_index, index2))
+    if sum(keep) < 3:
+        keep[max(deviation_function(closed_list, 0, far_index),
+                 deviation_function(closed_list, far_index,
+                                    len(part_list)))[1]] = True
+    if deviation_function is segment_deviation_array:
+        return part_list[np.array(keep)]
+    return [vertex_element for vertex_element, keep_p in zip(part_list, keep)
+            if keep_p]
+
+
+def simplify_polygons(list_vert_list, tolerance=0):
+    removed_count = 0
+    resulting_list = []
+    for part_element in list_vert_list:
+        array_p = np is not None and isinstance(part_element, np.ndarray)
+        part_list = remove_collinear(
+            part_element.tolist() if array_p else part_element)
+        if array_p:
+            part_list = np.array(part_list)
+        if tolerance and len(part_list) > 3:
+            part_list = douglas_peucker(part_list, tolerance)
+        removed_count += len(part_element) - len(part_list)
+        resulting_list.append(part_list)
+    return resulting_list, removed_count
+
+
+def orientation(vertex1, vertex2, vertex3):
+    left = (vertex2[0] - vertex1[0]) * (vertex3[1] - vertex1[1])
+    right = (vertex2[1] - vertex1[1]) * (vertex3[0] - vertex1[0])
+    value = left - right
+    if (left or right) and abs(value) <= 1e-15 * (
+            abs(left) + abs(right)) and vertex3[:2] != vertex1[:2] and \
+            vertex3[:2] != vertex2[:2]:
+        # too close to call in floating point: decide exactly
+        vertex1, vertex2, vertex3 = [[Fraction(x) for x in k[:2]] for k in
+                                     [vertex1, vertex2, vertex3]]
+        value = (vertex2[0] - vertex1[0]) * (vertex3[1] - vertex1[1]) - (
+                vertex2[1] - vertex1[1]) * (vertex3[0] - vertex1[0])
+    return (value > 0) - (value < 0)
+
+
+def on_segment_q(vertex1, vertex2, vertex3):
+    return min(vertex1[0], vertex2[0]) <= vertex3[0] <= max(
+        vertex1[0], vertex2[0]) and min(vertex1[1], vertex2[1]) <= vertex3[
+        1] <= max(vertex1[1], vertex2[1])
+
+
+def segments_intersect_q(vertex1, vertex2, vertex3, vertex4, proper=False):
+    o1 = orientation(vertex1, vertex2, vertex3)
+    o2 = orientation(vertex1, vertex2, vertex4)
+    o3 = orientation(vertex3, vertex4, vertex1)
+    o4 = orientation(vertex3, vertex4, vertex2)
+    if o1 * o2 < 0 and o3 * o4 < 0:
+        return True
+    if proper:
+        return False
+    return (o1 == 0 and on_segment_q(vertex1, vertex2, vertex3)) or (
+            o2 == 0 and on_segment_q(vertex1, vertex2, vertex4)) or (
+            o3 == 0 and on_segment_q(vertex3, vertex4, vertex1)) or (
+            o4 == 0 and on_segment_q(vertex3, vertex4, vertex2))
+
+
+def sweep_below_q(segment1, segment2):
+    # order of two active, non-crossing segments along the sweep line
+    if segment1[0][0] < segment2[0][0]:
+        return not sweep_below_q(segment2, segment1)
+    if segment2[0][0] == segment2[1][0]:
+        return segment1[0][1] < segment2[0][1] or (
+                segment1[0][1] == segment2[0][1] and
+                segment1[0][0] != segment1[1][0])
+    side = orientation(segment2[0], segment2[1], segment1[0])
+    if side == 0:
+        side = orientation(segment2[0], segment2[1], segment1[1])
+    return side < 0
+
+
+class SweepStatus:
+    # Skip list of the active segments in sweep order. Every node is linked
+    # both ways on each of its levels and kept per segment, so a segment is
+    # inserted after O(log n) expected comparisons, and removed or its
+    # neighbours found in O(log n) without any comparison.
+    max_level = 32
+
+    def __init__(self, below_q):
+        self.below_q = below_q
+        self.head = [None, [None] * self.max_level, []]
+        self.level = 1
+        self.nodes = {}
+        self.random = random.Random(0)
+
+    def insert(self, key):
+        height = 1
+        while height < self.max_level and self.random.random() < 0.5:
+            height += 1
+        self.level = max(self.level, height)
+        node = [key, [None] * height, [None] * height]
+        current = self.head
+        for i in range(self.level - 1, -1, -1):
+            while current[1][i] is not None and self.below_q(
+                    current[1][i][0], key):
+                current = current[1][i]
+            if i < height:
+                node[1][i] = current[1][i]
+                node[2][i] = current
+                if current[1][i] is not None:
+                    current[1][i][2][i] = node
+                current[1][i] = node
+        self.nodes[key] = node
+
+    def remove(self, key):
+        node = self.nodes.pop(key)
+        for i in range(len(node[1])):
+            node[2][i][1][i] = node[1][i]
+            if node[1][i] is not None:
+                node[1][i][2][i] = node[2][i]
+
+    def neighbours(self, key):
+        node = self.nodes[key]
+        return node[2][0][0], None if node[1][0] is None else node[1][0][0]
+
+
+def sweep_intersection(segment_list, intersect_q):
+    # Shamos-Hoey sweep over segments (vertex1, vertex2, ...) with vertex1
+    # lexicographically smaller; returns the first intersecting pair found,
+    # in O(n log n)
+    event_list = []
+    for k, segment in enumerate(segment_list):
+        event_list.append((segment[0][0], 0, segment[0][1], k))
+        event_list.append((segment[1][0], 1, segment[1][1], k))
+    event_list.sort()
+    status = SweepStatus(lambda k1, k2: sweep_below_q(segment_list[k1],
+                                                      segment_list[k2]))
+    for _, event_type, _, k in event_list:
+        if event_type == 0:
+            status.insert(k)
+            for neighbour in status.neighbours(k):
+                if neighbour is not None and intersect_q(k, neighbour):
+                    return k, neighbour
+            continue
+        below, above = status.neighbours(k)
+        if below is not None and above is not None and intersect_q(
+                below, above):
+            return below, above
+        status.remove(k)
+    return None
+
+
+def intersecting_pairs(segment_list, intersect_q):
+    # every intersecting pair, from a sweep over the x extents of the
+    # segments; the cost grows with the pairs whose extents overlap, so it
+    # is only run once sweep_intersection has found a defect
+    pair_list = []
+    active_list = []
+    for k in sorted(range(len(segment_list)),
+                    key=lambda j: segment_list[j][0][0]):
+        segment = segment_list[k]
+        active_list = [j for j in active_list if
+                       segment_list[j][1][0] >= segment[0][0]]
+        for j in active_list:
+            other = segment_list[j]
+            if max(segment[0][1], segment[1][1]) >= min(
+                    other[0][1], other[1][1]) and max(
+                    other[0][1], other[1][1]) >= min(
+                    segment[0][1], segment[1][1]) and intersect_q(j, k):
+                pair_list.append(tuple(sorted((j, k))))
+        active_list.append(k)
+    return sorted(pair_list)
+
+
+def polygon_segments(part_list, part_index=0):
+    return [tuple(sorted((part_list[k][:2], part_list[
+        (k + 1) % len(part_list)][:2]))) + (part_index, k) for k in
+            range(len(part_list))]
+
+
+def self_intersections(part_list):
+    # every pair of intersecting segments, sorted
+    n = len(part_list)
+    segment_list = polygon_segments(part_list)
+
+    def intersect_q(segment1_index, segment2_index):
+        if (segment2_index - segment1_index) % n == 1:
+            shared = part_list[segment2_index]
+            vertex1 = part_list[segment1_index]
+            vertex2 = part_list[(segment2_index + 1) % n]
+        elif (segment1_index - segment2_index) % n == 1:
+            return intersect_q(segment2_index, segment1_index)
+        else:
+            return segments_intersect_q(*segment_list[segment1_index][:2],
+                                        *segment_list[segment2_index][:2])
+        # adjacent segments only intersect where the contour folds back
+        return (orientation(vertex1, shared, vertex2) == 0 and on_segment_q(
+            vertex1, shared, vertex2)) or (orientation(
+                shared, vertex2, vertex1) == 0 and on_segment_q(
+                    shared, vertex2, vertex1))
+
+    if sweep_intersection(segment_list, intersect_q) is None:
+        return []
+    return intersecting_pairs(segment_list, intersect_q)
+
+
+def polygon_area(part_list):
+    # signed area, positive for a counter-clockwise polygon
+    return sum((part_list[k - 1][0] - part_list[k][0]) * (
+            part_list[k - 1][1] + part_list[k][1]) for k in
+               range(len(part_list))) / 2
+
+
+def interior_point(part_list):
+    vertex1 = part_list[0]
+    vertex2 = part_list[1]
+    pol_sum = sum((part_list[k - 1][0] - part_list[k][0]) * (
+            part_list[k - 1][1] + part_list[k][1]) for k in
+                  range(len(part_list)))
+    side = 1e-6 if pol_sum < 0 else -1e-6
+    return [(vertex1[0] + vertex2[0]) / 2 + side * (vertex2[1] - vertex1[1]),
+            (vertex1[1] + vertex2[1]) / 2 - side * (vertex2[0] - vertex1[0])]
+
+
+def point_in_polygon_q(point, part_list):
+    inside_p = False
+    for k in range(len(part_list)):
+        vertex1 = part_list[k - 1]
+        vertex2 = part_list[k]
+        if (vertex1[1] > point[1]) != (vertex2[1] > point[1]) and point[0] < (
+                vertex2[0] - vertex1[0]) * (point[1] - vertex1[1]) / (
+                vertex2[1] - vertex1[1]) + vertex1[0]:
+            inside_p = not inside_p
+    return inside_p
+
+
+def polygon_overlap(list_vert_list, index1, index2):
+    segment_list = polygon_segments(list_vert_list[index1], index1) + \
+        polygon_segments(list_vert_list[index2], index2)
+
+    def intersect_q(segment1_index, segment2_index):
+        return segment_list[segment1_index][2] != segment_list[
+            segment2_index][2] and segments_intersect_q(
+            *segment_list[segment1_index][:2],
+            *segment_list[segment2_index][:2], True)
+
+    intersection = sweep_intersection(segment_list, intersect_q)
+    if intersection is not None:
+        segment1, segment2 = sorted(segment_list[k][2:] for k in
+                                    intersection)
+        return "segment " + str(segment1[1]) + " of polygon " + str(
+            segment1[0]) + " crosses segment " + str(
+            segment2[1]) + " of polygon " + str(segment2[0])
+    for inner_index, outer_index in [(index2, index1), (index1, index2)]:
+        if point_in_polygon_q(interior_point(list_vert_list[inner_index]),
+                              list_vert_list[outer_index]):
+            return "an interior point of polygon " + str(
+                inner_index) + " lies inside polygon " + str(outer_index)
+    return None
+
+
+def bounding_box(part_list):
+    return [min(x[0] for x in part_list), min(x[1] for x in part_list),
+            max(x[0] for x in part_list), max(x[1] for x in part_list)]
+
+
+def overlap_candidates(box_list):
+    # cell size: the mean box extent, but at most 64 cells across any box
+    extent_list = [max(x[2] - x[0], x[3] - x[1]) for x in box_list]
+    cell_size = max(sum(extent_list) / len(extent_list),
+                    max(extent_list) / 64) or 1.0
+    grid = {}
+    candidate_set = set()
+    for k, box in enumerate(box_list):
+        for cell_x in range(math.floor(box[0] / cell_size),
+                            math.floor(box[2] / cell_size) + 1):
+            for cell_y in range(math.floor(box[1] / cell_size),
+                                math.floor(box[3] / cell_size) + 1):
+                for j in grid.setdefault((cell_x, cell_y), []):
+                    other_box = box_list[j]
+                    if box[0] < other_box[2] and other_box[0] < box[2] and \
+                            box[1] < other_box[3] and other_box[1] < box[3]:
+                        candidate_set.add((j, k))
+                grid[(cell_x, cell_y)].append(k)
+    return sorted(candidate_set)
+
+
+def validate_polygons(list_vert_list, max_messages=20, overlap_p=True):
+    list_vert_list = [
+        part_element.tolist() if hasattr(part_element, 'tolist') else
+        [list(x) for x in part_element] for part_element in list_vert_list]
+    message_list = []
+    for k, part_list in enumerate(list_vert_list):
+        for intersection in self_intersections(part_list):
+            message_list.append(
+                "Polygon " + str(k) + ": segment " + str(
+                    intersection[0]) + " intersects segment " + str(
+                    intersection[1]) + ".")
+    for j, k in overlap_candidates(
+            [bounding_box(x) for x in list_vert_list]) if overlap_p else []:
+        overlap = polygon_overlap(list_vert_list, j, k)
+        if overlap is not None:
+            message_list.append("Polygons " + str(j) + " and " + str(
+                k) + " overlap: " + overlap + ".")
+    if message_list:
+        raise StepfgError(
+            "validate_polygons: Error. Invalid polygon geometry.\n    " +
+            "\n    ".join(message_list[:max_messages]) + (
+                "\n    ... and " + str(len(message_list) - max_messages) +
+                " more." if len(message_list) > max_messages else ""))
+
+
+def segment_distance(vertex, vertex1, vertex2):
+    # distance of vertex from the segment and the segment parameter of the
+    # nearest point
+    dx = vertex2[0] - vertex1[0]
+    dy = vertex2[1] - vertex1[1]
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else min(max((
+        (vertex[0] - vertex1[0]) * dx + (vertex[1] - vertex1[1]) * dy) /
+        length2, 0.0), 1.0)
+    return math.hypot(vertex1[0] + t * dx - vertex[0],
+                      vertex1[1] + t * dy - vertex[1]), t
+
+
+def crossing_point(vertex1, vertex2, vertex3, vertex4):
+    dx1 = vertex2[0] - vertex1[0]
+    dy1 = vertex2[1] - vertex1[1]
+    dx2 = vertex4[0] - vertex3[0]
+    dy2 = vertex4[1] - vertex3[1]
+    t = ((vertex3[0] - vertex1[0]) * dy2 - (vertex3[1] - vertex1[1]) * dx2) / (
+            dx1 * dy2 - dy1 * dx2)
+    u = ((vertex3[0] - vertex1[0]) * dy1 - (vertex3[1] - vertex1[1]) * dx1) / (
+            dx1 * dy2 - dy1 * dx2)
+    return t, u, (vertex1[0] + t * dx1, vertex1[1] + t * dy1,
+                  vertex1[2] + t * (vertex2[2] - vertex1[2]))
+
+
+def trace_loops(edge_dict):
+    # closed loops of directed edges; at a vertex with several outgoing
+    # edges, the first one clockwise from the incoming edge keeps the loop
+    # tight around the region on its left
+    out_dict = {}
+    for vertex1, vertex2 in edge_dict:
+        out_dict.setdefault(vertex1, []).append(vertex2)
+    used_set = set()
+    loop_list = []
+    for edge in edge_dict:
+        if edge in used_set:
+            continue
+        loop = []
+        vertex1, vertex2 = edge
+        while (vertex1, vertex2) not in used_set:
+            used_set.add((vertex1, vertex2))
+            loop.append(vertex1)
+            candidate_list = [k for k in out_dict[vertex2] if
+                              (vertex2, k) not in used_set]
+            if not candidate_list:
+                break
+            incoming = math.atan2(vertex1[1] - vertex2[1],
+                                  vertex1[0] - vertex2[0])
+            vertex1, vertex2 = vertex2, min(candidate_list, key=lambda k: (
+                incoming - math.atan2(k[1] - vertex2[1],
+                                      k[0] - vertex2[0])) % (2 * math.pi))
+        loop_list.append(loop)
+    return loop_list
+
+
+def union_polygons(list_vert_list, tolerance=DISTANCE_ACCURACY):
+    # Merges clockwise polygons that share boundary segments or overlap.
+    # Returns the resulting clockwise polygons, the counter-clockwise hole
+    # loops of each and the number of input polygons that were merged.
+    # Polygons without a partner are returned unchanged.
+    box_list = [[x[0] - tolerance, x[1] - tolerance, x[2] + tolerance,
+                 x[3] + tolerance] for x in map(bounding_box, list_vert_list)]
+    partner_dict = {}
+    for j, k in overlap_candidates(box_list):
+        partner_dict.setdefault(j, set()).add(k)
+        partner_dict.setdefault(k, set()).add(j)
+    if not partner_dict:
+        return list_vert_list, [[] for _ in list_vert_list], 0
+    # counter-clockwise loops of tuples, so that the interior of every
+    # polygon lies left of its edges; vertices within tolerance are snapped
+    snap_grid = {}
+
+    def snap(vertex):
+        cell = (math.floor(vertex[0] / tolerance),
+                math.floor(vertex[1] / tolerance))
+        for cell_x in (cell[0], cell[0] - 1, cell[0] + 1):
+            for cell_y in (cell[1], cell[1] - 1, cell[1] + 1):
+                for candidate in snap_grid.get((cell_x, cell_y), ()):
+                    if math.hypot(candidate[0] - vertex[0],
+                                  candidate[1] - vertex[1]) <= tolerance:
+                        return candidate
+        vertex = tuple(vertex)
+        snap_grid.setdefault(cell, []).append(vertex)
+        return vertex
+
+    loop_dict = {}
+    for k in sorted(partner_dict):
+        part_element = list_vert_list[k]
+        loop_dict[k] = [snap(x) for x in (part_element.tolist() if hasattr(
+            part_element, 'tolist') else part_element)[::-1]]
+    segment_list = [(loop[j], loop[(j + 1) % len(loop)], k) for k, loop in
+                    loop_dict.items() for j in range(len(loop))]
+    parent_list = list(range(len(list_vert_list)))
+
+    def find(k):
+        while parent_list[k] != k:
+            parent_list[k] = parent_list[parent_list[k]]
+            k = parent_list[k]
+        return k
+
+    def join(j, k):
+        parent_list[find(j)] = find(k)
+
+    # split the segments where another polygon touches or crosses them
+    split_list = [[] for _ in segment_list]
+    for j, k in overlap_candidates([[
+            min(x[0][0], x[1][0]) - tolerance, min(x[0][1], x[1][1]) -
+            tolerance, max(x[0][0], x[1][0]) + tolerance,
+            max(x[0][1], x[1][1]) + tolerance] for x in segment_list]):
+        segment1 = segment_list[j]
+        segment2 = segment_list[k]
+        if segment1[2] == segment2[2]:
+            continue
+        touch_p = False
+        for index1, index2 in [(j, k), (k, j)]:
+            for vertex in segment_list[index2][:2]:
+                distance, t = segment_distance(vertex, *segment_list[index1][
+                                                        :2])
+                if distance <= tolerance:
+                    touch_p = True
+                    if vertex not in segment_list[index1][:2]:
+                        split_list[index1].append((t, vertex))
+        if not touch_p and segments_intersect_q(*segment1[:2],
+                                                *segment2[:2], True):
+            t, u, vertex = crossing_point(*segment1[:2], *segment2[:2])
+            vertex = snap(vertex)
+            split_list[j].append((t, vertex))
+            split_list[k].append((u, vertex))
+            join(segment1[2], segment2[2])
+    edge_dict = {}
+    for (vertex1, vertex2, k), split in zip(segment_list, split_list):
+        vertex_list = [vertex1] + [x[1] for x in sorted(split)] + [vertex2]
+        for j in range(len(vertex_list) - 1):
+            if vertex_list[j] != vertex_list[j + 1]:
+                edge_dict.setdefault((vertex_list[j], vertex_list[j + 1]),
+                                     set()).add(k)
+    # keep the edges with the union on exactly one side
+    boundary_dict = {}
+    for (vertex1, vertex2), owner_set in edge_dict.items():
+        reverse_set = edge_dict.get((vertex2, vertex1), set())
+        if reverse_set and vertex2 < vertex1:
+            continue
+        for k in owner_set | reverse_set:
+            join(k, next(iter(owner_set)))
+        midpoint = [(vertex1[0] + vertex2[0]) / 2,
+                    (vertex1[1] + vertex2[1]) / 2]
+        covered_p = False
+        for k in set().union(*[partner_dict[j] for j in owner_set]) - \
+                owner_set - reverse_set:
+            if point_in_polygon_q(midpoint, loop_dict[k]):
+                join(k, next(iter(owner_set)))
+                covered_p = True
+        if not covered_p and not reverse_set:
+            boundary_dict[(vertex1, vertex2)] = next(iter(owner_set))
+    component_dict = {}
+    for k in loop_dict:
+        component_dict.setdefault(find(k), []).append(k)
+    merged_dict = {}
+    for loop in trace_loops({edge: k for edge, k in boundary_dict.items() if
+                             len(component_dict[find(k)]) > 1}):
+        merged_dict.setdefault(find(boundary_dict[(loop[0], loop[
+            1 % len(loop)])]), []).append(loop)
+    resulting_list = []
+    hole_list_list = []
+    merged_count = 0
+    for k, part_element in enumerate(list_vert_list):
+        if k not in loop_dict or len(component_dict[find(k)]) == 1:
+            resulting_list.append(part_element)
+            hole_list_list.append([])
+            continue
+        if find(k) not in merged_dict:
+            continue
+        merged_count += len(component_dict[find(k)])
+        outer_list = []
+        hole_list = []
+        for loop in merged_dict.pop(find(k)):
+            loop = remove_collinear([list(x) for x in loop])
+            area = polygon_area(loop)
+            if area > 0:
+                outer_list.append((area, loop))
+            elif area < 0:
+                hole_list.append(loop)
+        outer_list.sort()
+        holes_dict = {}
+        for hole in hole_list:
+            midpoint = [(hole[0][0] + hole[1][0]) / 2,
+                        (hole[0][1] + hole[1][1]) / 2]
+            for j, (_, outer) in enumerate(outer_list):
+                if point_in_polygon_q(midpoint, outer):
+                    holes_dict.setdefault(j, []).append(hole[::-1])
+                    break
+        for j, (_, outer) in enumerate(outer_list):
+            resulting_list.append(outer[::-1])
+            hole_list_list.append(holes_dict.get(j, []))
+    return resulting_list, hole_list_list, merged_count
+
+
+def sweep_key(point):
+    # sweep order of the triangulation: top to bottom, then left to right
+    return -point[1], point[0]
+
+
+def sweep_edge_x(point_list, next_list, edge, y):
+    vertex1 = point_list[edge]
+    vertex2 = point_list[next_list[edge]]
+    if vertex1[1] == vertex2[1]:
+        return vertex2[0]
+    return vertex1[0] + (y - vertex1[1]) * (vertex2[0] - vertex1[0]) / (
+            vertex2[1] - vertex1[1])
+
+
+def monotone_diagonals(point_list, next_list, prev_list):
+    # monotone decomposition of counter-clockwise loops: a top-down sweep
+    # keeps the edges with the interior on their right, ordered by x, and
+    # cuts every split and merge vertex off with a diagonal to the helper
+    # of the edge left of it
+    helper_list = list(range(len(point_list)))
+    merge_list = [False] * len(point_list)
+    active_list = []
+    diagonal_list = []
+
+    def left_position(vertex):
+        low = 0
+        high = len(active_list)
+        while low < high:
+            middle = (low + high) // 2
+            if sweep_edge_x(point_list, next_list, active_list[middle],
+                            vertex[1]) < vertex[0]:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def left_edge(vertex):
+        position = left_position(vertex)
+        if position == 0:
+            raise StepfgError(
+                "triangulate_polygon: Error. Polygon is not simple.")
+        return active_list[position - 1]
+
+    def cut(k, edge):
+        if merge_list[helper_list[edge]]:
+            diagonal_list.append((k, helper_list[edge]))
+
+    for k in sorted(range(len(point_list)),
+                    key=lambda j: sweep_key(point_list[j])):
+        vertex = point_list[k]
+        prev_vertex = point_list[prev_list[k]]
+        next_vertex = point_list[next_list[k]]
+        prev_below_p = sweep_key(prev_vertex) > sweep_key(vertex)
+        next_below_p = sweep_key(next_vertex) > sweep_key(vertex)
+        convex_p = orientation(prev_vertex, vertex, next_vertex) > 0
+        if prev_below_p and next_below_p:
+            if not convex_p:
+                edge = left_edge(vertex)
+                diagonal_list.append((k, helper_list[edge]))
+                helper_list[edge] = k
+            active_list.insert(left_position(vertex), k)
+        elif not prev_below_p and not next_below_p:
+            cut(k, prev_list[k])
+            active_list.remove(prev_list[k])
+            if not convex_p:
+                merge_list[k] = True
+                edge = left_edge(vertex)
+                cut(k, edge)
+                helper_list[edge] = k
+        elif next_below_p:
+            cut(k, prev_list[k])
+            active_list.remove(prev_list[k])
+            active_list.insert(left_position(vertex), k)
+        else:
+            edge = left_edge(vertex)
+            cut(k, edge)
+            helper_list[edge] = k
+    return diagonal_list
+
+
+def monotone_pieces(point_list, next_list, prev_list, diagonal_list):
+    neighbour_dict = {}
+    for vertex1, vertex2 in diagonal_list:
+        for k, j in [(vertex1, vertex2), (vertex2, vertex1)]:
+            neighbour_dict.setdefault(k, [prev_list[k], next_list[k]]).append(
+                j)
+    for k, neighbour_list in neighbour_dict.items():
+        neighbour_list.sort(key=lambda j: math.atan2(
+            point_list[j][1] - point_list[k][1],
+            point_list[j][0] - point_list[k][0]))
+    # walk every face with the interior on the left: from the edge (u, v),
+    # continue to the neighbour of v just clockwise of u
+    edge_list = [(k, j) for k, j in enumerate(next_list)] + diagonal_list + [
+        (vertex2, vertex1) for vertex1, vertex2 in diagonal_list]
+    used_set = set()
+    piece_list = []
+    for edge in edge_list:
+        if edge in used_set:
+            continue
+        piece = []
+        vertex1, vertex2 = edge
+        while (vertex1, vertex2) not in used_set:
+            used_set.add((vertex1, vertex2))
+            piece.append(vertex1)
+            neighbour_list = neighbour_dict.get(vertex2)
+            if neighbour_list is None:
+                vertex1, vertex2 = vertex2, next_list[vertex2]
+            else:
+                vertex1, vertex2 = vertex2, neighbour_list[
+                    neighbour_list.index(vertex1) - 1]
+        piece_list.append(piece)
+    return piece_list
+
+
+def triangulate_monotone(point_list, piece):
+    if len(piece) == 3:
+        return [tuple(piece)]
+    top = min(range(len(piece)), key=lambda j: sweep_key(point_list[piece[j]]))
+    bottom = max(range(len(piece)),
+                 key=lambda j: sweep_key(point_list[piece[j]]))
+    # walking counter-clockwise from the top vertex runs down the left chain
+    left_set = set()
+    j = top
+    while j != bottom:
+        left_set.add(piece[j])
+        j = (j + 1) % len(piece)
+    order = sorted(piece, key=lambda k: sweep_key(point_list[k]))
+    stack = order[:2]
+    triangle_list = []
+    for j in range(2, len(order) - 1):
+        k = order[j]
+        if (k in left_set) != (stack[-1] in left_set):
+            while len(stack) > 1:
+                triangle_list.append((k, stack.pop(), stack[-1]))
+            stack = [order[j - 1], k]
+            continue
+        last = stack.pop()
+        side = -1 if k in left_set else 1
+        while stack and orientation(point_list[k], point_list[last],
+                                    point_list[stack[-1]]) == side:
+            triangle_list.append((k, last, stack[-1]))
+            last = stack.pop()
+        stack += [last, k]
+    for j in range(len(stack) - 1):
+        triangle_list.append((order[-1], stack[j], stack[j + 1]))
+    return triangle_list
+
+
+def triangulate_polygon(part_list, hole_list=()):
+    # Triangles (i, j, k) of the polygon interior as counter-clockwise
+    # vertex indices, in O(n log n): a monotone decomposition followed by
+    # the stack triangulation of every monotone piece. The vertices of the
+    # holes are numbered after those of the polygon. Repeated vertices are
+    # skipped and collinear triangles dropped.
+    vertex_list = []
+    index_list = []
+    next_list = []
+    for loop_index, loop_list in enumerate([part_list] + list(hole_list)):
+        loop_list = list(loop_list)
+        loop_index_list = list(range(len(vertex_list),
+                                     len(vertex_list) + len(loop_list)))
+        vertex_list += loop_list
+        # the interior lies left of the outer loop and right of the holes
+        if (polygon_area(loop_list) > 0) != (loop_index == 0):
+            loop_index_list.reverse()
+        loop_index_list = [k for j, k in enumerate(loop_index_list) if
+                           vertex_list[k][:2] != vertex_list[
+                               loop_index_list[j - 1]][:2]]
+        if len(loop_index_list) < 3:
+            raise StepfgError(
+                "triangulate_polygon: Error. Polygon has fewer than three" +
+                " distinct vertices.")
+        next_list += [len(index_list) + (j + 1) % len(loop_index_list) for j
+                      in range(len(loop_index_list))]
+        index_list += loop_index_list
+    point_list = [vertex_list[k][:2] for k in index_list]
+    prev_list = [0] * len(next_list)
+    for k, j in enumerate(next_list):
+        prev_list[j] = k
+    triangle_list = []
+    for piece in monotone_pieces(point_list, next_list, prev_list,
+                                 monotone_diagonals(point_list, next_list,
+                                                    prev_list)):
+        for triangle in triangulate_monotone(point_list, piece):
+            side = orientation(*[point_list[k] for k in triangle])
+            if side:
+                triangle_list.append(tuple(index_list[k] for k in (
+                    triangle if side > 0 else triangle[::-1])))
+    return triangle_list
+
+
+def circumcenter(vertex1, vertex2, vertex3):
+    bx = vertex2[0] - vertex1[0]
+    by = vertex2[1] - vertex1[1]
+    cx = vertex3[0] - vertex1[0]
+    cy = vertex3[1] - vertex1[1]
+    d = 2 * (bx * cy - by * cx)
+    if d == 0:
+        return None
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    return [vertex1[0] + (cy * b2 - by * c2) / d,
+            vertex1[1] + (bx * c2 - cx * b2) / d, vertex1[2]]
+
+
+def turning_angle(vertex1, vertex2, vertex3):
+    edge1 = list(map(operator.sub, vertex2, vertex1))
+    edge2 = list(map(operator.sub, vertex3, vertex2))
+    return math.atan2(edge1[0] * edge2[1] - edge1[1] * edge2[0],
+                      edge1[0] * edge2[0] + edge1[1] * edge2[1])
+
+
+def fit_arc(part_list, index1, index2, tolerance):
+    vertex1 = part_list[index1]
+    if any(part_list[k][2] != vertex1[2] for k in range(index1, index2 + 1)):
+        return None
+    center = circumcenter(vertex1, part_list[(index1 + index2) // 2],
+                          part_list[index2])
+    if center is None:
+        return None
+    radius = math.hypot(vertex1[0] - center[0], vertex1[1] - center[1])
+    sweep = 0.0
+    first_step = None
+    for k in range(index1, index2):
+        radius1 = [part_list[k][0] - center[0], part_list[k][1] - center[1]]
+        radius2 = [part_list[k + 1][0] - center[0],
+                   part_list[k + 1][1] - center[1]]
+        if abs(math.hypot(*radius2) - radius) > tolerance:
+            return None
+        step = math.atan2(radius1[0] * radius2[1] - radius1[1] * radius2[0],
+                          radius1[0] * radius2[0] + radius1[1] * radius2[1])
+        if step == 0 or abs(step) > ARC_MAX_STEP or step * sweep < 0:
+            return None
+        # the vertices of a concyclic run may still join chords that lie
+        # far from the arc, so the sagitta of every chord is limited too
+        if radius * (1 - math.cos(step / 2)) > tolerance:
+            return None
+        if first_step is None:
+            first_step = step
+        elif abs(step - first_step) > ARC_STEP_VARIATION * abs(first_step):
+            return None
+        sweep += step
+    return center, radius, sweep > 0
+
+
+def longest_arc(part_list, index1, max_index, tolerance):
+    segment_count = ARC_MIN_SEGMENTS
+    if index1 + segment_count > max_index:
+        return None
+    arc = fit_arc(part_list, index1, index1 + segment_count, tolerance)
+    if arc is None:
+        return None
+    failed_count = None
+    while segment_count < max_index - index1:
+        trial_count = min(2 * segment_count, max_index - index1)
+        trial_arc = fit_arc(part_list, index1, index1 + trial_count,
+                            tolerance)
+        if trial_arc is None:
+            failed_count = trial_count
+            break
+        segment_count, arc = trial_count, trial_arc
+    while failed_count is not None and failed_count - segment_count > 1:
+        trial_count = (segment_count + failed_count) // 2
+        trial_arc = fit_arc(part_list, index1, index1 + trial_count,
+                            tolerance)
+        if trial_arc is None:
+            failed_count = trial_count
+        else:
+            segment_count, arc = trial_count, trial_arc
+    return index1 + segment_count, arc
+
+
+def fit_arcs(part_list, tolerance=DISTANCE_ACCURACY):
+    n = len(part_list)
+    turning_list = [turning_angle(part_list[k - 1], part_list[k],
+                                  part_list[(k + 1) % n]) for k in range(n)]
+    start_index = next((k for k in range(n) if turning_list[k] == 0 or
+                        abs(turning_list[k]) > ARC_MAX_STEP), None)
+    closed_list = rotate(part_list, -start_index) if start_index else \
+        part_list[:]
+    closed_list.append(closed_list[0])
+    if start_index is None and n >= 2 * ARC_MIN_SEGMENTS:
+        first_arc = fit_arc(closed_list, 0, n // 2, tolerance)
+        second_arc = fit_arc(closed_list, n // 2, n, tolerance)
+        if first_arc is not None and second_arc is not None:
+            return [('arc', closed_list[0], closed_list[n // 2]) + first_arc,
+                    ('arc', closed_list[n // 2], closed_list[n]) + second_arc]
+    contour = []
+    k = 0
+    while k < n:
+        arc = longest_arc(closed_list, k, n if k else n - 1, tolerance)
+        if arc is None:
+            contour.append(('line', closed_list[k], closed_list[k + 1]))
+            k += 1
+        else:
+            contour.append(('arc', closed_list[k], closed_list[arc[0]]) +
+                           arc[1])
+            k = arc[0]
+    return contour
+
+
+def least_rotation(sequence):
+    # Booth's algorithm
+    doubled = sequence + sequence
+    failure = [-1] * len(doubled)
+    k = 0
+    for j in range(1, len(doubled)):
+        item = doubled[j]
+        i = failure[j - k - 1]
+        while i != -1 and item != doubled[k + i + 1]:
+            if item < doubled[k + i + 1]:
+                k = j - i - 1
+            i = failure[i]
+        if item != doubled[k + i + 1]:
+            if item < doubled[k]:
+                k = j
+            failure[j - k] = -1
+        else:
+            failure[j - k] = i + 1
+    return k % len(sequence)
+
+
+def congruence_form(part_list, tolerance=DISTANCE_ACCURACY):
+    # edge lengths and turning angles from the least rotation of the forward
+    # and of the backward walk, so that mirror images share the key
+    best_form = None
+    for reverse_p in [False, True]:
+        walk_list = part_list[:1] + part_list[:0:-1] if reverse_p else \
+            part_list
+        sign = -1 if reverse_p else 1
+        sequence = [(round(math.dist(walk_list[k], walk_list[
+            k - len(walk_list) + 1]) / tolerance), round(
+            sign * turning_angle(walk_list[k - 1], walk_list[k], walk_list[
+                k - len(walk_list) + 1]) / INSTANCE_ANGLE_STEP)) for k in
+            range(len(walk_list))]
+        start = least_rotation(sequence)
+        key = tuple(sequence[start:] + sequence[:start])
+        if best_form is None or key < best_form[0]:
+            best_form = key, walk_list[start:] + walk_list[:start], reverse_p
+    return best_form
+
+
+def congruence_transform(part_list1, part_list2, mirror_p=False,
+                         tolerance=DISTANCE_ACCURACY):
+    # least-squares rotation and translation of the corresponding vertices,
+    # after reflecting part_list1 across the x axis if mirror_p
+    point_list = [[x[0], -x[1] if mirror_p else x[1]] for x in part_list1]
+    center1 = [sum(x[0] for x in point_list) / len(point_list),
+               sum(x[1] for x in point_list) / len(point_list)]
+    center2 = [sum(x[0] for x in part_list2) / len(part_list2),
+               sum(x[1] for x in part_list2) / len(part_list2)]
+    cross_sum = 0.0
+    dot_sum = 0.0
+    for point, vertex in zip(point_list, part_list2):
+        dx1 = point[0] - center1[0]
+        dy1 = point[1] - center1[1]
+        dx2 = vertex[0] - center2[0]
+        dy2 = vertex[1] - center2[1]
+        cross_sum += dx1 * dy2 - dy1 * dx2
+        dot_sum += dx1 * dx2 + dy1 * dy2
+    angle = math.atan2(cross_sum, dot_sum)
+    cos_angle = math.cos(angle)
+    sin_angle = math.sin(angle)
+    translation = [
+        center2[0] - cos_angle * center1[0] + sin_angle * center1[1],
+        center2[1] - sin_angle * center1[0] - cos_angle * center1[1]]
+    for point, vertex in zip(point_list, part_list2):
+        if math.hypot(
+                cos_angle * point[0] - sin_angle * point[1] + translation[0] -
+                vertex[0],
+                sin_angle * point[0] + cos_angle * point[1] + translation[1] -
+                vertex[1]) > tolerance:
+            return None
+    return cos_angle, sin_angle, translation[0], translation[1], mirror_p
+
+
+def congruent_instances(list_vert_list, tolerance=DISTANCE_ACCURACY):
+    # entry k is None for a polygon without copies, (k, None) for the first
+    # polygon of a congruence class and (j, transform) for a copy of polygon j
+    instance_list = [None] * len(list_vert_list)
+    form_dict = {}
+    for k, part_element in enumerate(list_vert_list):
+        part_list = part_element.tolist() if hasattr(
+            part_element, 'tolist') else [list(x) for x in part_element]
+        key, walk_list, reverse_p = congruence_form(part_list, tolerance)
+        for j, other_walk_list, other_reverse_p in form_dict.get(key, []):
+            transform = congruence_transform(
+                other_walk_list, walk_list, reverse_p != other_reverse_p,
+                tolerance)
+            if transform is not None:
+                instance_list[k] = j, transform
+                instance_list[j] = j, None
+                break
+        else:
+            form_dict.setdefault(key, []).append((k, walk_list, reverse_p))
+    return instance_list
+
+
+STREAM_INDEX_SIZE = 1 << 18
+PART_SPECIFICATION = "/* Part Specification */\n"
+B_REP_SCHEMA = 'CONFIG_CONTROL_DESIGN'
+TESSELLATED_SCHEMA = \
+    'AP242_MANAGED_MODEL_BASED_3D_ENGINEERING_MIM_LF { 1 0 10303 442 1 1 4 }'
+# AP242 counterparts of the AP203 header entities, with the same attributes
+AP242_HEADER_TYPES = {
+    'MECHANICAL_CONTEXT': 'PRODUCT_CONTEXT',
+    'DESIGN_CONTEXT': 'PRODUCT_DEFINITION_CONTEXT',
+    'CC_DESIGN_APPROVAL': 'APPLIED_APPROVAL_ASSIGNMENT',
+    'CC_DESIGN_DATE_AND_TIME_ASSIGNMENT': 'APPLIED_DATE_AND_TIME_ASSIGNMENT',
+    'CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT':
+        'APPLIED_PERSON_AND_ORGANIZATION_ASSIGNMENT',
+    'CC_DESIGN_SECURITY_CLASSIFICATION':
+        'APPLIED_SECURITY_CLASSIFICATION_ASSIGNMENT'}
+APPLICATION_PROTOCOLS = {
+    B_REP_SCHEMA: "'config_control_design',1994",
+    TESSELLATED_SCHEMA: "'ap242_managed_model_based_3d_engineering',2014"}
+
+
+def step_file_array(file_out_name, d=None, schema=B_REP_SCHEMA):
+    if d is None:
+        d = datetime.datetime.now()
+    file_array = [
+        "ISO-10303-21;",
+        "HEADER;",
+        "FILE_DESCRIPTION(('none'),'2;1');",
+        "",
+        "FILE_NAME('" + file_out_name + "','none',('none'),('none')," +
+        "'none','none','none');",
+        "",
+        "FILE_SCHEMA(('" + schema + "'));",
+        "",
+        "ENDSEC;",
+        "DATA;",
+        "#1=APPLICATION_CONTEXT('configuration controlled 3D design of" +
+        " mechanical parts and assemblies') ;",
+        "#2=MECHANICAL_CONTEXT(' ',#1,'mechanical') ;",
+        "#3=DESIGN_CONTEXT(' ',#1,'design') ;",
+        "#4=APPLICATION_PROTOCOL_DEFINITION('international standard'," +
+        APPLICATION_PROTOCOLS[schema] + ",#1) ;",
+        "#5=PRODUCT('Part1','','',(#2)) ;",
+        "#6=PRODUCT_DEFINITION_FORMATION_WITH_SPECIFIED_SOURCE('',' '" +
+        ",#5,.NOT_KNOWN.) ;",
+        "#7=PRODUCT_CATEGORY('part',$) ;",
+        "#8=PRODUCT_RELATED_PRODUCT_CATEGORY('detail',$,(#5)) ;",
+        "#9=PRODUCT_CATEGORY_RELATIONSHIP(' ',' ',#7,#8) ;",
+        "#10=COORDINATED_UNIVERSAL_TIME_OFFSET(0,0,.AHEAD.) ;",
+        "#11=CALENDAR_DATE(" + str(getattr(d, 'year')) + "," + str(
+            getattr(d, 'month')) + "," + str(
+            getattr(d, 'day')) + ") ;",
+        "#12=LOCAL_TIME(" + str(getattr(d, 'hour')) + "," + str(
+            getattr(d, 'minute')) + "," + str(
+            getattr(d, 'second')) + ".,#10) ;",
+        "#13=DATE_AND_TIME(#11,#12) ;",
+        "#14=PRODUCT_DEFINITION('',' ',#6,#3) ;",
+        "#15=SECURITY_CLASSIFICATION_LEVEL('unclassified') ;",
+        "#16=SECURITY_CLASSIFICATION(' ',' ',#15) ;",
+        "#17=DATE_TIME_ROLE('classification_date') ;",
+        "#18=CC_DESIGN_DATE_AND_TIME_ASSIGNMENT(#13,#17,(#16)) ;",
+        "#19=APPROVAL_ROLE('APPROVER') ;",
+        "#20=APPROVAL_STATUS('not_yet_approved') ;",
+        "#21=APPROVAL(#20,' ') ;",
+        "#22=PERSON(' ',' ',' ',$,$,$) ;",
+        "#23=ORGANIZATION(' ',' ',' ') ;",
+        "#24=PERSONAL_ADDRESS(' ',' ',' ',' ',' ',' ',' ',' ',' '," +
+        "' ',' ',' ',(#22),' ') ;",
+        "#25=PERSON_AND_ORGANIZATION(#22,#23) ;",
+        "#26=PERSON_AND_ORGANIZATION_ROLE('classification_officer') ;",
+        "#27=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#26," +
+        "(#16)) ;",
+        "#28=DATE_TIME_ROLE('creation_date') ;",
+        "#29=CC_DESIGN_DATE_AND_TIME_ASSIGNMENT(#13,#28,(#14)) ;",
+        "#30=CC_DESIGN_APPROVAL(#21,(#16,#6,#14)) ;",
+        "#31=APPROVAL_PERSON_ORGANIZATION(#25,#21,#19) ;",
+        "#32=APPROVAL_DATE_TIME(#13,#21) ;",
+        "#33=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#34," +
+        "(#6)) ;",
+        "#34=PERSON_AND_ORGANIZATION_ROLE('design_supplier') ;",
+        "#35=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#36," +
+        "(#6,#14)) ;",
+        "#36=PERSON_AND_ORGANIZATION_ROLE('creator') ;",
+        "#37=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#38," +
+        "(#5)) ;",
+        "#38=PERSON_AND_ORGANIZATION_ROLE('design_owner') ;",
+        "#39=CC_DESIGN_SECURITY_CLASSIFICATION(#16,(#6)) ;",
+        "",
+        "#40=PRODUCT_DEFINITION_SHAPE(' ',' ',#14) ;",
+        "#41=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.)) ;",
+        "#42=(NAMED_UNIT(*)PLANE_ANGLE_UNIT()SI_UNIT($,.RADIAN.)) ;",
+        "#43=(NAMED_UNIT(*)SI_UNIT($,.STERADIAN.)SOLID_ANGLE_UNIT()) ;",
+        "#44=UNCERTAINTY_MEASURE_WITH_UNIT(LENGTH_MEASURE(" + str(
+            DISTANCE_ACCURACY) + "),#41," +
+        "'distance_accuracy_value','CONFUSED CURVE" +
+        " UNCERTAINTY') ;",
+        "#45=(GEOMETRIC_REPRESENTATION_CONTEXT(3)" +
+        "GLOBAL_UNCERTAINTY_ASSIGNED_CONTEXT((#44))" +
+        "GLOBAL_UNIT_ASSIGNED_CONTEXT((#41,#42,#43))" +
+        "REPRESENTATION_CONTEXT(' ',' ')) ;",
+        "",
+        "#46=CARTESIAN_POINT(' ',(0.,0.,0.)) ;",
+        "#47=AXIS2_PLACEMENT_3D(' ',#46,$,$) ;",
+        "#48=SHAPE_REPRESENTATION(' ',(#47),#45) ;",
+        "#49=SHAPE_DEFINITION_REPRESENTATION(#40,#48) ;",
+        "",
+        "/* Part Specification */",
+        "",
+        "ENDSEC;",
+        "END-ISO-10303-21;"]
+    if schema == TESSELLATED_SCHEMA:
+        file_array = [re.sub(r'(?<==)\w+(?=\()', lambda x: (
+            AP242_HEADER_TYPES.get(x.group(), x.group())), i) for i in
+                      file_array]
+    return [i + "\n" for i in file_array]
+
+
+class StepWriter:
+    def __init__(self, file_out_name='part_out.stp', d=None, stream=None,
+                 shared_edges=True, use_numpy=False, weld_tolerance=None,
+                 simplify_tolerance=None, arc_tolerance=None,
+                 cache_dir=None, cache_size=1 << 28, stats=None,
+                 workers=None, check_geometry=False, instance_tolerance=None,
+                 tessellate=False, union_tolerance=None,
+                 stream_index_size=STREAM_INDEX_SIZE):
+        if tessellate and arc_tolerance is not None:
+            raise StepfgError(
+                "Error. Arc fitting is not available for tessellated output.")
+        self.file_out_name = file_out_name
+        self.file_array = step_file_array(
+            file_out_name, d, TESSELLATED_SCHEMA if tessellate else
+            B_REP_SCHEMA)
+        self.index1 = self.file_array.index(PART_SPECIFICATION)
+        self.stream = stream
+        self.entity_table = EntityTable(max(
+            [line_index(k) for k in self.file_array if k.startswith('#')]) + 1,
+            None if stream is None else stream_index_size)
+        self.part_body_index = 1
+        self.shared_edges = shared_edges
+        if use_numpy:
+            require_numpy()
+        self.use_numpy = use_numpy
+        self.weld_tolerance = weld_tolerance
+        self.welded_vertices = 0
+        self.removed_vertices = 0
+        self.simplify_tolerance = simplify_tolerance
+        self.simplified_vertices = 0
+        self.arc_tolerance = arc_tolerance
+        self.fitted_arcs = 0
+        self.arc_segments = 0
+        self.edges = {}
+        self.part_cache = None if cache_dir is None else PartCache(
+            cache_dir, cache_size)
+        self.recording = None
+        self.stats = stats
+        self.workers = workers
+        self.check_geometry = check_geometry
+        self.instance_tolerance = instance_tolerance
+        self.instance_solids = 0
+        self.instanced_parts = 0
+        self.tessellate = tessellate
+        self.union_tolerance = union_tolerance
+        self.merged_polygons = 0
+        self.union_solids = 0
+        self.union_holes = 0
+        self.assembly = None
+
+    def phase(self, name):
+        return contextlib.nullcontext() if self.stats is None else \
+            self.stats.phase(name)
+
+    def new_item(self, kind_name, *fields):
+        record = ENTITY_KINDS[kind_name].pack(fields)
+        entity_ln = self.entity_table.add(record)
+        if self.recording is not None:
+            self.recording.append((record, entity_ln))
+        return entity_ln
+
+    def new_record(self, record):
+        entity_ln = self.entity_table.add(record)
+        if self.recording is not None:
+            self.recording.append((record, entity_ln))
+        return entity_ln
+
+    def point(self, coord_in):
+        return self.new_item('point', *coord_in)
+
+    def line(self, origin, direction):
+        return self.unit_line(origin, normalize(direction))
+
+    def unit_line(self, origin, direction):
+        coord_ln = self.new_item('line_origin', *origin)
+        dir_ln = self.new_item('line_direction', *direction)
+        vec_ln = self.new_item('vector', dir_ln)
+        return self.new_item('line', coord_ln, vec_ln)
+
+    def vertex(self, coord_in):
+        return self.new_item('vertex', self.new_item('vertex_location',
+                                                     *coord_in))
+
+    def edge_curve(self, vertex1_ln, vertex2_ln, line_coord_ln,
+                   same_sense=True):
+        return self.new_item('edge_curve', vertex1_ln, vertex2_ln,
+                             line_coord_ln, same_sense)
+
+    def edge_curve_0(self, vertex1, vertex2, same_sense=True):
+        return self.edge_curve(self.vertex(vertex1), self.vertex(vertex2),
+                               self.line([x / 2 for x in list(
+                                   map(operator.add, vertex1, vertex2))],
+                                         list(map(operator.sub, vertex2,
+                                                  vertex1))),
+                               same_sense)
+
+    def oriented_edge(self, edge_curve_ln, same_sense=True):
+        return self.new_item('oriented_edge', edge_curve_ln, same_sense)
+
+    def edge_loop(self, lines):
+        return self.new_item('edge_loop', lines)
+
+    def existing_edge(self, vertex1_ln, vertex2_ln, curve_key=None):
+        edge_curve_ln = self.edges.get((vertex2_ln, vertex1_ln, curve_key))
+        if edge_curve_ln is not None:
+            return self.oriented_edge(edge_curve_ln, False)
+        edge_curve_ln = self.edges.get((vertex1_ln, vertex2_ln, curve_key))
+        if edge_curve_ln is not None:
+            return self.oriented_edge(edge_curve_ln, True)
+        return None
+
+    def new_edge(self, vertex1_ln, vertex2_ln, curve_ln, same_sense=True,
+                 curve_key=None):
+        edge_curve_ln = self.edge_curve(vertex1_ln, vertex2_ln, curve_ln,
+                                        same_sense)
+        self.edges[(vertex1_ln, vertex2_ln, curve_key)] = edge_curve_ln
+        return self.oriented_edge(edge_curve_ln, True)
+
+    def shared_edge(self, vertex1, vertex2):
+        vertex1_ln = self.vertex(vertex1)
+        vertex2_ln = self.vertex(vertex2)
+        oriented_edge_ln = self.existing_edge(vertex1_ln, vertex2_ln)
+        if oriented_edge_ln is None:
+            oriented_edge_ln = self.new_edge(vertex1_ln, vertex2_ln, self.line(
+                [x / 2 for x in list(map(operator.add, vertex1, vertex2))],
+                list(map(operator.sub, vertex2, vertex1))))
+        return oriented_edge_ln
+
+    def line_edge(self, vertex1, vertex2):
+        if self.shared_edges:
+            return self.shared_edge(vertex1, vertex2)
+        return self.oriented_edge(self.edge_curve_0(vertex1, vertex2))
+
+    def circle(self, center, radius):
+        return self.new_item('circle', self.axis2_placement_3d(
+            center, [0, 0, 1], [1, 0, 0]), radius)
+
+    def cylindrical_surface(self, origin_coord, radius):
+        return self.new_item('cylindrical_surface', self.axis2_placement_3d(
+            origin_coord, [0, 0, 1], [1, 0, 0]), radius)
+
+    def arc_edge(self, vertex1, vertex2, center, radius, same_sense):
+        vertex1_ln = self.vertex(vertex1)
+        vertex2_ln = self.vertex(vertex2)
+        circle_ln = self.circle(center, radius)
+        if not self.shared_edges:
+            return self.oriented_edge(self.edge_curve(
+                vertex1_ln, vertex2_ln, circle_ln, same_sense))
+        oriented_edge_ln = self.existing_edge(vertex1_ln, vertex2_ln,
+                                              circle_ln)
+        if oriented_edge_ln is None:
+            oriented_edge_ln = self.new_edge(vertex1_ln, vertex2_ln,
+                                             circle_ln, same_sense, circle_ln)
+        return oriented_edge_ln
+
+    def edge_loop_0(self, vertices):
+        if self.shared_edges:
+            return self.edge_loop(
+                list(map(self.shared_edge, vertices, rotate(vertices, -1))))
+        return self.edge_loop(list(
+            map(lambda x1, x2: self.oriented_edge(self.edge_curve_0(x1, x2)),
+                vertices, rotate(vertices, -1))))
+
+    def face_outer_bound(self, edge_loop_ln, same_sense: True):
+        return self.new_item('face_outer_bound', edge_loop_ln, same_sense)
+
+    def edge_loop_1(self, vertices, same_sense: True):
+        return self.face_outer_bound(self.edge_loop_0(vertices), same_sense)
+
+    def face_bound(self, edge_loop_ln, same_sense=True):
+        return self.new_item('face_bound', edge_loop_ln, same_sense)
+
+    def hole_bounds(self, hole_list, zaxis):
+        # the hole loops run counter-clockwise in the x-y plane, opposite to
+        # the outer loop, so they are reversed on faces facing +z
+        return [self.face_bound(self.edge_loop_0(
+            list(reversed(x)) if zaxis[2] > 0 else x), True) for x in
+            hole_list]
+
+    def axis2_placement_3d(self, origin_coord, direction1, direction2):
+        return self.new_item(
+            'axis2_placement_3d',
+            self.new_item('axis_location', *origin_coord),
+            self.new_item('axis_z_direction', *direction1),
+            self.new_item('axis_x_direction', *direction2))
+
+    def plane(self, axis2_placement_3d_ln):
+        return self.new_item('plane', axis2_placement_3d_ln)
+
+    def plane_0(self, origin_coord, direction1, direction2):
+        return self.plane(
+            self.axis2_placement_3d(origin_coord, direction1, direction2))
+
+    def advanced_face(self, face_outer_bound_ln, plane_ln,
+                      same_sense_plane=True):
+        return self.new_item(
+            'advanced_face', face_outer_bound_ln if isinstance(
+                face_outer_bound_ln, list) else [face_outer_bound_ln],
+            plane_ln, same_sense_plane)
+
+    def advanced_face_0(self, vertices, zaxis, same_sense_1=True,
+                        same_sense_2=True, hole_list=()):
+        if sum(map(operator.mul, zaxis, loop_normal(vertices))) > 0:
+            af_ln = self.advanced_face(
+                [self.edge_loop_1(vertices, same_sense_1)] + self.hole_bounds(
+                    hole_list, zaxis), self.plane(
+                    self.axis2_placement_3d(vertices[0], normalize(zaxis),
+                                            normalize(list(
+                                                map(operator.sub, vertices[1],
+                                                    vertices[0]))))),
+                same_sense_2)
+        else:
+            af_ln = self.advanced_face(
+                [self.edge_loop_1(list(reversed(vertices)), same_sense_1)] +
+                self.hole_bounds(hole_list, zaxis),
+                self.plane(self.axis2_placement_3d(
+                    vertices[0], normalize(zaxis), normalize(
+                        list(map(operator.sub, list(reversed(vertices))[1],
+                                 list(reversed(vertices))[0]))))),
+                same_sense_2)
+        return af_ln
+
+    def advanced_face_1(self, vertices, same_sense_1=True, same_sense_2=True):
+        return self.advanced_face(
+            self.edge_loop_1(vertices, same_sense_1),
+            self.plane(self.axis2_placement_3d(vertices[0], normalize(
+                cross_product(list(
+                    map(operator.sub, vertices[2], vertices[1])),
+                    list(map(operator.sub, vertices[1], vertices[0])))),
+                normalize(list(map(operator.sub, vertices[1],
+                                   vertices[0]))))), same_sense_1)
+
+    def closed_shell(self, advanced_face_ln_list):
+        return self.new_item('closed_shell', advanced_face_ln_list)
+
+    def manifold_solid_brep(self, closed_shell_ln):
+        msb = self.new_item('manifold_solid_brep', self.part_body_index,
+                            closed_shell_ln)
+        self.part_body_index += 1
+        return msb
+
+    def advanced_brep_shape_representation(self, manifold_solid_brep_list,
+                                           init_ln=45):
+        return self.new_item('advanced_brep_shape_representation',
+                             manifold_solid_brep_list, init_ln)
+
+    def shape_representation(self, part_list, init_ln=45):
+        return self.new_item('tessellated_shape_representation' if
+                             self.tessellate else
+                             'advanced_brep_shape_representation', part_list,
+                             init_ln)
+
+    def shape_representation_relationship(
+            self, advanced_brep_shape_representation_ln,
+            shape_representation_ln=48):
+        return self.new_item('shape_representation_relationship',
+                             shape_representation_ln,
+                             advanced_brep_shape_representation_ln)
+
+    def zface(self, vertex1, vertex2, geom_depth_list):
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        return self.advanced_face_0(
+            [list(map(operator.add, vertex1, [0, 0, z_neg])),
+             list(map(operator.add, vertex2, [0, 0, z_neg])),
+             list(map(operator.add, vertex2, [0, 0, z_pos])),
+             list(map(operator.add, vertex1, [0, 0, z_pos]))],
+            normalize(cross_product(list(map(operator.sub, vertex2, vertex1)),
+                                    [0, 0, -(z_pos - z_neg)])))
+
+    def xyface(self, vertex_list, depth, zdir, hole_list=()):
+        return self.advanced_face_0(list(
+            map(lambda x: list(map(operator.add, x, [0, 0, depth])),
+                vertex_list)), zdir, hole_list=[
+            [list(map(operator.add, x, [0, 0, depth])) for x in hole] for
+            hole in hole_list])
+
+    def af2d3d(self, vertex_list, geom_depth_list, hole_list=()):
+        taflist = []
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        taflist.append(self.xyface(vertex_list, z_pos, [0, 0, 1], hole_list))
+        taflist.append(self.xyface(vertex_list, z_neg, [0, 0, -1], hole_list))
+        for loop_list in [vertex_list] + list(hole_list):
+            taflist += list(
+                map(lambda x1, x2: self.zface(x1, x2, geom_depth_list),
+                    loop_list, rotate(loop_list, -1)))
+        return taflist
+
+    def edge_loop_rows(self, vertex_records, origin_records,
+                       direction_records):
+        # the same entities in the same order as edge_loop_1, from records
+        # packed in bulk; the second vertex of an edge is the first of the
+        # next one
+        oriented_edge_list = []
+        first_ln = vertex2_ln = None
+        for k, origin_record, direction_record in zip(
+                range(len(vertex_records)), origin_records,
+                direction_records):
+            vertex1_ln = self.new_item('vertex', self.new_record(
+                vertex_records[k])) if vertex2_ln is None else vertex2_ln
+            if first_ln is None:
+                first_ln = vertex1_ln
+            vertex2_ln = first_ln if k + 1 == len(vertex_records) else \
+                self.new_item('vertex', self.new_record(vertex_records[k + 1]))
+            if not self.shared_edges:
+                oriented_edge_ln = self.oriented_edge(self.edge_curve(
+                    vertex1_ln, vertex2_ln, self.record_line(
+                        origin_record, direction_record)))
+            else:
+                oriented_edge_ln = self.existing_edge(vertex1_ln, vertex2_ln)
+                if oriented_edge_ln is None:
+                    oriented_edge_ln = self.new_edge(
+                        vertex1_ln, vertex2_ln, self.record_line(
+                            origin_record, direction_record))
+            oriented_edge_list.append(oriented_edge_ln)
+        return self.edge_loop(oriented_edge_list)
+
+    def record_line(self, origin_record, direction_record):
+        coord_ln = self.new_record(origin_record)
+        vec_ln = self.new_item('vector', self.new_record(direction_record))
+        return self.new_item('line', coord_ln, vec_ln)
+
+    def advanced_face_rows(self, vertex_records, origin_records,
+                           direction_records, axis_rows):
+        return self.advanced_face(self.face_outer_bound(
+            self.edge_loop_rows(vertex_records, origin_records,
+                                direction_records), True),
+            self.plane(self.axis2_placement_3d(*axis_rows)), True)
+
+    def xyface_array(self, vertex_array, depth, zdir):
+        cap_array = vertex_array + [0, 0, depth]
+        cap_list = cap_array[:3].tolist()
+        if sum(map(operator.mul, zdir, loop_normal_rows(cap_array))) <= 0:
+            cap_array = cap_array[::-1]
+        next_array = np.roll(cap_array, -1, axis=0)
+        return self.advanced_face_rows(
+            record_rows('vertex_location', cap_array),
+            record_rows('line_origin', (cap_array + next_array) / 2),
+            record_rows('line_direction',
+                        normalize_rows(next_array - cap_array)),
+            [cap_list[0], normalize(zdir),
+             coord_rows(normalize_rows(cap_array[1] - cap_array[0]))[0]])
+
+    def zface_array(self, vertex_array, geom_depth_list):
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        next_array = np.roll(vertex_array, -1, axis=0)
+        face_array = np.stack([vertex_array + [0, 0, z_neg],
+                               next_array + [0, 0, z_neg],
+                               next_array + [0, 0, z_pos],
+                               vertex_array + [0, 0, z_pos]], 1)
+        zaxis_array = normalize_rows(normalize_rows(cross_product_rows(
+            next_array - vertex_array, np.array([0, 0, -(z_pos - z_neg)]))))
+        same_p = np.all(zaxis_array + normalize_rows(cross_product_rows(
+            face_array[:, 2] - face_array[:, 1],
+            face_array[:, 2] - face_array[:, 0])) == 0, axis=1)
+        origin_rows = coord_rows(face_array[:, 0])
+        zaxis_rows = coord_rows(zaxis_array)
+        face_array = np.where(same_p[:, None, None], face_array,
+                              face_array[:, ::-1])
+        next_face_array = np.roll(face_array, -1, axis=1)
+        vertex_records = record_rows('vertex_location', face_array)
+        origin_records = record_rows('line_origin',
+                                     (face_array + next_face_array) / 2)
+        direction_array = normalize_rows(next_face_array - face_array)
+        direction_records = record_rows('line_direction', direction_array)
+        xaxis_rows = coord_rows(direction_array[:, 0])
+        return [self.advanced_face_rows(
+            vertex_records[4 * k:4 * k + 4], origin_records[4 * k:4 * k + 4],
+            direction_records[4 * k:4 * k + 4],
+            [origin_rows[k], zaxis_rows[k], xaxis_rows[k]]) for k in
+            range(len(vertex_array))]
+
+    def af2d3d_array(self, vertex_array, geom_depth_list):
+        taflist = []
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        taflist.append(self.xyface_array(vertex_array, z_pos, [0, 0, 1]))
+        taflist.append(self.xyface_array(vertex_array, z_neg, [0, 0, -1]))
+        taflist += self.zface_array(vertex_array, geom_depth_list)
+        return taflist
+
+    def contour_edge(self, segment, depth, reverse_p=False):
+        vertex1 = list(map(operator.add, segment[1], [0, 0, depth]))
+        vertex2 = list(map(operator.add, segment[2], [0, 0, depth]))
+        if reverse_p:
+            vertex1, vertex2 = vertex2, vertex1
+        if segment[0] == 'line':
+            return self.line_edge(vertex1, vertex2)
+        return self.arc_edge(vertex1, vertex2, list(
+            map(operator.add, segment[3], [0, 0, depth])), segment[4],
+                             segment[5] != reverse_p)
+
+    def contour_cap(self, contour, depth, zdir, hole_contour_list=()):
+        reverse_p = zdir[2] > 0
+        segments = list(reversed(contour)) if reverse_p else contour
+        loop_ln = self.edge_loop(
+            [self.contour_edge(x, depth, reverse_p) for x in segments])
+        bound_list = [self.face_outer_bound(loop_ln, True)] + [
+            self.face_bound(self.edge_loop([
+                self.contour_edge(x, depth, reverse_p) for x in (
+                    reversed(hole_contour) if reverse_p else hole_contour)]),
+                True) for hole_contour in hole_contour_list]
+        origin = list(map(operator.add, segments[0][2 if reverse_p else 1],
+                          [0, 0, depth]))
+        direction = list(map(operator.sub, segments[0][1 if reverse_p else 2],
+                             segments[0][2 if reverse_p else 1]))
+        return self.advanced_face(bound_list, self.plane(
+            self.axis2_placement_3d(origin, normalize(zdir),
+                                    normalize(direction))), True)
+
+    def cylinder_face(self, segment, geom_depth_list):
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        loop_ln = self.edge_loop([
+            self.contour_edge(segment, z_pos),
+            self.line_edge(list(map(operator.add, segment[2], [0, 0, z_pos])),
+                           list(map(operator.add, segment[2],
+                                    [0, 0, z_neg]))),
+            self.contour_edge(segment, z_neg, True),
+            self.line_edge(list(map(operator.add, segment[1], [0, 0, z_neg])),
+                           list(map(operator.add, segment[1],
+                                    [0, 0, z_pos])))])
+        return self.advanced_face(
+            self.face_outer_bound(loop_ln, True), self.cylindrical_surface(
+                list(map(operator.add, segment[3], [0, 0, z_neg])),
+                segment[4]), not segment[5])
+
+    def af2d3d_contour(self, contour, geom_depth_list, hole_contour_list=()):
+        taflist = []
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        taflist.append(self.contour_cap(contour, z_pos, [0, 0, 1],
+                                        hole_contour_list))
+        taflist.append(self.contour_cap(contour, z_neg, [0, 0, -1],
+                                        hole_contour_list))
+        for segment in [x for k in [contour] + list(hole_contour_list) for
+                        x in k]:
+            if segment[0] == 'line':
+                taflist.append(
+                    self.zface(segment[1], segment[2], geom_depth_list))
+            else:
+                taflist.append(self.cylinder_face(segment, geom_depth_list))
+        return taflist
+
+    def coordinates_list(self, coord_list):
+        return self.new_item('coordinates_list', len(coord_list) // 3,
+                             coord_list)
+
+    def triangulated_face(self, coordinates_list_ln, point_count,
+                          triangle_list):
+        return self.new_item('triangulated_face', coordinates_list_ln,
+                             point_count, triangle_list)
+
+    def tessellated_solid(self, triangulated_face_ln_list):
+        ts = self.new_item('tessellated_solid', self.part_body_index,
+                           triangulated_face_ln_list)
+        self.part_body_index += 1
+        return ts
+
+    def tessellated_part(self, vertex_list, geom_depth_list, hole_list=()):
+        # points 1..n are the bottom and n+1..2n the top of the clockwise
+        # contour followed by its counter-clockwise holes; the caps and the
+        # side walls index the same list
+        z_neg = geom_depth_list[0]
+        z_pos = geom_depth_list[1]
+        loop_list = [vertex_list] + list(hole_list)
+        n = sum(map(len, loop_list))
+        coordinates_ln = self.coordinates_list(
+            [x for depth in [z_neg, z_pos] for loop in loop_list for vertex
+             in loop for x in (vertex[0], vertex[1], vertex[2] + depth)])
+        triangle_list = triangulate_polygon(vertex_list, hole_list)
+        top_list = [k + n + 1 for triangle in triangle_list for k in triangle]
+        bottom_list = [k + 1 for triangle in triangle_list for k in
+                       triangle[::-1]]
+        side_list = []
+        offset = 0
+        for loop in loop_list:
+            for k in range(offset, offset + len(loop)):
+                j = offset + (k - offset + 1) % len(loop)
+                side_list += [k + 1, k + n + 1, j + n + 1, k + 1, j + n + 1,
+                              j + 1]
+            offset += len(loop)
+        return self.tessellated_solid([
+            self.triangulated_face(coordinates_ln, 2 * n, x) for x in
+            [top_list, bottom_list, side_list]])
+
+    def representation_map(self, manifold_solid_brep_ln, init_ln=45):
+        origin_ln = self.axis2_placement_3d([0, 0, 0], [0, 0, 1], [1, 0, 0])
+        return self.new_item('representation_map', origin_ln,
+                             self.shape_representation(
+                                 [manifold_solid_brep_ln, origin_ln], init_ln))
+
+    def mapped_item(self, representation_map_ln, transform, geom_depth_list):
+        # a mirror image of the extruded solid is its rotation by 180 degrees
+        # about an axis in the middle plane of the z interval
+        cos_angle, sin_angle, dx, dy, mirror_p = transform or (
+            1.0, 0.0, 0.0, 0.0, False)
+        return self.new_item('mapped_item', representation_map_ln,
+                             self.axis2_placement_3d(
+                                 [dx, dy, geom_depth_list[0] +
+                                  geom_depth_list[1] if mirror_p else 0],
+                                 [0, 0, -1 if mirror_p else 1],
+                                 [cos_angle, sin_angle, 0]))
+
+    def af_list_2_assembly(self, af_list):
+        return self.shape_representation_relationship(
+            self.manifold_solid_brep(self.closed_shell(af_list)))
+
+    def af_list_2_part(self, af_list):
+        return self.manifold_solid_brep(self.closed_shell(af_list))
+
+    def part_2_assembly(self, part_list):
+        if self.assembly is not None:
+            brep_shape_ln, brep_part_list, assembly_ln = self.assembly
+            brep_part_list.extend(part_list)
+            self.entity_table.replace(brep_shape_ln, entity_record(
+                'tessellated_shape_representation' if self.tessellate else
+                'advanced_brep_shape_representation', brep_part_list, 45))
+            return assembly_ln
+        return self.shape_representation_relationship(
+            self.shape_representation(part_list))
+
+    def load(self, file_in_name):
+        if self.stream is not None:
+            raise StepfgError(
+                "Error. Parts cannot be appended in streaming mode.")
+        entity_lines = []
+        brep_shape_dict = {}
+        representation_type = 'TESSELLATED_SHAPE_REPRESENTATION' if \
+            self.tessellate else 'ADVANCED_BREP_SHAPE_REPRESENTATION'
+        assembly = None
+        part_body_index = 1
+        with open_input(file_in_name) as file_in:
+            for file_line in file_in:
+                if not file_line.startswith('#'):
+                    continue
+                entity_ln = line_index(file_line)
+                if entity_ln < self.entity_table.current_index:
+                    continue
+                entity_lines.append(file_line)
+                entity_type = file_line[file_line.index('=') + 1:
+                                        file_line.index('(')]
+                if entity_type in ['MANIFOLD_SOLID_BREP',
+                                   'TESSELLATED_SOLID']:
+                    part_body_index = max(part_body_index, int(re.search(
+                        r"'PartBody\.(\d+)'", file_line).group(1)) + 1)
+                elif entity_type == representation_type:
+                    brep_shape_dict[entity_ln] = [int(k) for k in re.findall(
+                        r'#(\d+)', file_line[:file_line.index(')')])][1:]
+                elif entity_type == 'SHAPE_REPRESENTATION_RELATIONSHIP':
+                    assembly = entity_ln, int(
+                        re.findall(r'#(\d+)', file_line)[-1])
+        if assembly is None or assembly[1] not in brep_shape_dict:
+            raise StepfgError(
+                "Error. " + str(file_in_name) + " is not a " + (
+                    "tessellated " if self.tessellate else "B-rep ") +
+                "STEP file written by stepfg.")
+        self.entity_table.load(entity_lines)
+        self.part_body_index = part_body_index
+        self.assembly = assembly[1], brep_shape_dict[assembly[1]], assembly[0]
+
+    def generate_part(self, vert_list, geom_depth, clockwise_p=True,
+                      hole_list=()):
+        self.edges = {}
+        if not clockwise_p:
+            hole_list = [x[::-1] for x in hole_list]
+        if self.tessellate:
+            vert_list = vert_list.tolist() if hasattr(
+                vert_list, 'tolist') else list(vert_list)
+            return self.tessellated_part(
+                vert_list if clockwise_p else vert_list[::-1], geom_depth,
+                hole_list)
+        if self.arc_tolerance is not None:
+            vert_list = vert_list.tolist() if hasattr(
+                vert_list, 'tolist') else list(vert_list)
+            contour_list = [fit_arcs(x, self.arc_tolerance) for x in [
+                vert_list if clockwise_p else vert_list[::-1]] + list(
+                hole_list)]
+            for loop_list, contour in zip([vert_list] + list(hole_list),
+                                          contour_list):
+                arc_count = sum(1 for x in contour if x[0] == 'arc')
+                self.fitted_arcs += arc_count
+                self.arc_segments += len(loop_list) - len(contour) + arc_count
+            return self.af_list_2_part(
+                self.af2d3d_contour(contour_list[0], geom_depth,
+                                    contour_list[1:]))
+        if hole_list:
+            vert_list = vert_list.tolist() if hasattr(
+                vert_list, 'tolist') else list(vert_list)
+            return self.af_list_2_part(self.af2d3d(
+                vert_list if clockwise_p else vert_list[::-1], geom_depth,
+                hole_list))
+        if self.use_numpy:
+            return self.af_list_2_part(
+                self.af2d3d_array(vert_list if clockwise_p else vert_list[
+                                                                ::-1],
+                                  geom_depth))
+        return self.af_list_2_part(
+            self.af2d3d(vert_list, geom_depth)) if clockwise_p else \
+            self.af_list_2_part(self.af2d3d(reversed(vert_list), geom_depth))
+
+    def splice_part(self, fragment, counters=(0, 0)):
+        self.fitted_arcs += counters[0]
+        self.arc_segments += counters[1]
+        entity_ln_list = []
+        for record in fragment:
+            entity_ln_list.append(self.new_record(
+                relocate_entity(record, entity_ln_list)))
+        if self.tessellate:
+            face_code = ENTITY_KINDS['triangulated_face'].code
+            return self.tessellated_solid(
+                [entity_ln for record, entity_ln in zip(
+                    fragment, entity_ln_list) if record[0] == face_code])
+        return self.manifold_solid_brep(entity_ln_list[-1])
+
+    def cached_part(self, vert_list, geom_depth_list, hole_list=()):
+        key = self.part_cache.key(vert_list, geom_depth_list,
+                                  self.shared_edges, self.arc_tolerance,
+                                  self.tessellate, hole_list)
+        cache_entry = self.part_cache.get(key)
+        if cache_entry is not None:
+            return self.splice_part(*cache_entry)
+        part_ln, fragment, counters = self.record_part(
+            vert_list, geom_depth_list, hole_list)
+        self.part_cache.put(key, fragment, counters)
+        return part_ln
+
+    def record_part(self, vert_list, geom_depth_list, hole_list=()):
+        counters = [self.fitted_arcs, self.arc_segments]
+        self.recording = []
+        try:
+            part_ln = self.generate_part(vert_list, geom_depth_list,
+                                         hole_list=hole_list)
+            item_list = self.recording
+        finally:
+            self.recording = None
+        return part_ln, relative_fragment(item_list[:-1]), [
+            self.fitted_arcs - counters[0], self.arc_segments - counters[1]]
+
+    def part_fragments(self, list_vert_list, geom_depth_list,
+                       hole_list_list):
+        options = {'shared_edges': self.shared_edges,
+                   'use_numpy': self.use_numpy,
+                   'arc_tolerance': self.arc_tolerance,
+                   'tessellate': self.tessellate}
+        key_list = [None] * len(list_vert_list)
+        entry_list = [None] * len(list_vert_list)
+        if self.part_cache is not None:
+            for k, vert_list in enumerate(list_vert_list):
+                key_list[k] = self.part_cache.key(
+                    vert_list, geom_depth_list, self.shared_edges,
+                    self.arc_tolerance, self.tessellate, hole_list_list[k])
+                cache_entry = self.part_cache.get(key_list[k])
+                if cache_entry is not None:
+                    entry_list[k] = cache_entry
+        missing_list = [k for k in range(len(list_vert_list)) if
+                        entry_list[k] is None]
+        with ProcessPoolExecutor(self.workers or None) as executor:
+            fragment_iter = executor.map(
+                generate_part_fragment,
+                [list_vert_list[k] for k in missing_list],
+                [geom_depth_list] * len(missing_list),
+                [options] * len(missing_list),
+                [hole_list_list[k] for k in missing_list],
+                chunksize=max(1, len(missing_list) // (
+                        4 * (self.workers or os.cpu_count() or 1))))
+            for k in range(len(list_vert_list)):
+                if entry_list[k] is None:
+                    entry_list[k] = next(fragment_iter)
+                    if self.part_cache is not None:
+                        self.part_cache.put(key_list[k], *entry_list[k])
+                yield entry_list[k]
+                entry_list[k] = None
+
+    def generate_assembly(self, list_vert_list, geom_depth_list, p_coeff=1):
+        with self.phase('validate'):
+            geom_depth_list = check_assembly_input(
+                list_vert_list, geom_depth_list, p_coeff)
+            if self.check_geometry:
+                validate_polygons(list_vert_list,
+                                  overlap_p=self.union_tolerance is None)
+        with self.phase('prepare'):
+            list_vert_list, geom_depth_list = (
+                prepare_assembly_arrays if self.use_numpy else
+                prepare_assembly_input)(list_vert_list, geom_depth_list,
+                                        p_coeff, False)
+        if self.weld_tolerance:
+            with self.phase('weld'):
+                list_vert_list, self.welded_vertices, \
+                    self.removed_vertices = weld_vertices(
+                        list_vert_list, self.weld_tolerance)
+                if self.use_numpy:
+                    list_vert_list = [np.array(x) for x in list_vert_list]
+        hole_list_list = [[] for _ in list_vert_list]
+        if self.union_tolerance is not None:
+            with self.phase('union'):
+                polygon_count = len(list_vert_list)
+                list_vert_list, hole_list_list, self.merged_polygons = \
+                    union_polygons(list_vert_list, self.union_tolerance)
+                self.union_solids = len(list_vert_list) - polygon_count + \
+                    self.merged_polygons
+                self.union_holes = sum(map(len, hole_list_list))
+                if self.use_numpy:
+                    list_vert_list = [np.asarray(x, dtype=float) for x in
+                                      list_vert_list]
+        if self.simplify_tolerance is not None:
+            with self.phase('simplify'):
+                list_vert_list, self.simplified_vertices = simplify_polygons(
+                    list_vert_list, self.simplify_tolerance)
+                for k, hole_list in enumerate(hole_list_list):
+                    if hole_list:
+                        hole_list_list[k], removed_count = simplify_polygons(
+                            hole_list, self.simplify_tolerance)
+                        self.simplified_vertices += removed_count
+        instance_list = [None] * len(list_vert_list)
+        if self.instance_tolerance is not None:
+            with self.phase('instances'):
+                # parts with holes are not matched by their outer contour
+                plain_index_list = [k for k, x in enumerate(hole_list_list) if
+                                    not x]
+                for k, instance in zip(plain_index_list, congruent_instances(
+                        [list_vert_list[k] for k in plain_index_list],
+                        self.instance_tolerance)):
+                    instance_list[k] = None if instance is None else (
+                        plain_index_list[instance[0]], instance[1])
+        self.instance_solids = sum(1 for k, x in enumerate(instance_list) if
+                                   x is not None and x[0] == k)
+        self.instanced_parts = sum(1 for k, x in enumerate(instance_list) if
+                                   x is not None and x[0] != k)
+        solid_index_list = [k for k, x in enumerate(instance_list) if
+                            x is None or x[1] is None]
+        if self.stream is not None:
+            with self.phase('write'):
+                self.write_header(self.stream)
+        part_list = []
+        map_dict = {}
+        # a single worker process would only add pickling to the
+        # sequential path
+        fragment_iter = None if self.workers is None or (
+            self.workers or os.cpu_count() or 1) < 2 or len(
+            solid_index_list) < 2 else self.part_fragments(
+            [list_vert_list[k] for k in solid_index_list], geom_depth_list,
+            [hole_list_list[k] for k in solid_index_list])
+        for k, vert_list in enumerate(list_vert_list):
+            with self.phase('parts'):
+                instance = instance_list[k]
+                if instance is not None and instance[1] is not None:
+                    part_ln = self.mapped_item(map_dict[instance[0]],
+                                               instance[1], geom_depth_list)
+                elif fragment_iter is not None:
+                    part_ln = self.splice_part(*next(fragment_iter))
+                elif self.part_cache is not None:
+                    part_ln = self.cached_part(vert_list, geom_depth_list,
+                                               hole_list_list[k])
+                else:
+                    part_ln = self.generate_part(
+                        vert_list, geom_depth_list,
+                        hole_list=hole_list_list[k])
+                if instance is not None and instance[1] is None:
+                    map_dict[k] = self.representation_map(part_ln)
+                    part_ln = self.mapped_item(map_dict[k], None,
+                                               geom_depth_list)
+                part_list.append(part_ln)
+            self.flush()
+        with self.phase('assembly'):
+            assembly_ln = self.part_2_assembly(part_list)
+        if self.stream is not None:
+            self.flush()
+            with self.phase('write'):
+                self.write_footer(self.stream)
+        return assembly_ln
+
+    def flush(self):
+        if self.stream is not None:
+            with self.phase('write'):
+                if self.stats is not None:
+                    self.stats.count_entities(self.entity_table.records)
+                self.entity_table.flush(self.stream)
+
+    def write_header(self, file_out):
+        file_out.write(''.join(self.file_array[:self.index1]))
+
+    def write_footer(self, file_out):
+        file_out.write(''.join(self.file_array[self.index1 + 1:]))
+
+    def lines(self):
+        yield from self.file_array[:self.index1]
+        yield from self.entity_table.lines()
+        yield from self.file_array[self.index1 + 1:]
+
+    def to_string(self):
+        return ''.join(self.lines())
+
+    def write(self, file_out, chunk_lines=4096):
+        lines = self.lines()
+        while True:
+            chunk = ''.join(itertools.islice(lines, chunk_lines))
+            if not chunk:
+                break
+            file_out.write(chunk)
+
+
+def generate_part_fragment(vert_list, geom_depth_list, options,
+                           hole_list=()):
+    return StepWriter(**options).record_part(vert_list, geom_depth_list,
+                                             hole_list)[1:]
+
+
+def generate_assembly(list_vert_list, geom_depth_list, p_coeff=1,
+                      file_out_name='part_out.stp', **options):
+    step_writer = StepWriter(file_out_name, **options)
+    step_writer.generate_assembly(list_vert_list, geom_depth_list, p_coeff)
+    return step_writer.to_string()
+
+
+COMPRESSED_SUFFIXES = {'gzip': '.stp.gz', 'zip': '.stpZ'}
+
+
+def output_compression(file_out_name, compress=None):
+    if compress is not None:
+        return compress
+    if str(file_out_name).lower().endswith('.gz'):
+        return 'gzip'
+    if Path(file_out_name).suffix.lower() == '.stpz':
+        return 'zip'
+    return None
+
+
+@contextlib.contextmanager
+def open_output(file_out_name, buffer_size=1 << 20, compress=None,
+                compress_level=6):
+    compress = output_compression(file_out_name, compress)
+    if compress not in [None, 'gzip', 'zip']:
+        raise StepfgError(
+            "Error. Unknown output compression " + str(compress) + ".")
+    if compress is not None and compress_level not in range(10):
+        raise StepfgError(
+            "Error. The compression level must be an integer from 0 to 9," +
+            " not " + str(compress_level) + ".")
+    opened_p = False
+    try:
+        if compress is None:
+            with open(file_out_name, 'w+', buffer_size) as file_out:
+                opened_p = True
+                yield file_out
+        elif compress == 'gzip':
+            with gzip.GzipFile(file_out_name, 'wb',
+                               compress_level) as gzip_out:
+                opened_p = True
+                with io.TextIOWrapper(io.BufferedWriter(
+                        gzip_out, buffer_size)) as file_out:
+                    yield file_out
+        else:
+            with zipfile.ZipFile(file_out_name, 'w', zipfile.ZIP_DEFLATED,
+                                 compresslevel=compress_level) as zip_out:
+                opened_p = True
+                # the member is closed before the archive, also on errors
+                with io.TextIOWrapper(io.BufferedWriter(zip_out.open(
+                        Path(file_out_name).stem + '.stp', 'w',
+                        force_zip64=True), buffer_size)) as file_out:
+                    yield file_out
+    except BaseException:
+        # a partial file must not pass for a finished conversion
+        if opened_p:
+            Path(file_out_name).unlink(missing_ok=True)
+        raise
+
+
+@contextlib.contextmanager
+def open_input(file_in_name):
+    compress = output_compression(file_in_name)
+    if compress is None:
+        with open(file_in_name, 'r') as file_in:
+            yield file_in
+    elif compress == 'gzip':
+        with gzip.open(file_in_name, 'rt') as file_in:
+            yield file_in
+    else:
+        with zipfile.ZipFile(file_in_name) as zip_in:
+            with io.TextIOWrapper(zip_in.open(
+                    zip_in.namelist()[0])) as file_in:
+                yield file_in
+
+
+def convert_file(file_in_name, file_out_name, stream=False,
+                 buffer_size=1 << 20, compress=None, compress_level=6,
+                 **options):
+    if not Path(file_in_name).is_file():
+        raise StepfgError(
+            "Error. 2D geometry file " + str(file_in_name) +
+            " doesn't exist.")
+    in_array, in_depth, in_coeff = read_geometry(file_in_name)
+    if stream:
+        with open_output(file_out_name, buffer_size, compress,
+                         compress_level) as file_out:
+            step_writer = StepWriter(str(file_out_name), stream=file_out,
+                                     **options)
+            step_writer.generate_assembly(in_array, in_depth, in_coeff)
+    else:
+        step_writer = StepWriter(str(file_out_name), **options)
+        step_writer.generate_assembly(in_array, in_depth, in_coeff)
+        with open_output(file_out_name, buffer_size, compress,
+                         compress_level) as file_out:
+            step_writer.write(file_out)
+    return len(step_writer.entity_table)
+
+
+def batch_jobs(source, output_dir=None, suffix='.stp'):
+    if Path(source).is_dir():
+        file_in_list = sorted(str(k) for k in Path(source).iterdir() if
+                              k.suffix.lower() in GEOMETRY_READERS)
+        jobs = [(k, None) for k in file_in_list]
+    elif Path(source).is_file():
+        jobs = []
+        with open(source, 'r') as manifest:
+            for manifest_line in manifest:
+                fields = manifest_line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                jobs.append((fields[0], fields[1] if len(fields) > 1 else
+                             None))
+    else:
+        jobs = [(k, None) for k in sorted(glob.glob(source))]
+    if not jobs:
+        raise StepfgError(
+            "batch_jobs: Error. No input files found for " + source + ".")
+    if output_dir is not None:
+        try:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+        except OSError as err:
+            raise StepfgError(
+                "batch_jobs: Error. Cannot create the output directory " +
+                str(output_dir) + ": " + str(err) + ".")
+    resulting_jobs = []
+    for file_in_name, file_out_name in jobs:
+        if file_out_name is None:
+            file_out_name = Path(file_in_name).with_suffix(suffix)
+            if output_dir is not None:
+                file_out_name = Path(output_dir) / file_out_name.name
+        resulting_jobs.append((str(file_in_name), str(file_out_name)))
+    return resulting_jobs
+
+
+def run_batch(jobs, workers=None, **options):
+    failed = []
+    entity_count = 0
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(convert_file, file_in_name, file_out_name,
+                            **options): (file_in_name, file_out_name) for
+            file_in_name, file_out_name in jobs}
+        for future in as_completed(futures):
+            file_in_name, file_out_name = futures[future]
+            try:
+                entity_count += future.result()
+            except Exception as err:
+                failed.append(file_in_name)
+                print("[FAILED] " + file_in_name + ": " + str(err))
+            else:
+                print("[DONE]   " + file_in_name + " -> " + file_out_name)
+    elapsed = time.perf_counter() - start_time
+    converted = len(jobs) - len(failed)
+    print("\nConverted " + str(converted) + " of " + str(
+        len(jobs)) + " files in " + format(elapsed, '.3f') + " s (" + format(
+        converted / elapsed, '.2f') + " files/s, " + format(
+        entity_count / elapsed, '.0f') + " entities/s).")
+    return failed
+
+
+SERVER_OPTIONS = {'shared_edges', 'use_numpy', 'weld_tolerance',
+                  'simplify_tolerance', 'arc_tolerance', 'check_geometry',
+                  'instance_tolerance', 'tessellate', 'union_tolerance',
+                  'cache_dir', 'cache_size'}
+STREAM_LIMIT = 1 << 28
+
+
+def convert_request(list_vert_list, geom_depth_list, p_coeff=1,
+                    options=None, file_out_name=None):
+    step_writer = StepWriter(
+        'part_out.stp' if file_out_name is None else file_out_name,
+        **(options or {}))
+    step_writer.generate_assembly(list_vert_list, geom_depth_list, p_coeff)
+    if file_out_name is None:
+        return step_writer.to_string(), len(step_writer.entity_table)
+    with open_output(file_out_name) as file_out:
+        step_writer.write(file_out)
+    return None, len(step_writer.entity_table)
+
+
+class ConversionServer:
+    def __init__(self, workers=None, max_pending=None, options=None,
+                 latency_window=10000):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.max_pending = max_pending or 2 * self.workers
+        self.options = options or {}
+        self.semaphore = None
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.completed = 0
+        self.failed = 0
+        self.pending = 0
+
+    def warm_up(self):
+        for future in [self.executor.submit(pow, 0, 0) for _ in
+                       range(self.workers)]:
+            future.result()
+
+    def latency_report(self):
+        latency_list = sorted(self.latencies)
+        report = {'completed': self.completed, 'failed': self.failed,
+                  'pending': self.pending}
+        if latency_list:
+            for name, fraction in [('p50', 0.5), ('p90', 0.9),
+                                   ('p99', 0.99), ('max', 1.0)]:
+                report[name] = latency_list[
+                    max(math.ceil(fraction * len(latency_list)) - 1, 0)]
+        return report
+
+    async def process(self, request):
+        start_time = time.perf_counter()
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise StepfgError("Error. Request is not a JSON object.")
+            if request.get('command') == 'stats':
+                return {'id': request_id, 'ok': True,
+                        'stats': self.latency_report()}
+            options = dict(self.options, **request.get('options', {}))
+            if not set(options) <= SERVER_OPTIONS:
+                raise StepfgError("Error. Unknown options: " + ', '.join(
+                    sorted(set(options) - SERVER_OPTIONS)) + ".")
+            step_text, entity_count = \
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, convert_request, request['polygons'],
+                    request['z_interval'], request.get('coeff', 1), options,
+                    request.get('output'))
+        except Exception as err:
+            self.failed += 1
+            return {'id': request_id, 'ok': False,
+                    'error': str(err) if isinstance(err, StepfgError) else
+                    type(err).__name__ + ": " + str(err)}
+        latency = time.perf_counter() - start_time
+        self.latencies.append(latency)
+        self.completed += 1
+        response = {'id': request_id, 'ok': True, 'entities': entity_count,
+                    'latency': latency}
+        if step_text is None:
+            response['path'] = request['output']
+        else:
+            response['step'] = step_text
+        return response
+
+    async def respond(self, request_line, writer, write_lock):
+        self.pending += 1
+        try:
+            try:
+                request = json.loads(request_line)
+            except ValueError as err:
+                self.failed += 1
+                response = {'id': None, 'ok': False,
+                            'error': "Error. Invalid JSON: " + str(err)}
+            else:
+                response = await self.process(request)
+            async with write_lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        finally:
+            self.pending -= 1
+            self.semaphore.release()
+
+    async def handle(self, reader, writer):
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                # stop reading while max_pending requests are in flight,
+                # so that a fast client is throttled by the transport
+                await self.semaphore.acquire()
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    self.semaphore.release()
+                    if not request_line:
+                        break
+                    continue
+                task = asyncio.ensure_future(
+                    self.respond(request_line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+    async def serve(self, address='stdio'):
+        self.semaphore = asyncio.Semaphore(self.max_pending)
+        self.warm_up()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        if address == 'stdio':
+            reader = asyncio.StreamReader(STREAM_LIMIT)
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            transport, protocol = await loop.connect_write_pipe(
+                asyncio.streams.FlowControlMixin, sys.stdout)
+            await self.handle(reader, asyncio.StreamWriter(
+                transport, protocol, reader, loop))
+            return
+        if address.startswith('unix:'):
+            server = await asyncio.start_unix_server(
+                self.handle, address[len('unix:'):], limit=STREAM_LIMIT)
+        else:
+            host, _, port = address[len('tcp:') if address.startswith(
+                'tcp:') else 0:].rpartition(':')
+            server = await asyncio.start_server(
+                self.handle, host or '127.0.0.1', int(port),
+                limit=STREAM_LIMIT)
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(address='stdio', workers=None, max_pending=None,
+               options=None):
+    server = ConversionServer(workers, max_pending, options)
+    print("stepfg server on " + address + " with " + str(
+        server.workers) + " workers, at most " + str(
+        server.max_pending) + " pending requests.", file=sys.stderr)
+    try:
+        asyncio.run(server.serve(address))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.executor.shutdown()
+        print("stepfg server stopped: " + json.dumps(
+            server.latency_report()), file=sys.stderr)
+
+
+def read_geometry_literal(file_in_name):
+    with open(file_in_name, 'r') as file_in:
+        data = ast.literal_eval(file_in.read())
+    if not isinstance(data, list):
+        raise StepfgError("Error. Input data is not a list.")
+    if len(data) != 3:
+        raise StepfgError(
+            "Error. The top-level length of the input data list" +
+            " is not 3.")
+    return data[0], data[1], data[2]
+
+
+def vertex_buffer_polygon(vertex_buffer):
+    if np is not None:
+        return np.frombuffer(vertex_buffer, dtype=float).reshape(-1, 3)
+    return [list(vertex_buffer[k:k + 3]) for k in
+            range(0, len(vertex_buffer), 3)]
+
+
+json_token_re = re.compile(r'\s*(?:([\[\],])|([^\s\[\],]+))')
+json_number_re = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+
+def read_geometry_json(file_in_name, chunk_size=1 << 20):
+    polygons = []
+    geom_depth_list = []
+    p_coeff = None
+    vertex_buffer = None
+    vertex_length = 0
+    depth = 0
+    top_element = 0
+    # a value is expected at the start, after '[' and after ','; a closing
+    # bracket right after '[' closes an empty list
+    value_expected_p = True
+    list_opened_p = False
+    closed_p = False
+    tail = ''
+    with open(file_in_name, 'r') as file_in:
+        while True:
+            chunk = file_in.read(chunk_size)
+            text = tail + chunk
+            if chunk:
+                split_index = max(text.rfind(','), text.rfind(']'),
+                                  text.rfind('[')) + 1
+                text, tail = text[:split_index], text[split_index:]
+            else:
+                tail = ''
+            for token in json_token_re.finditer(text):
+                bracket, word = token.groups()
+                if closed_p or (bracket == '[' or word is not None) != \
+                        value_expected_p and not (
+                        bracket == ']' and list_opened_p):
+                    raise StepfgError(
+                        "read_geometry: Error. Invalid JSON at " + (
+                            bracket or word) + " in " + str(file_in_name) +
+                        ".")
+                list_opened_p = bracket == '['
+                value_expected_p = bracket in ['[', ',']
+                if bracket == '[':
+                    depth += 1
+                    if depth > (4, 2, 1)[top_element]:
+                        raise StepfgError(
+                            "read_geometry: Error. Unexpected nesting in " +
+                            str(file_in_name) + ".")
+                    if top_element == 0 and depth == 3:
+                        vertex_buffer = array('d')
+                    elif top_element == 0 and depth == 4:
+                        vertex_length = 0
+                elif bracket == ']':
+                    if top_element == 0 and depth == 4:
+                        if vertex_length == 2:
+                            vertex_buffer.append(0.0)
+                        elif vertex_length != 3:
+                            raise StepfgError(
+                                "read_geometry: Error. Number of vertex" +
+                                " coordinates should be 2 or 3, " + str(
+                                    vertex_length) + " coordinates supplied.")
+                    elif top_element == 0 and depth == 3:
+                        polygons.append(vertex_buffer_polygon(vertex_buffer))
+                    depth -= 1
+                    closed_p = depth == 0
+                elif bracket == ',':
+                    if depth == 1:
+                        top_element += 1
+                        if top_element > 2:
+                            raise StepfgError(
+                                "Error. The top-level length of the input" +
+                                " data list is not 3.")
+                elif json_number_re.fullmatch(word) is None:
+                    raise StepfgError(
+                        "read_geometry: Error. Unexpected value " + word +
+                        " in " + str(file_in_name) + ".")
+                elif not math.isfinite(float(word)):
+                    raise StepfgError(
+                        "read_geometry: Error. Value " + word + " out of" +
+                        " range in " + str(file_in_name) + ".")
+                elif top_element == 0 and depth == 4:
+                    vertex_buffer.append(float(word))
+                    vertex_length += 1
+                elif top_element == 1 and depth == 2:
+                    geom_depth_list.append(float(word))
+                elif top_element == 2 and depth == 1:
+                    p_coeff = float(word)
+                else:
+                    raise StepfgError(
+                        "read_geometry: Error. Unexpected value " + word +
+                        " in " + str(file_in_name) + ".")
+            if not chunk:
+                break
+    if depth != 0 or p_coeff is None:
+        raise StepfgError(
+            "Error. The top-level length of the input data list" +
+            " is not 3.")
+    return polygons, geom_depth_list, p_coeff
+
+
+def read_geometry_csv(file_in_name):
+    polygons = []
+    geom_depth_list = None
+    p_coeff = None
+    vertex_buffer = array('d')
+    with open(file_in_name, 'r') as file_in:
+        for line_number, csv_line in enumerate(file_in, 1):
+            csv_line = csv_line.strip()
+            if not csv_line or csv_line.startswith('#'):
+                if csv_line == '' and vertex_buffer:
+                    polygons.append(vertex_buffer_polygon(vertex_buffer))
+                    vertex_buffer = array('d')
+                continue
+            fields = [k.strip() for k in csv_line.split(',')]
+            try:
+                if fields[0] == 'z_interval':
+                    geom_depth_list = [float(k) for k in fields[1:]]
+                elif fields[0] == 'coeff':
+                    p_coeff = float(fields[1])
+                elif 2 <= len(fields) <= 3:
+                    vertex_buffer.extend(map(float, fields))
+                    if len(fields) == 2:
+                        vertex_buffer.append(0.0)
+                else:
+                    raise StepfgError(
+                        "read_geometry: Error. Number of vertex" +
+                        " coordinates should be 2 or 3, " + str(
+                            len(fields)) + " coordinates supplied.")
+            except (ValueError, IndexError):
+                raise StepfgError(
+                    "read_geometry: Error. Cannot parse line " + str(
+                        line_number) + " of " + str(file_in_name) + ".")
+    if vertex_buffer:
+        polygons.append(vertex_buffer_polygon(vertex_buffer))
+    if geom_depth_list is None or p_coeff is None:
+        raise StepfgError(
+            "read_geometry: Error. z_interval or coeff row missing in " +
+            str(file_in_name) + ".")
+    return polygons, geom_depth_list, p_coeff
+
+
+def npz_member(npz_file, zip_info, file_in_name):
+    if zip_info.compress_type != zipfile.ZIP_STORED:
+        return np.load(npz_file.open(zip_info))
+    with open(file_in_name, 'rb') as file_in:
+        file_in.seek(zip_info.header_offset)
+        local_header = file_in.read(30)
+        file_in.seek(zip_info.header_offset + 30 + int.from_bytes(
+            local_header[26:28], 'little') + int.from_bytes(
+            local_header[28:30], 'little'))
+        shape, fortran_order, dtype = (
+            np.lib.format.read_array_header_1_0 if
+            np.lib.format.read_magic(file_in) == (1, 0) else
+            np.lib.format.read_array_header_2_0)(file_in)
+        offset = file_in.tell()
+    if dtype.hasobject:
+        raise StepfgError(
+            "read_geometry: Error. Object arrays are not supported in " +
+            str(file_in_name) + ".")
+    return np.memmap(file_in_name, dtype=dtype, mode='r', offset=offset,
+                     shape=shape, order='F' if fortran_order else 'C')
+
+
+def read_geometry_npz(file_in_name):
+    require_numpy()
+    members = {}
+    with zipfile.ZipFile(file_in_name) as npz_file:
+        for zip_info in npz_file.infolist():
+            members[zip_info.filename[:-4] if zip_info.filename.endswith(
+                '.npy') else zip_info.filename] = npz_member(
+                npz_file, zip_info, file_in_name)
+    if 'z_interval' not in members or 'coeff' not in members:
+        raise StepfgError(
+            "read_geometry: Error. z_interval or coeff array missing in " +
+            str(file_in_name) + ".")
+    polygon_names = sorted(
+        (k for k in members if k.startswith('polygon_')),
+        key=lambda k: int(k[len('polygon_'):]))
+    return [members[k] for k in polygon_names], members[
+        'z_interval'].tolist(), members['coeff'].item()
+
+
+def write_geometry_npz(file_out_name, list_vert_list, geom_depth_list,
+                       p_coeff):
+    require_numpy()
+    np.savez(file_out_name, z_interval=np.asarray(geom_depth_list),
+             coeff=np.asarray(p_coeff),
+             **{'polygon_' + str(k): polygon_array(part_element) for
+                k, part_element in enumerate(list_vert_list)})
+
+
+GEOMETRY_READERS = {'.txt': read_geometry_literal,
+                    '.json': read_geometry_json,
+                    '.csv': read_geometry_csv,
+                    '.npz': read_geometry_npz}
+
+
+def read_geometry(file_in_name):
+    return GEOMETRY_READERS.get(Path(file_in_name).suffix.lower(),
+                                read_geometry_literal)(file_in_name)
+
+
+def print_banner():
+    print("----------------------------------------------------")
+    print("                STEP File Generator")
+    print("              E. Valetov and M. Berz")
+    print("             Michigan State University")
+    print("                Created 03-Feb-2017")
+    print("              Email: valetove@msu.edu")
+    print("----------------------------------------------------")
+
+
+def print_preprocessing_report(step_writer):
+    if step_writer.weld_tolerance:
+        print("Vertex welding: " + str(
+            step_writer.welded_vertices) + " vertices snapped, " + str(
+            step_writer.removed_vertices) + " vertices removed.")
+    if step_writer.union_tolerance is not None:
+        print("Union: " + str(
+            step_writer.merged_polygons) + " polygons merged into " + str(
+            step_writer.union_solids) + " solids with " + str(
+            step_writer.union_holes) + " holes.")
+    if step_writer.simplify_tolerance is not None:
+        print("Simplification: " + str(
+            step_writer.simplified_vertices) + " vertices removed.")
+    if step_writer.arc_tolerance is not None:
+        print("Arc fitting: " + str(
+            step_writer.fitted_arcs) + " arcs replace " + str(
+            step_writer.arc_segments) + " segments.")
+    if step_writer.instance_tolerance is not None:
+        print("Instancing: " + str(
+            step_writer.instanced_parts) + " polygons placed as copies of " +
+              str(step_writer.instance_solids) + " solids.")
+    if step_writer.part_cache is not None:
+        print("Part cache: " + str(step_writer.part_cache.hits) +
+              " hits, " + str(step_writer.part_cache.misses) + " misses (" +
+              format(step_writer.part_cache.hit_rate(), '.1%') +
+              " hit rate).")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='stepfg', add_help=False)
+    parser.add_argument('filename_in', nargs='?', default='part_geometry.txt')
+    parser.add_argument('filename_out', nargs='?', default='part_out.stp')
+    parser.add_argument('-h', action='store_true', dest='help')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--append', action='store_true')
+    parser.add_argument('--compress', choices=['gzip', 'zip'])
+    parser.add_argument('--compress-level', type=int, choices=range(10),
+                        default=6)
+    parser.add_argument('--buffer-size', type=int, default=1 << 20)
+    parser.add_argument('--no-shared-edges', action='store_false',
+                        dest='shared_edges')
+    parser.add_argument('--numpy', action='store_true', dest='use_numpy')
+    parser.add_argument('--weld', type=float, nargs='?',
+                        const=DISTANCE_ACCURACY, metavar='TOL')
+    parser.add_argument('--simplify', type=float, nargs='?', const=0.0,
+                        metavar='TOL')
+    parser.add_argument('--arcs', type=float, nargs='?',
+                        const=DISTANCE_ACCURACY, metavar='TOL')
+    parser.add_argument('--validate', action='store_true',
+                        dest='check_geometry')
+    parser.add_argument('--instances', type=float, nargs='?',
+                        const=DISTANCE_ACCURACY, metavar='TOL')
+    parser.add_argument('--tessellate', action='store_true')
+    parser.add_argument('--union', type=float, nargs='?',
+                        const=DISTANCE_ACCURACY, metavar='TOL')
+    parser.add_argument('--cache', metavar='DIR')
+    parser.add_argument('--cache-size', type=int, default=1 << 28)
+    parser.add_argument('--stats', metavar='FILE')
+    parser.add_argument('--profile', metavar='FILE')
+    parser.add_argument('--serve', nargs='?', const='stdio',
+                        metavar='ADDRESS')
+    parser.add_argument('--max-pending', type=int)
+    parser.add_argument('--batch', metavar='SOURCE')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output-dir')
+    args = parser.parse_args(argv)
+    args.help = args.help or '/h' in argv
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_args(argv)
+    options = {'shared_edges': args.shared_edges,
+               'use_numpy': args.use_numpy,
+               'weld_tolerance': args.weld,
+               'simplify_tolerance': args.simplify,
+               'arc_tolerance': args.arcs,
+               'check_geometry': args.check_geometry,
+               'instance_tolerance': args.instances,
+               'tessellate': args.tessellate,
+               'union_tolerance': args.union,
+               'cache_dir': args.cache,
+               'cache_size': args.cache_size}
+    if args.serve is not None and not args.help:
+        # the banner would corrupt the JSON lines on stdout
+        run_server(args.serve, args.workers, args.max_pending, options)
+        return
+
+    print_banner()
+
+    if args.help:
         print(helpstr)
-        sys.exit()
-    file_in2_name = str(sys.argv[1])
-    if (len(sys.argv) > 2):
-        if ((str(sys.argv[2]) == '-h') or (str(sys.argv[2]) == '/h')):
-            print(helpstr)
-            sys.exit()
-        file_out_name = str(sys.argv[2])
-
-print("Use command-line option -h or /h for help.\n")
-
-print("Reading 2D geometry file " + file_in2_name + "... ", end="")
-if not Path(file_in2_name).is_file():
-    print(
-        "[FAILED]\nError. 2D geometry file " + file_in2_name +
-        " doesn't exist.")
-    sys.exit()
-with open(file_in2_name, 'r') as file_in:
-    data = ast.literal_eval(file_in.read())
-if not isinstance(data, list):
-    print("[FAILED]\nError. Input data is not a list.")
-    sys.exit()
-if len(data) != 3:
-    print(
-        "[FAILED]\nError. The top-level length of the input data list is not" +
-        " 3.")
-    sys.exit()
-in_array = data[0]
-in_depth = data[1]
-in_coeff = data[2]
-print("[DONE]")
-
-print("Initializing STEP file data... ", end="")
-d = datetime.datetime.now()
-file_array = ["ISO-10303-21;",
-              "HEADER;",
-              "FILE_DESCRIPTION(('none'),'2;1');",
-              "",
-              "FILE_NAME('" + file_out_name + "','none',('none'),('none')," +
-              "'none','none','none');",
-              "",
-              "FILE_SCHEMA(('CONFIG_CONTROL_DESIGN'));",
-              "",
-              "ENDSEC;",
-              "DATA;",
-              "#1=APPLICATION_CONTEXT('configuration controlled 3D design of" +
-              " mechanical parts and assemblies') ;",
-              "#2=MECHANICAL_CONTEXT(' ',#1,'mechanical') ;",
-              "#3=DESIGN_CONTEXT(' ',#1,'design') ;",
-              "#4=APPLICATION_PROTOCOL_DEFINITION('international standard'," +
-              "'config_control_design',1994,#1) ;",
-              "#5=PRODUCT('Part1','','',(#2)) ;",
-              "#6=PRODUCT_DEFINITION_FORMATION_WITH_SPECIFIED_SOURCE('',' '" +
-              ",#5,.NOT_KNOWN.) ;",
-              "#7=PRODUCT_CATEGORY('part',$) ;",
-              "#8=PRODUCT_RELATED_PRODUCT_CATEGORY('detail',$,(#5)) ;",
-              "#9=PRODUCT_CATEGORY_RELATIONSHIP(' ',' ',#7,#8) ;",
-              "#10=COORDINATED_UNIVERSAL_TIME_OFFSET(0,0,.AHEAD.) ;",
-              "#11=CALENDAR_DATE(" + str(getattr(d, 'year')) + "," + str(
-                  getattr(d, 'month')) + "," + str(
-                  getattr(d, 'day')) + ") ;",
-              "#12=LOCAL_TIME(" + str(getattr(d, 'hour')) + "," + str(
-                  getattr(d, 'minute')) + "," + str(
-                  getattr(d, 'second')) + ".,#10) ;",
-              "#13=DATE_AND_TIME(#11,#12) ;",
-              "#14=PRODUCT_DEFINITION('',' ',#6,#3) ;",
-              "#15=SECURITY_CLASSIFICATION_LEVEL('unclassified') ;",
-              "#16=SECURITY_CLASSIFICATION(' ',' ',#15) ;",
-              "#17=DATE_TIME_ROLE('classification_date') ;",
-              "#18=CC_DESIGN_DATE_AND_TIME_ASSIGNMENT(#13,#17,(#16)) ;",
-              "#19=APPROVAL_ROLE('APPROVER') ;",
-              "#20=APPROVAL_STATUS('not_yet_approved') ;",
-              "#21=APPROVAL(#20,' ') ;",
-              "#22=PERSON(' ',' ',' ',$,$,$) ;",
-              "#23=ORGANIZATION(' ',' ',' ') ;",
-              "#24=PERSONAL_ADDRESS(' ',' ',' ',' ',' ',' ',' ',' ',' '," +
-              "' ',' ',' ',(#22),' ') ;",
-              "#25=PERSON_AND_ORGANIZATION(#22,#23) ;",
-              "#26=PERSON_AND_ORGANIZATION_ROLE('classification_officer') ;",
-              "#27=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#26," +
-              "(#16)) ;",
-              "#28=DATE_TIME_ROLE('creation_date') ;",
-              "#29=CC_DESIGN_DATE_AND_TIME_ASSIGNMENT(#13,#28,(#14)) ;",
-              "#30=CC_DESIGN_APPROVAL(#21,(#16,#6,#14)) ;",
-              "#31=APPROVAL_PERSON_ORGANIZATION(#25,#21,#19) ;",
-              "#32=APPROVAL_DATE_TIME(#13,#21) ;",
-              "#33=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#34," +
-              "(#6)) ;",
-              "#34=PERSON_AND_ORGANIZATION_ROLE('design_supplier') ;",
-              "#35=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#36," +
-              "(#6,#14)) ;",
-              "#36=PERSON_AND_ORGANIZATION_ROLE('creator') ;",
-              "#37=CC_DESIGN_PERSON_AND_ORGANIZATION_ASSIGNMENT(#25,#38," +
-              "(#5)) ;",
-              "#38=PERSON_AND_ORGANIZATION_ROLE('design_owner') ;",
-              "#39=CC_DESIGN_SECURITY_CLASSIFICATION(#16,(#6)) ;",
-              "",
-              "#40=PRODUCT_DEFINITION_SHAPE(' ',' ',#14) ;",
-              "#41=(LENGTH_UNIT()NAMED_UNIT(*)SI_UNIT(.MILLI.,.METRE.)) ;",
-              "#42=(NAMED_UNIT(*)PLANE_ANGLE_UNIT()SI_UNIT($,.RADIAN.)) ;",
-              "#43=(NAMED_UNIT(*)SI_UNIT($,.STERADIAN.)SOLID_ANGLE_UNIT()) ;",
-              "#44=UNCERTAINTY_MEASURE_WITH_UNIT(LENGTH_MEASURE(0.005),#41," +
-              "'distance_accuracy_value','CONFUSED CURVE" +
-              " UNCERTAINTY') ;",
-              "#45=(GEOMETRIC_REPRESENTATION_CONTEXT(3)" +
-              "GLOBAL_UNCERTAINTY_ASSIGNED_CONTEXT((#44))" +
-              "GLOBAL_UNIT_ASSIGNED_CONTEXT((#41,#42,#43))" +
-              "REPRESENTATION_CONTEXT(' ',' ')) ;",
-              "",
-              "#46=CARTESIAN_POINT(' ',(0.,0.,0.)) ;",
-              "#47=AXIS2_PLACEMENT_3D(' ',#46,$,$) ;",
-              "#48=SHAPE_REPRESENTATION(' ',(#47),#45) ;",
-              "#49=SHAPE_DEFINITION_REPRESENTATION(#40,#48) ;",
-              "",
-              "/* Part Specification */",
-              "",
-              "ENDSEC;",
-              "END-ISO-10303-21;"]
-file_array = [i + "\n" for i in file_array]
-
-index1 = file_array.index("/* Part Specification */\n")
-initial_work_array = list(filter(lambda k: k.startswith('#'), file_array))
-
-highest_index = line_index(sorted(initial_work_array, key=line_index)[-1])
-current_index = highest_index + 1
-part_body_index = 1
-work_array = []
-print("[DONE]")
-
-generate_assembly(in_array, in_depth, in_coeff)
+        return
+    file_in2_name = args.filename_in
+    file_out_name = args.filename_out
+
+    print("Use command-line option -h or /h for help.\n")
+
+    if args.batch is not None:
+        try:
+            jobs = batch_jobs(args.batch, args.output_dir,
+                              COMPRESSED_SUFFIXES.get(args.compress, '.stp'))
+        except StepfgError as err:
+            print(str(err))
+            sys.exit(1)
+        print("Converting " + str(len(jobs)) + " files...")
+        if run_batch(jobs, args.workers, stream=args.stream,
+                     buffer_size=args.buffer_size, compress=args.compress,
+                     compress_level=args.compress_level, **options):
+            sys.exit(1)
+        return
+
+    if args.workers is not None:
+        options['workers'] = args.workers
+    stats = RunStats() if args.stats or args.profile else None
+    profiler = None if args.profile is None else start_profile()
+    try:
+        print("Reading 2D geometry file " + file_in2_name + "... ", end="")
+        if not Path(file_in2_name).is_file():
+            raise StepfgError(
+                "Error. 2D geometry file " + file_in2_name +
+                " doesn't exist.")
+        with contextlib.nullcontext() if stats is None else stats.phase(
+                'read'):
+            in_array, in_depth, in_coeff = read_geometry(file_in2_name)
+        print("[DONE]")
+
+        if args.stream and args.append:
+            raise StepfgError(
+                "Error. Parts cannot be appended in streaming mode.")
+        if args.stream:
+            print("Generating and writing STEP file... ", end="")
+            with open_output(file_out_name, args.buffer_size,
+                             args.compress,
+                             args.compress_level) as file_out:
+                step_writer = StepWriter(file_out_name, stream=file_out,
+                                         stats=stats, **options)
+                step_writer.generate_assembly(in_array, in_depth, in_coeff)
+            print("[DONE]")
+            print_preprocessing_report(step_writer)
+        else:
+            print("Initializing STEP file data... ", end="")
+            step_writer = StepWriter(file_out_name, stats=stats, **options)
+            print("[DONE]")
+
+            if args.append and Path(file_out_name).is_file():
+                print("Loading STEP file " + file_out_name + "... ", end="")
+                with step_writer.phase('read'):
+                    step_writer.load(file_out_name)
+                print("[DONE]")
+
+            print("Generating assembly... ", end="")
+            step_writer.generate_assembly(in_array, in_depth, in_coeff)
+            print("[DONE]")
+            print_preprocessing_report(step_writer)
+            print("Writing STEP file... ", end="")
+            with step_writer.phase('write'):
+                with open_output(file_out_name, args.buffer_size,
+                                 args.compress,
+                                 args.compress_level) as file_out:
+                    step_writer.write(file_out)
+            print("[DONE]")
+    except StepfgError as err:
+        print("[FAILED]\n" + str(err))
+        sys.exit(1)
+    finally:
+        if profiler is not None:
+            stop_profile(profiler, args.profile, stats)
+
+    if args.stats:
+        stats.output_bytes = Path(file_out_name).stat().st_size
+        with open(args.stats, 'w') as file_out:
+            json.dump(stats.report(step_writer), file_out, indent=1)
+        print("Statistics written to " + args.stats + ".")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+import stepfg
+
+
+def brute_force_intersections(part_list):
+    n = len(part_list)
+    pair_list = []
+    for j in range(n):
+        for k in range(j + 1, n):
+            if (k - j) % n in [1, n - 1]:
+                # adjacent segments intersect where the contour folds back
+                first, second = (j, k) if (k - j) % n == 1 else (k, j)
+                vertex1, shared, vertex2 = [part_list[x % n] for x in
+                                            [first, second, second + 1]]
+                intersect_p = stepfg.orientation(
+                    vertex1, shared, vertex2) == 0 and (stepfg.on_segment_q(
+                        vertex1, shared, vertex2) or stepfg.on_segment_q(
+                        shared, vertex2, vertex1))
+            else:
+                intersect_p = stepfg.segments_intersect_q(
+                    part_list[j], part_list[(j + 1) % n], part_list[k],
+                    part_list[(k + 1) % n])
+            if intersect_p:
+                pair_list.append((j, k))
+    return pair_list
+
+
+@pytest.mark.parametrize('part_list, expected', [
+    # simple polygons, with vertical segments on a common line
+    ([[0, 0], [3, 0], [3, 3], [0, 3]], []),
+    ([[0, 0], [3, 0], [3, 3], [0, 3], [0, 2], [2, 2], [2, 1], [0, 1]], []),
+    # collinear overlap of non-adjacent segments, whose neighbours touch
+    # the overlapped segment
+    ([[0, 0], [6, 0], [6, 1], [4, 1], [4, 0], [2, 0], [2, -1], [0, -1]],
+     [(0, 3), (0, 4), (0, 5)]),
+    # collinear overlap of non-adjacent vertical segments
+    ([[0, 0], [4, 0], [4, 4], [0, 4], [0, 1], [1, 1], [1, 3], [0, 3]],
+     [(3, 6), (3, 7), (4, 7)]),
+    # adjacent segments folding back on each other
+    ([[0, 0], [4, 0], [4, 2], [4, 1]], [(1, 2), (1, 3)]),
+    # shared endpoint of non-adjacent segments
+    ([[0, 0], [2, 2], [4, 0], [4, 4], [2, 2], [0, 4]],
+     [(0, 3), (0, 4), (1, 3), (1, 4)]),
+    # a vertex on a vertical segment
+    ([[0, 0], [2, 0], [2, 4], [0, 4], [2, 2], [0, 2]], [(1, 3), (1, 4)]),
+    # two vertical segments crossing one edge: every defect is listed
+    ([[0, 0], [4, 0], [4, 4], [2, 4], [2, -2], [1, -2], [1, 4], [0, 4]],
+     [(0, 3), (0, 5)])])
+def test_self_intersections(part_list, expected):
+    assert stepfg.self_intersections(part_list) == expected
+
+
+def test_self_intersections_random_grid():
+    # small integer grids make collinear, vertical and touching segments
+    # common
+    rng = random.Random(0)
+    for _ in range(500):
+        part_list = [[rng.randint(0, 4), rng.randint(0, 4)] for _ in
+                     range(rng.randint(3, 9))]
+        if any(part_list[k - 1] == part_list[k] for k in
+               range(len(part_list))):
+            continue
+        assert stepfg.self_intersections(
+            part_list) == brute_force_intersections(part_list), part_list
+
+
+def test_sweep_status_order():
+    rng = random.Random(1)
+    key_list = rng.sample(range(1000), 200)
+    status = stepfg.SweepStatus(lambda k1, k2: k1 < k2)
+    for key in key_list:
+        status.insert(key)
+    for key in key_list[::2]:
+        status.remove(key)
+    active_list = sorted(key_list[1::2])
+    for k, key in enumerate(active_list):
+        assert status.neighbours(key) == (
+            active_list[k - 1] if k else None,
+            active_list[k + 1] if k + 1 < len(active_list) else None)
+
+
+def test_validate_polygons_lists_every_defect():
+    with pytest.raises(stepfg.StepfgError) as err:
+        stepfg.validate_polygons([
+            [[0, 0], [4, 0], [4, 4], [2, 4], [2, -2], [1, -2], [1, 4],
+             [0, 4]], [[10, 0], [14, 0], [14, 4], [10, 4]],
+            [[12, 2], [16, 2], [16, 6], [12, 6]]])
+    message = str(err.value)
+    assert "Polygon 0: segment 0 intersects segment 3." in message
+    assert "Polygon 0: segment 0 intersects segment 5." in message
+    assert "Polygons 1 and 2 overlap" in message